@@ -0,0 +1,160 @@
+"""
+Benchmarks the label kernels against the frame-by-frame code they replaced.
+
+Each operation runs on a synthetic stack held in memory, so only the voxel
+work is measured and not the TIFF decoding or encoding:
+
+    relabel    old -> new value remap (every label + 1) with the change check
+    combine    three 0/255 masks merged into one label stack
+    binarize   a float32 probability map thresholded at 0.5
+
+"frames" is the previous implementation: one frame at a time, with a fancy
+index and np.array_equal for relabel, np.select over one boolean mask per
+input for combine and a boolean temporary cast with astype for binarize.
+"kernels" runs label_kernels through run_chunked with 1 and with --threads
+threads. Throughput (MB of input per second) and the peak memory allocated
+on top of the input (measured with tracemalloc) are printed:
+
+    python benchmarks/bench_kernels.py --shape 64x1024x1024 --label-dtype uint16
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import label_kernels  # noqa: E402
+from bench_operations import parse_shape  # noqa: E402
+from synthetic import SyntheticVolume  # noqa: E402
+
+
+class ArrayReader:
+    """Stack reader interface over an array in memory."""
+
+    chunk_frames = 1
+
+    def __init__(self, data):
+        self._data = data
+        self.num_frames = data.shape[0]
+        self.frame_shape = data.shape[1:]
+        self.dtype = data.dtype
+
+    def read_into(self, start, out):
+        np.copyto(out, self._data[start:start + len(out)])
+        return out
+
+    def iter_frames(self):
+        yield from self._data
+
+
+def relabel_frames(stack, mapping):
+    dtype = stack.dtype
+    lut = np.arange(np.iinfo(dtype).max + 1, dtype=np.int64)
+    for old_value, new_value in mapping.items():
+        lut[old_value] = new_value
+    lut = lut.astype(dtype)
+    changed = False
+    for frame_data in ArrayReader(stack).iter_frames():
+        new_frame = lut[frame_data]
+        changed = changed or not np.array_equal(new_frame, frame_data)
+    return changed
+
+
+def relabel_kernels(stack, mapping, threads):
+    remap = label_kernels.LabelLUT(mapping, stack.dtype)
+    changed = False
+
+    def relabel_chunk(chunks, out):
+        nonlocal changed
+        if not changed and remap.changes(chunks[0]):
+            changed = True
+        return remap(chunks[0], out=chunks[0])
+
+    label_kernels.run_chunked(relabel_chunk, [ArrayReader(stack)], None, threads=threads)
+    return changed
+
+
+def combine_frames(masks, label_values):
+    out_dtype = np.uint8 if max(label_values) <= 255 else np.uint16
+    for frames in zip(*(ArrayReader(mask).iter_frames() for mask in masks)):
+        conditions = [frame_data >= 255 for frame_data in frames]
+        np.select(conditions, label_values, default=0).astype(out_dtype)
+
+
+def combine_kernels(masks, label_values, threads):
+    out_dtype = label_kernels.label_dtype(label_values)
+
+    def merge_chunk(chunks, out):
+        return label_kernels.merge_masks(chunks, label_values, 255, out)
+
+    label_kernels.run_chunked(merge_chunk, [ArrayReader(mask) for mask in masks], None, out_dtype, threads=threads)
+
+
+def binarize_frames(probabilities):
+    for frame_data in ArrayReader(probabilities).iter_frames():
+        (frame_data >= 0.5).astype(np.uint8)
+
+
+def binarize_kernels(probabilities, threads):
+    def binarize_chunk(chunks, out):
+        return label_kernels.binarize(chunks[0], 0.5, out=out)
+
+    label_kernels.run_chunked(binarize_chunk, [ArrayReader(probabilities)], None, np.uint8, threads=threads)
+
+
+def measure(function, *args, repeat=3):
+    """Return the fastest wall time of `repeat` runs and the peak bytes allocated during one traced run."""
+    wall_seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        wall_seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(wall_seconds), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark label_kernels against frame-by-frame NumPy code.")
+    parser.add_argument("--shape", type=parse_shape, default=(64, 1024, 1024), metavar="FxHxW")
+    parser.add_argument("--label-dtype", default="uint8", choices=("uint8", "uint16"))
+    parser.add_argument("--threads", type=int, default=label_kernels.DEFAULT_THREADS,
+                        help="Threads of the parallel kernel runs.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest counts.")
+    args = parser.parse_args(argv)
+
+    volume = SyntheticVolume(*args.shape)
+    print(f"Generating {'x'.join(map(str, args.shape))} {args.label_dtype} data...", flush=True)
+    labels = np.stack([volume.label_frame(index, dtype=args.label_dtype) for index in range(volume.frames)])
+    masks = [np.stack([volume.mask_frame(index, label) for index in range(volume.frames)]) for label in (1, 2, 3)]
+    probabilities = np.stack([volume.image_frame(index, np.float32) for index in range(volume.frames)])
+    probabilities /= probabilities.max()
+    mapping = {value: value + 1 for value in range(1, 4)}
+
+    operations = [
+        ("relabel", labels.nbytes, relabel_frames, relabel_kernels, (labels, mapping)),
+        ("combine", sum(mask.nbytes for mask in masks), combine_frames, combine_kernels, (masks, [1, 2, 3])),
+        ("binarize", probabilities.nbytes, binarize_frames, binarize_kernels, (probabilities,)),
+    ]
+    thread_counts = sorted({1, args.threads})
+    print(f"{'operation':<10} {'variant':<12} {'time':>9} {'throughput':>12} {'peak memory':>12}")
+    for name, input_bytes, frames_function, kernel_function, arguments in operations:
+        runs = [("frames", frames_function, arguments)]
+        runs += [(f"kernels x{threads}", kernel_function, arguments + (threads,)) for threads in thread_counts]
+        baseline = None
+        for variant, function, function_args in runs:
+            wall_seconds, peak = measure(function, *function_args, repeat=args.repeat)
+            baseline = baseline or wall_seconds
+            print(f"{name:<10} {variant:<12} {wall_seconds:>8.3f}s {input_bytes / wall_seconds / 1e6:>8.0f} MB/s "
+                  f"{peak / 2**20:>8.1f} MiB  {baseline / wall_seconds:.2f}x", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
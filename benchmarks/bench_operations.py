@@ -0,0 +1,447 @@
+"""
+Benchmarks the TIFF operations of nnunet_tools on synthetic data.
+
+For every case (stack shape, label dtype and sparsity) a dataset is generated
+with synthetic.py: an intensity stack, a folder of label stacks and one binary
+mask per label. Each operation then runs --repeat times, every time in a fresh
+process so that its peak RSS is measured on its own:
+
+    cut            cut_tiff_into_parts, 2x2 parts of the intensity stack
+    tile           tile_tiff, 256 pixel tiles overlapping by 32 of the intensity stack
+    stitch         stitch_tiles on those tiles, Gaussian blending
+    recolor        relabel_tif_files on the label folder, every label + 1
+    combine        combine_labels on the masks
+    substacks      create_substacks, substacks of a quarter of the frames
+    region         read_block of a centered quarter-size region of every frame
+    unique-scan    scan_label_values on the label folder, cache removed
+    unique-cached  scan_label_values again with an up-to-date cache
+
+Wall time, peak RSS and throughput (MB of raw input per second) are printed
+and can be saved as JSON. --compare prints the change against an earlier
+result file and exits with 1 if an operation got slower than --tolerance:
+
+    python benchmarks/bench_operations.py --shape 64x1024x1024 --json before.json
+    python benchmarks/bench_operations.py --shape 64x1024x1024 --compare before.json
+
+--format zarr runs the same operations on Zarr stores instead of TIFF files
+(needs the zarr package; the label scan only reads TIFF and is skipped).
+Given both formats, the Zarr timings are also printed against the TIFF ones:
+
+    python benchmarks/bench_operations.py --format tiff --format zarr --zarr-chunks 8 256 256
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import tifffile as tiff
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import nnunet_tools  # noqa: E402
+from synthetic import SyntheticVolume, write_stack  # noqa: E402
+
+OPERATIONS = ("cut", "tile", "stitch", "recolor", "combine", "substacks", "region", "unique-scan", "unique-cached")
+FORMATS = ("tiff", "zarr")
+
+# Operations that only support TIFF files
+_TIFF_ONLY = ("unique-scan", "unique-cached")
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size in bytes, or None if it cannot be measured.
+
+    With the resource module this is the largest of this process and its
+    finished children (e.g. the relabel worker processes); on Windows psutil's
+    peak working set of this process is used if psutil is installed.
+    """
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in KiB except on macOS
+        return scale * max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+def generate_case(case_dir, frames, height, width, label_dtype="uint8", image_dtype="uint16",
+                  sparsity=0.95, num_labels=3, label_files=4, seed=0, storage="tiff", zarr_chunks=None):
+    """
+    Writes the synthetic input files of one benchmark case.
+
+    Args:
+        storage (str): "tiff" writes TIF files, "zarr" Zarr stores chunked as `zarr_chunks`.
+
+    Returns:
+        dict: Paths and sizes of the inputs, as passed to the operations.
+    """
+    os.makedirs(case_dir, exist_ok=True)
+    suffix = ".zarr" if storage == "zarr" else ".tif"
+    output_options = {"zarr": {"chunks": zarr_chunks}} if zarr_chunks else None
+    image_volume = SyntheticVolume(frames, height, width, seed=seed)
+    image_file = os.path.join(case_dir, "image" + suffix)
+    image_bytes = write_stack(image_file, image_volume, "image", output_options=output_options, dtype=image_dtype)
+
+    labels_dir = os.path.join(case_dir, "labels")
+    os.makedirs(labels_dir, exist_ok=True)
+    labels_bytes = 0
+    for index in range(label_files):
+        label_volume = SyntheticVolume(frames, height, width, seed=seed + 1 + index)
+        labels_bytes += write_stack(
+            os.path.join(labels_dir, f"case_{index:03d}{suffix}"), label_volume, "labels",
+            output_options=output_options, sparsity=sparsity, num_labels=num_labels, dtype=label_dtype,
+        )
+
+    mask_volume = SyntheticVolume(frames, height, width, seed=seed + 1)
+    masks = {}
+    for label in range(1, num_labels + 1):
+        mask_file = os.path.join(case_dir, f"mask_{label}{suffix}")
+        write_stack(mask_file, mask_volume, "mask", output_options=output_options, label=label, sparsity=sparsity,
+                    num_labels=num_labels)
+        masks[mask_file] = label
+
+    return {
+        "image_file": image_file, "image_bytes": image_bytes,
+        "labels_dir": labels_dir, "labels_bytes": labels_bytes,
+        "masks": masks, "masks_bytes": frames * height * width * len(masks),
+        "frames": frames, "height": height, "width": width, "num_labels": num_labels,
+        "suffix": suffix, "output_options": output_options,
+    }
+
+
+def _prepare(operation, data, work_dir):
+    """Resets the inputs an operation changes; returns (arguments, raw input bytes)."""
+    if operation == "cut":
+        shutil.rmtree(os.path.splitext(data["image_file"])[0], ignore_errors=True)
+        return {"input_file": data["image_file"]}, data["image_bytes"]
+    if operation in ("tile", "stitch"):
+        tiles_dir = os.path.join(work_dir, "tiles")
+        tile_size = min(256, data["height"], data["width"])
+        arguments = {"input_file": data["image_file"], "tiles_dir": tiles_dir, "tile_size": tile_size,
+                     "overlap": tile_size // 8, "output_file": os.path.join(work_dir, "stitched" + data["suffix"]),
+                     "output_options": data["output_options"]}
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+        if operation == "stitch":
+            with contextlib.redirect_stdout(io.StringIO()):
+                _run_operation("tile", arguments)
+        return arguments, data["image_bytes"]
+    if operation == "recolor":
+        folder = os.path.join(work_dir, "recolor")
+        shutil.rmtree(folder, ignore_errors=True)
+        shutil.copytree(data["labels_dir"], folder)
+        arguments = {"folder": folder, "num_labels": data["num_labels"], "output_options": data["output_options"]}
+        return arguments, data["labels_bytes"]
+    if operation == "combine":
+        arguments = {"masks": data["masks"], "output_file": os.path.join(work_dir, "combined" + data["suffix"]),
+                     "output_options": data["output_options"]}
+        return arguments, data["masks_bytes"]
+    if operation == "substacks":
+        output_dir = os.path.join(work_dir, "substacks")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.makedirs(output_dir)
+        size = max(1, data["frames"] // 4)
+        windows = nnunet_tools.substack_windows(0, data["frames"] - 1, size)
+        frame_bytes = data["image_bytes"] // data["frames"]
+        arguments = {"input_file": data["image_file"], "output_dir": output_dir, "frames": data["frames"], "size": size,
+                     "output_options": data["output_options"]}
+        return arguments, frame_bytes * sum(last - first + 1 for first, last in windows)
+    if operation == "region":
+        rows = slice(data["height"] * 3 // 8, data["height"] * 5 // 8)
+        cols = slice(data["width"] * 3 // 8, data["width"] * 5 // 8)
+        region_bytes = data["image_bytes"] * (rows.stop - rows.start) * (cols.stop - cols.start)
+        return {"input_file": data["image_file"], "rows": rows, "cols": cols}, region_bytes // (data["height"] * data["width"])
+    if operation in ("unique-scan", "unique-cached"):
+        cache = nnunet_tools.LabelStatsCache(data["labels_dir"])
+        if operation == "unique-scan":
+            if os.path.exists(cache.path):
+                os.remove(cache.path)
+        else:
+            cache.scan()
+        return {"folder": data["labels_dir"]}, data["labels_bytes"]
+    raise ValueError(f"Unknown operation {operation!r}")
+
+
+def _run_operation(operation, arguments):
+    output_options = arguments.get("output_options")
+    if operation == "cut":
+        nnunet_tools.cut_tiff_into_parts(arguments["input_file"], 1, 1, output_options=output_options)
+    elif operation == "tile":
+        nnunet_tools.tile_tiff(
+            arguments["input_file"], arguments["tile_size"], overlap=arguments["overlap"],
+            output_dir=arguments["tiles_dir"], output_options=output_options,
+        )
+    elif operation == "stitch":
+        nnunet_tools.stitch_tiles(arguments["tiles_dir"], arguments["output_file"], blend="gaussian",
+                                  output_options=output_options)
+    elif operation == "recolor":
+        filepaths = [os.path.join(arguments["folder"], fname) for fname in sorted(os.listdir(arguments["folder"]))]
+        mapping = {label: label + 1 for label in range(1, arguments["num_labels"] + 1)}
+        nnunet_tools.relabel_tif_files(filepaths, mapping, output_options=output_options)
+    elif operation == "combine":
+        nnunet_tools.combine_labels(arguments["masks"], arguments["output_file"], output_options=output_options)
+    elif operation == "substacks":
+        nnunet_tools.create_substacks(
+            arguments["input_file"], arguments["output_dir"], 0, arguments["frames"] - 1, arguments["size"],
+            output_options=output_options,
+        )
+    elif operation == "region":
+        with nnunet_tools.open_stack(arguments["input_file"]) as reader:
+            step = max(reader.chunk_frames, 8)
+            for start in range(0, reader.num_frames, step):
+                reader.read_block(start, start + step, arguments["rows"], arguments["cols"])
+    elif operation in ("unique-scan", "unique-cached"):
+        nnunet_tools.scan_label_values(arguments["folder"])
+
+
+def _child(operation, arguments, results):
+    """Entry point of the measuring process: runs one operation and reports its timings."""
+    try:
+        baseline_rss = peak_rss()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start_time = time.perf_counter()
+            _run_operation(operation, arguments)
+            wall_seconds = time.perf_counter() - start_time
+        results.put({"wall_seconds": wall_seconds, "peak_rss_bytes": peak_rss(), "baseline_rss_bytes": baseline_rss})
+    except BaseException as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure(operation, arguments):
+    """
+    Runs one operation in a fresh process.
+
+    Returns:
+        dict: wall_seconds, peak_rss_bytes and baseline_rss_bytes (the peak
+        RSS before the operation started, i.e. the interpreter and imports).
+
+    Raises:
+        RuntimeError: If the operation fails or its process dies.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child, args=(operation, arguments, results))
+    process.start()
+    try:
+        while True:
+            try:
+                result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"{operation}: process exited with code {process.exitcode}")
+    finally:
+        process.join()
+    if "error" in result:
+        raise RuntimeError(f"{operation}: {result['error']}")
+    return result
+
+
+def parse_shape(text):
+    """Parse FRAMESxHEIGHTxWIDTH."""
+    try:
+        frames, height, width = (int(value) for value in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected FRAMESxHEIGHTxWIDTH, got {text!r}")
+    if min(frames, height, width) <= 0 or height % 2 or width % 2:
+        raise argparse.ArgumentTypeError(f"{text}: sizes must be positive and height and width even")
+    return frames, height, width
+
+
+def environment():
+    """Describe the machine and software versions the results were measured with."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "tifffile": tiff.__version__,
+    }
+
+
+def run(cases, operations=OPERATIONS, repeat=3, work_dir=None, **generate_options):
+    """
+    Generates every case and measures every operation on it.
+
+    Args:
+        cases (list): (frames, height, width, label_dtype, sparsity, storage) tuples.
+        operations (iterable): Names from OPERATIONS.
+        repeat (int): Runs per operation; the fastest wall time is reported.
+        work_dir (str, optional): Where the data is generated; a temporary folder by default.
+        **generate_options: Passed to generate_case.
+
+    Returns:
+        list: One result dict per case and operation.
+    """
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="bench_operations_")
+    results = []
+    try:
+        for frames, height, width, label_dtype, sparsity, storage in cases:
+            case = f"{frames}x{height}x{width}-{label_dtype}-sparsity{sparsity:g}"
+            if storage != "tiff":
+                case += f"-{storage}"
+            case_dir = os.path.join(work_dir, case)
+            print(f"Generating {case}...", flush=True)
+            data = generate_case(case_dir, frames, height, width, label_dtype=label_dtype, sparsity=sparsity,
+                                 storage=storage, **generate_options)
+            for operation in operations:
+                if storage != "tiff" and operation in _TIFF_ONLY:
+                    continue
+                runs = []
+                for _ in range(repeat):
+                    arguments, input_bytes = _prepare(operation, data, case_dir)
+                    runs.append(measure(operation, arguments))
+                wall_times = [timing["wall_seconds"] for timing in runs]
+                peak_rss_values = [timing["peak_rss_bytes"] for timing in runs if timing["peak_rss_bytes"]]
+                result = {
+                    "case": case, "operation": operation, "storage": storage,
+                    "frames": frames, "height": height, "width": width,
+                    "label_dtype": label_dtype, "sparsity": sparsity,
+                    "input_bytes": input_bytes,
+                    "wall_seconds": min(wall_times), "wall_seconds_all": wall_times,
+                    "mb_per_s": input_bytes / 1e6 / min(wall_times),
+                    "peak_rss_bytes": max(peak_rss_values) if peak_rss_values else None,
+                    "baseline_rss_bytes": runs[0]["baseline_rss_bytes"],
+                }
+                results.append(result)
+                print(f"  {operation:<14}{result['wall_seconds']:>9.3f} s{result['mb_per_s']:>10.0f} MB/s"
+                      f"{_format_bytes(result['peak_rss_bytes']):>12} peak RSS", flush=True)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def _format_bytes(value):
+    return "n/a" if value is None else f"{value / 2**20:.0f} MiB"
+
+
+def compare(results, baseline, tolerance=0.15):
+    """
+    Prints the change in wall time against an earlier run.
+
+    Args:
+        results (list): Results of this run.
+        baseline (dict): Content of an earlier JSON result file.
+        tolerance (float): Relative slowdown above which an operation counts as a regression.
+
+    Returns:
+        int: Number of regressions.
+    """
+    previous = {(result["case"], result["operation"]): result for result in baseline.get("results", [])}
+    print(f"\nCompared with {baseline.get('environment', {}).get('commit') or 'baseline'}:")
+    regressions = 0
+    for result in results:
+        old = previous.get((result["case"], result["operation"]))
+        if old is None:
+            continue
+        change = result["wall_seconds"] / old["wall_seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"  {result['case']:<36}{result['operation']:<14}{old['wall_seconds']:>9.3f} s ->"
+              f"{result['wall_seconds']:>9.3f} s{change:>+8.0%}{flag}")
+    return regressions
+
+
+def compare_formats(results):
+    """Prints the wall time of every operation on Zarr stores against the same operation on TIFF files."""
+    tiff_results = {(result["case"], result["operation"]): result for result in results
+                    if result.get("storage", "tiff") == "tiff"}
+    lines = []
+    for result in results:
+        if result.get("storage", "tiff") == "tiff":
+            continue
+        tiff_case = result["case"][:-len(result["storage"]) - 1]
+        old = tiff_results.get((tiff_case, result["operation"]))
+        if old is not None:
+            lines.append(f"  {tiff_case:<36}{result['operation']:<14}{old['wall_seconds']:>9.3f} s ->"
+                         f"{result['wall_seconds']:>9.3f} s{old['wall_seconds'] / result['wall_seconds']:>7.2f}x")
+    if lines:
+        print("\nZarr against TIFF (speedup):")
+        print("\n".join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nnunet_tools TIFF operations on synthetic data.")
+    parser.add_argument("--shape", type=parse_shape, action="append", default=None, metavar="FxHxW",
+                        help="Stack shape; repeat for several (default: 64x1024x1024).")
+    parser.add_argument("--label-dtype", action="append", default=None, choices=("uint8", "uint16"),
+                        help="Label dtype; repeat for several (default: uint8).")
+    parser.add_argument("--sparsity", type=float, action="append", default=None,
+                        help="Background fraction of the labels; repeat for several (default: 0.95).")
+    parser.add_argument("--image-dtype", default="uint16", choices=("uint8", "uint16", "float32"))
+    parser.add_argument("--num-labels", type=int, default=3)
+    parser.add_argument("--label-files", type=int, default=4, help="Label stacks in the recolor/scan folder.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--operation", dest="operations", action="append", choices=OPERATIONS, default=None,
+                        help="Operation to run; repeat for several (default: all).")
+    parser.add_argument("--format", dest="formats", action="append", choices=FORMATS, default=None,
+                        help="Storage of the inputs and outputs; repeat for several (default: tiff).")
+    parser.add_argument("--zarr-chunks", type=int, nargs=3, default=None, metavar=("FRAMES", "ROWS", "COLUMNS"),
+                        help="Chunk size of the Zarr stores.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per operation; the fastest counts.")
+    parser.add_argument("--work-dir", default=None, help="Generate the data here instead of a temporary folder.")
+    parser.add_argument("--json", dest="json_file", default=None, help="Save the results as JSON.")
+    parser.add_argument("--compare", default=None, metavar="JSON", help="Earlier result file to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Slowdown counted as a regression.")
+    args = parser.parse_args(argv)
+
+    cases = [
+        shape + (label_dtype, sparsity, storage)
+        for shape in args.shape or [(64, 1024, 1024)]
+        for label_dtype in args.label_dtype or ["uint8"]
+        for sparsity in args.sparsity or [0.95]
+        for storage in args.formats or ["tiff"]
+    ]
+    results = run(
+        cases, args.operations or OPERATIONS, args.repeat, args.work_dir,
+        image_dtype=args.image_dtype, num_labels=args.num_labels, label_files=args.label_files, seed=args.seed,
+        zarr_chunks=args.zarr_chunks,
+    )
+    compare_formats(results)
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Results saved to {args.json_file}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Compares the TIFF output formats of nnunet_tools on representative stacks.
+
+Two synthetic stacks (see synthetic.py) are written with each TiffOutputOptions variant:
+
+    labels  uint8, three labels, 97% background
+    image   uint16, smooth intensities plus noise
+
+and for each the write time, the time to read every frame back and the file
+size are reported. Usage:
+
+    python benchmarks/bench_tiff_output.py --frames 64 --size 1024 --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+from synthetic import SyntheticVolume  # noqa: E402
+
+VARIANTS = {
+    "none": {},
+    "none-tiled": {"tile": 256},
+    "lzw": {"compression": "lzw"},
+    "zlib-1": {"compression": "zlib", "level": 1},
+    "zlib-6": {"compression": "zlib", "level": 6},
+    "zlib-6-predictor": {"compression": "zlib", "level": 6, "predictor": True},
+    "zstd-3": {"compression": "zstd", "level": 3},
+    "zstd-3-tiled": {"compression": "zstd", "level": 3, "tile": 256},
+    "zstd-3-tiled-4threads": {"compression": "zstd", "level": 3, "tile": 256, "threads": 4},
+}
+
+
+def measure(stack, path, options):
+    """Write and read back one stack; returns write seconds, read seconds and bytes on disk."""
+    start_time = time.perf_counter()
+    with options.open(path, stack.nbytes) as writer:
+        for frame in stack:
+            writer.write(frame)
+    write_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with nnunet_tools.TiffStackReader(path) as reader:
+        for frame_index, frame in enumerate(reader.iter_frames()):
+            if not np.array_equal(frame, stack[frame_index]):
+                raise RuntimeError(f"{path}: frame {frame_index} does not round-trip")
+    read_seconds = time.perf_counter() - start_time
+    return write_seconds, read_seconds, os.path.getsize(path)
+
+
+def run(frames, size, repeat=1, work_dir=None):
+    """
+    Runs every variant on both stacks.
+
+    Args:
+        frames (int): Frames per stack.
+        size (int): Height and width of each frame.
+        repeat (int): Repetitions per variant; the fastest is kept.
+        work_dir (str, optional): Where the files are written; a temporary folder by default.
+
+    Returns:
+        list: One result dict per stack and variant.
+    """
+    volume = SyntheticVolume(frames, size, size)
+    stacks = {"labels": volume.label_stack(sparsity=0.97), "image": volume.image_stack(dtype=np.uint16)}
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="bench_tiff_output_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        for stack_name, stack in stacks.items():
+            for variant, kwargs in VARIANTS.items():
+                options = nnunet_tools.TiffOutputOptions(**kwargs)
+                path = os.path.join(work_dir, f"{stack_name}_{variant}.tif")
+                runs = [measure(stack, path, options) for _ in range(repeat)]
+                write_seconds = min(timing[0] for timing in runs)
+                read_seconds = min(timing[1] for timing in runs)
+                size_bytes = runs[-1][2]
+                results.append({
+                    "stack": stack_name, "variant": variant, "options": kwargs,
+                    "raw_bytes": stack.nbytes, "file_bytes": size_bytes,
+                    "ratio": stack.nbytes / size_bytes,
+                    "write_seconds": write_seconds, "read_seconds": read_seconds,
+                    "write_mb_per_s": stack.nbytes / 1e6 / write_seconds,
+                    "read_mb_per_s": stack.nbytes / 1e6 / read_seconds,
+                })
+                os.remove(path)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def print_table(results):
+    print(f"{'stack':<8}{'variant':<24}{'size MB':>10}{'ratio':>8}{'write MB/s':>12}{'read MB/s':>11}")
+    for result in results:
+        print(f"{result['stack']:<8}{result['variant']:<24}{result['file_bytes'] / 1e6:>10.2f}"
+              f"{result['ratio']:>8.1f}{result['write_mb_per_s']:>12.0f}{result['read_mb_per_s']:>11.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TIFF output compression, tiling and threading.")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--size", type=int, default=1024, help="Frame height and width in pixels.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant; the fastest counts.")
+    parser.add_argument("--work-dir", default=None, help="Write the files here instead of a temporary folder.")
+    parser.add_argument("--json", dest="json_file", default=None, help="Also save the results as JSON.")
+    args = parser.parse_args(argv)
+
+    results = run(args.frames, args.size, args.repeat, args.work_dir)
+    print_table(results)
+    if args.json_file:
+        with open(args.json_file, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic image and label stacks for the benchmarks.
+
+A SyntheticVolume is a smooth random 3D field defined by a coarse grid of
+random values that is linearly interpolated to full resolution. Every frame
+is computed on its own from the seed and its index, so arbitrarily large
+stacks can be generated one frame at a time and the same arguments always
+give the same voxels on every machine.
+
+From the field:
+
+    image_frame   intensity frame (field plus Gaussian noise) in any dtype
+    label_frame   labels 1..num_labels in the voxels above a per-frame
+                  quantile of the field, so `sparsity` is the exact
+                  background fraction
+    mask_frame    one label of label_frame as a 0/255 binary mask
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+
+
+def _interpolation_matrix(size, coarse_size, feature_size):
+    """(size, coarse_size) matrix that linearly interpolates a coarse axis to `size` samples."""
+    positions = np.arange(size) / feature_size
+    identity = np.eye(coarse_size, dtype=np.float32)
+    return np.stack([np.interp(positions, np.arange(coarse_size), row) for row in identity], axis=1).astype(np.float32)
+
+
+class SyntheticVolume:
+    """
+    A smooth random volume from which image, label and mask frames are derived.
+
+    Args:
+        frames (int): Number of frames.
+        height (int): Frame height in pixels.
+        width (int): Frame width in pixels.
+        seed (int): Seed of all random values.
+        feature_size (int): Approximate size of structures in pixels within a
+            frame; along z they are a quarter as deep, like anisotropic EM data.
+    """
+
+    def __init__(self, frames, height, width, seed=0, feature_size=32):
+        self.frames = frames
+        self.height = height
+        self.width = width
+        self.seed = seed
+        self.feature_size = feature_size
+        self._z_feature_size = max(1, feature_size // 4)
+
+        rng = np.random.default_rng(seed)
+        coarse_shape = (
+            frames // self._z_feature_size + 2, height // feature_size + 2, width // feature_size + 2,
+        )
+        self._coarse = rng.random(coarse_shape, dtype=np.float32)
+        # Label classes are constant over coarse cells, so neighbouring objects get different labels
+        self._classes = rng.integers(0, 2**16, size=coarse_shape[1:], dtype=np.int64)
+        self._rows = _interpolation_matrix(height, coarse_shape[1], feature_size)
+        self._columns = _interpolation_matrix(width, coarse_shape[2], feature_size)
+
+    @property
+    def shape(self):
+        return (self.frames, self.height, self.width)
+
+    def field(self, index):
+        """Return frame `index` of the smooth field as float32 values in [0, 1]."""
+        z = index / self._z_feature_size
+        lower = int(z)
+        fraction = np.float32(z - lower)
+        plane = (1 - fraction) * self._coarse[lower] + fraction * self._coarse[lower + 1]
+        return self._rows @ plane @ self._columns.T
+
+    def image_frame(self, index, dtype=np.uint16, noise=0.05):
+        """
+        Returns an intensity frame.
+
+        Args:
+            index (int): Frame index.
+            dtype: Output dtype; integers use their full range, floats [0, 1].
+            noise (float): Standard deviation of the Gaussian noise relative to the range.
+        """
+        dtype = np.dtype(dtype)
+        rng = np.random.default_rng((self.seed, index))
+        values = self.field(index) + rng.normal(0, noise, (self.height, self.width)).astype(np.float32)
+        values = np.clip(values, 0, 1)
+        if dtype.kind == "f":
+            return values.astype(dtype)
+        return (values * np.iinfo(dtype).max).astype(dtype)
+
+    def label_frame(self, index, sparsity=0.95, num_labels=3, dtype=np.uint8):
+        """
+        Returns a label frame.
+
+        Args:
+            index (int): Frame index.
+            sparsity (float): Fraction of background (0) voxels, from 0 to 1.
+            num_labels (int): Foreground voxels get labels 1..num_labels.
+            dtype: Output dtype.
+        """
+        if not 0 <= sparsity <= 1:
+            raise ValueError("Sparsity must be between 0 and 1.")
+        if num_labels >= np.iinfo(dtype).max + 1:
+            raise ValueError(f"{num_labels} labels do not fit into {np.dtype(dtype)}.")
+        field = self.field(index)
+        frame = np.zeros((self.height, self.width), dtype=dtype)
+        foreground_count = int(round((1 - sparsity) * field.size))
+        if foreground_count == 0:
+            return frame
+        threshold = np.partition(field.ravel(), field.size - foreground_count)[field.size - foreground_count]
+        foreground = field >= threshold
+        cells = self._classes[
+            np.minimum(np.arange(self.height) // self.feature_size, self._classes.shape[0] - 1)[:, None],
+            np.minimum(np.arange(self.width) // self.feature_size, self._classes.shape[1] - 1)[None, :],
+        ]
+        frame[foreground] = (cells[foreground] % num_labels + 1).astype(dtype)
+        return frame
+
+    def mask_frame(self, index, label, sparsity=0.95, num_labels=3):
+        """Return label `label` of label_frame() as a uint8 0/255 mask."""
+        return (self.label_frame(index, sparsity, num_labels) == label).astype(np.uint8) * 255
+
+    def image_stack(self, **kwargs):
+        """Return the whole volume as intensity frames; see image_frame for the arguments."""
+        return np.stack([self.image_frame(index, **kwargs) for index in range(self.frames)])
+
+    def label_stack(self, **kwargs):
+        """Return the whole volume as label frames; see label_frame for the arguments."""
+        return np.stack([self.label_frame(index, **kwargs) for index in range(self.frames)])
+
+
+def write_stack(path, volume, kind="labels", output_options=None, **kwargs):
+    """
+    Writes a SyntheticVolume to a multi-page TIFF one frame at a time.
+
+    Args:
+        path (str): Output file; a `.zarr` path writes a Zarr store.
+        volume (SyntheticVolume): Volume to write.
+        kind (str): "image", "labels" or "mask".
+        output_options (TiffOutputOptions, optional): Encoding; uncompressed by default.
+        **kwargs: Passed to the frame method, e.g. dtype or sparsity.
+
+    Returns:
+        int: Number of raw (uncompressed) bytes written.
+    """
+    frame_functions = {"image": volume.image_frame, "labels": volume.label_frame, "mask": volume.mask_frame}
+    if kind not in frame_functions:
+        raise ValueError(f"Unknown kind {kind!r}; expected one of {', '.join(frame_functions)}.")
+    frame_function = frame_functions[kind]
+    output_options = nnunet_tools.TiffOutputOptions.from_dict(output_options)
+
+    first = frame_function(0, **kwargs)
+    raw_bytes = first.nbytes * volume.frames
+    with nnunet_tools.open_stack_writer(path, (volume.frames,) + first.shape, first.dtype, output_options) as writer:
+        writer.write(first)
+        for index in range(1, volume.frames):
+            writer.write(frame_function(index, **kwargs))
+    return raw_bytes
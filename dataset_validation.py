@@ -0,0 +1,381 @@
+"""
+Pre-flight checks of an nnUNet raw dataset.
+
+nnUNetv2_plan_and_preprocess --verify_dataset_integrity only reports a missing
+image/label pair, a shape mismatch or a stray label value after it has started
+working through the dataset. validate_dataset finds the same problems up front:
+
+- every image has a _XXXX channel suffix and every case has the same channels
+- every label has its images and every image its label
+- every file has the spacing JSON the nnUNet TIFF reader needs, and the
+  spacings of a case's images and label agree
+- image and label shapes match, taken from the metadata index written during
+  import or read from the TIFF headers without decoding pixels
+- label values are integers, consecutive and (if there is a dataset.json) the declared ones
+
+The label census is gathered in worker processes and stored in the label stats
+cache of labelsTr, so generating dataset.json from it afterwards is instant.
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tifffile as tiff
+
+import nnunet_tools
+import tiff_metadata
+import tracing
+
+_CHANNEL_SUFFIX = re.compile(r"^(?P<case>.+)_(?P<channel>\d{4})$")
+
+# Files listed per problem before the rest are summarized
+MAX_FILES_LISTED = 5
+
+
+def read_header(filepath):
+    """
+    Reads the shape and dtype of a TIFF's first series from its header.
+
+    Args:
+        filepath (str): Path to the TIFF file.
+
+    Returns:
+        dict: {"shape": tuple, "dtype": str}.
+    """
+    with tiff.TiffFile(filepath) as tif:
+        series = tif.series[0]
+        return {"shape": tuple(int(size) for size in series.shape), "dtype": str(series.dtype)}
+
+
+def _list_files(folder, file_ending):
+    if not os.path.isdir(folder):
+        return None
+    return sorted(fname for fname in os.listdir(folder)
+                  if fname.endswith(file_ending) and os.path.isfile(os.path.join(folder, fname)))
+
+
+def _summarize(names):
+    names = sorted(names)
+    listed = ", ".join(names[:MAX_FILES_LISTED])
+    if len(names) > MAX_FILES_LISTED:
+        listed += f" and {len(names) - MAX_FILES_LISTED} more"
+    return listed
+
+
+class ValidationReport:
+    """
+    Result of validate_dataset.
+
+    Args:
+        dataset_dir (str): The validated dataset folder.
+    """
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        self.errors = []
+        self.warnings = []
+        self.num_cases = 0
+        self.num_channels = 0
+        self.num_files = 0
+        self.label_counts = {}  # Label value -> voxels over all label files
+        self.label_files = {}  # Label value -> number of label files containing it
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        """True if nothing was found that makes nnUNet's integrity check fail."""
+        return not self.errors
+
+    @property
+    def labels(self):
+        """Sorted label values found in labelsTr, including background."""
+        return sorted(self.label_counts)
+
+    def dataset_labels(self, names=None):
+        """
+        Returns the labels entry of dataset.json for the label census.
+
+        Args:
+            names (dict, optional): Label value -> name. Values without a
+                name are called label_<value>; 0 is always "background".
+
+        Returns:
+            dict: Label name -> value.
+        """
+        names = names or {}
+        labels = {"background": 0}
+        for value in self.labels:
+            if value != 0:
+                labels[names.get(value) or f"label_{value}"] = int(value)
+        return labels
+
+    def to_dict(self):
+        return {
+            "dataset_dir": self.dataset_dir,
+            "ok": self.ok,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "num_cases": self.num_cases,
+            "num_channels": self.num_channels,
+            "num_files": self.num_files,
+            "label_counts": {str(value): count for value, count in sorted(self.label_counts.items())},
+            "label_files": {str(value): count for value, count in sorted(self.label_files.items())},
+            "seconds": self.seconds,
+        }
+
+    def save(self, path):
+        """Write the report as JSON."""
+        with open(path, "w") as json_file:
+            json.dump(self.to_dict(), json_file, indent=4)
+
+    def format(self):
+        """Return the report as readable text."""
+        lines = [
+            f"{os.path.basename(os.path.normpath(self.dataset_dir))}: {self.num_cases} cases, "
+            f"{self.num_channels} channel(s), labels {' '.join(map(str, self.labels)) or 'none'} "
+            f"({self.num_files} files checked in {self.seconds:.1f} s)"
+        ]
+        for title, messages in (("Errors", self.errors), ("Warnings", self.warnings)):
+            if messages:
+                lines.append(f"{title} ({len(messages)}):")
+                lines.extend(f"  {message}" for message in messages)
+        if self.label_counts:
+            lines.append("Label census:")
+            for value in self.labels:
+                lines.append(f"  {value:>5}  {self.label_counts[value]:>15,} voxels in {self.label_files[value]} file(s)")
+        return "\n".join(lines)
+
+
+def _split_channel(fname, file_ending):
+    """Return (case, channel) of an image file name, or None if it has no _XXXX suffix."""
+    match = _CHANNEL_SUFFIX.match(fname[:-len(file_ending)])
+    return (match.group("case"), int(match.group("channel"))) if match else None
+
+
+def _spacing_json(folder, fname, file_ending, case=None):
+    """nnUNet's TIFF reader takes the spacing from <file>.json or, for images, <case>.json; return its path or None."""
+    candidates = [fname[:-len(file_ending)] + ".json"]
+    if case is not None:
+        candidates.append(case + ".json")
+    for candidate in candidates:
+        path = os.path.join(folder, candidate)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _spacing(json_path):
+    sidecar = tiff_metadata.read_sidecar(json_path) if json_path else None
+    spacing = sidecar.get("spacing") if isinstance(sidecar, dict) else None
+    return [float(value) for value in spacing] if isinstance(spacing, list) else None
+
+
+@tracing.traced("validate", file="dataset_dir")
+def validate_dataset(dataset_dir, max_workers=None, header_workers=16, progress=None):
+    """
+    Checks an nnUNet raw dataset before planning and preprocessing.
+
+    Shapes come from the dataset's MetadataIndex for files unchanged since
+    import and from the TIFF headers otherwise; label files are decoded
+    frame by frame in `max_workers` processes for the label census, and
+    unchanged files are taken from the label stats cache of labelsTr.
+
+    Args:
+        dataset_dir (str): Dataset folder in nnUNet_raw, e.g. .../Dataset001_Name.
+        max_workers (int, optional): Worker processes for the label census.
+            Defaults to the number of CPUs.
+        header_workers (int): Threads reading TIFF headers.
+        progress (callable, optional): Called as progress(files_done, num_files, bytes_read)
+            while headers are read and labels are counted.
+
+    Returns:
+        ValidationReport: The problems found and the label census.
+    """
+    start_time = time.perf_counter()
+    report = ValidationReport(dataset_dir)
+    images_dir = os.path.join(dataset_dir, "imagesTr")
+    labels_dir = os.path.join(dataset_dir, "labelsTr")
+
+    # dataset.json, if it was already written, declares the file ending, channels and labels
+    dataset_json = {}
+    dataset_json_path = os.path.join(dataset_dir, "dataset.json")
+    if os.path.isfile(dataset_json_path):
+        try:
+            with open(dataset_json_path, "r") as json_file:
+                dataset_json = json.load(json_file)
+        except (OSError, ValueError) as e:
+            report.errors.append(f"dataset.json cannot be read: {e}")
+    file_ending = dataset_json.get("file_ending", ".tif")
+
+    image_files = _list_files(images_dir, file_ending)
+    label_files = _list_files(labels_dir, file_ending)
+    if image_files is None or label_files is None:
+        report.errors.append(f"{dataset_dir} needs an imagesTr and a labelsTr folder.")
+        report.seconds = time.perf_counter() - start_time
+        return report
+
+    # Cases and channels from the image file names
+    cases = {}
+    for fname in image_files:
+        case_channel = _split_channel(fname, file_ending)
+        if case_channel is None:
+            report.errors.append(f"imagesTr/{fname}: missing the _0000 channel suffix.")
+            continue
+        case, channel = case_channel
+        cases.setdefault(case, {})[channel] = fname
+
+    channel_names = dataset_json.get("channel_names")
+    num_channels = len(channel_names) if channel_names else max((len(channels) for channels in cases.values()), default=0)
+    report.num_channels = num_channels
+    for case, channels in sorted(cases.items()):
+        if sorted(channels) != list(range(num_channels)):
+            found = ", ".join(f"_{channel:04d}" for channel in sorted(channels))
+            report.errors.append(f"imagesTr/{case}: has channels {found}, expected _0000 to _{num_channels - 1:04d}.")
+
+    # Pairing of images and labels
+    label_cases = {fname[:-len(file_ending)]: fname for fname in label_files}
+    for case in sorted(set(cases) - set(label_cases)):
+        report.errors.append(f"imagesTr/{case}: no label {case}{file_ending} in labelsTr.")
+    for case in sorted(set(label_cases) - set(cases)):
+        report.errors.append(f"labelsTr/{label_cases[case]}: no image in imagesTr.")
+    report.num_cases = len(set(cases) & set(label_cases))
+    if "numTraining" in dataset_json and dataset_json["numTraining"] != len(label_cases):
+        report.errors.append(
+            f"dataset.json has numTraining {dataset_json['numTraining']}, but labelsTr has {len(label_cases)} cases."
+        )
+
+    # The nnUNet TIFF reader needs a spacing file next to every file
+    if file_ending in (".tif", ".tiff"):
+        missing = [f"imagesTr/{fname}" for case, channels in cases.items() for fname in channels.values()
+                   if _spacing_json(images_dir, fname, file_ending, case) is None]
+        missing += [f"labelsTr/{fname}" for fname in label_files if _spacing_json(labels_dir, fname, file_ending) is None]
+        if missing:
+            report.errors.append(f"No spacing .json for {len(missing)} file(s): {_summarize(missing)}.")
+
+        # nnUNet rejects cases whose image and label spacings differ
+        for case, label_fname in sorted(label_cases.items()):
+            label_spacing = _spacing(_spacing_json(labels_dir, label_fname, file_ending))
+            for image_fname in cases.get(case, {}).values():
+                image_spacing = _spacing(_spacing_json(images_dir, image_fname, file_ending, case))
+                if label_spacing and image_spacing and (
+                        len(label_spacing) != len(image_spacing)
+                        or any(abs(a - b) > 1e-6 * max(abs(a), abs(b)) for a, b in zip(label_spacing, image_spacing))):
+                    report.errors.append(
+                        f"{case}: image {image_fname} has spacing {image_spacing}, label has {label_spacing}."
+                    )
+
+    # Shapes and dtypes from the headers
+    paths = [os.path.join(images_dir, fname) for fname in image_files]
+    paths += [os.path.join(labels_dir, fname) for fname in label_files]
+    num_files = len(paths) + len(label_files)  # Headers, then the label census
+    report.num_files = len(paths)
+    headers = {}
+    bytes_read = 0
+    index = tiff_metadata.MetadataIndex(dataset_dir)
+    for path in paths:
+        metadata = index.get(path)
+        if metadata is not None:
+            headers[path] = {"shape": tuple(metadata["shape"]), "dtype": metadata["dtype"]}
+    unindexed = [path for path in paths if path not in headers]
+    if progress and headers:
+        progress(len(headers), num_files, 0)
+    with ThreadPoolExecutor(max_workers=header_workers) as pool:
+        for files_done, (path, header) in enumerate(zip(unindexed, pool.map(_safe_read_header, unindexed)),
+                                                    start=len(headers) + 1):
+            if isinstance(header, Exception):
+                report.errors.append(f"{os.path.relpath(path, dataset_dir)}: cannot be read ({header}).")
+            else:
+                headers[path] = header
+            if progress:
+                bytes_read += os.path.getsize(path)
+                progress(files_done, num_files, bytes_read)
+
+    for case, label_fname in sorted(label_cases.items()):
+        label_header = headers.get(os.path.join(labels_dir, label_fname))
+        if label_header is None:
+            continue
+        if len(label_header["shape"]) != 3:
+            report.errors.append(f"labelsTr/{label_fname}: shape {label_header['shape']} is not a 3D stack.")
+        if label_header["dtype"].startswith("float"):
+            report.warnings.append(f"labelsTr/{label_fname}: labels are stored as {label_header['dtype']}.")
+        for image_fname in cases.get(case, {}).values():
+            image_header = headers.get(os.path.join(images_dir, image_fname))
+            if image_header is not None and image_header["shape"] != label_header["shape"]:
+                report.errors.append(
+                    f"{case}: image {image_fname} has shape {image_header['shape']}, "
+                    f"label has {label_header['shape']}."
+                )
+
+    def census_progress(files_done, _, census_bytes):
+        if progress:
+            progress(len(paths) + files_done, num_files, bytes_read + census_bytes)
+
+    _label_census(report, labels_dir, label_files, dataset_json.get("labels"), max_workers, census_progress)
+    if progress:
+        progress(num_files, num_files, bytes_read)
+
+    # Test images only need to be readable by nnUNetv2_predict later
+    test_files = _list_files(os.path.join(dataset_dir, "imagesTs"), file_ending) or []
+    unsuffixed = [fname for fname in test_files if _split_channel(fname, file_ending) is None]
+    if unsuffixed:
+        report.warnings.append(f"imagesTs: {len(unsuffixed)} file(s) without channel suffix: {_summarize(unsuffixed)}.")
+
+    report.seconds = time.perf_counter() - start_time
+    return report
+
+
+def _safe_read_header(path):
+    try:
+        return read_header(path)
+    except Exception as e:
+        return e
+
+
+def _label_census(report, labels_dir, label_files, declared_labels, max_workers, progress):
+    """Counts the label values of labelsTr and checks them against nnUNet's rules."""
+    if not label_files:
+        return
+    if not label_files[0].endswith(".tif"):
+        report.warnings.append("Label census skipped: the label stats cache only reads .tif files.")
+        return
+    try:
+        stats = nnunet_tools.LabelStatsCache(labels_dir).scan(max_workers=max_workers, progress=progress)
+    except Exception as e:
+        report.errors.append(f"labelsTr: label census failed ({e}).")
+        return
+
+    files_with_value = {}
+    for fname in label_files:
+        counts = stats.get(fname, {})
+        for value, count in counts.items():
+            report.label_counts[value] = report.label_counts.get(value, 0) + count
+            files_with_value.setdefault(value, []).append(fname)
+        if counts and set(counts) <= {0}:
+            report.warnings.append(f"labelsTr/{fname}: contains only background.")
+    report.label_files = {value: len(fnames) for value, fnames in files_with_value.items()}
+
+    values = sorted(report.label_counts)
+    non_integer = [value for value in values if not float(value).is_integer() or value < 0]
+    for value in non_integer:
+        report.errors.append(f"Label value {value} is not a non-negative integer: {_summarize(files_with_value[value])}.")
+
+    if declared_labels:
+        declared = {int(value) for value in declared_labels.values() if not isinstance(value, (list, tuple))}
+        declared |= {int(v) for value in declared_labels.values() if isinstance(value, (list, tuple)) for v in value}
+        for value in values:
+            if value not in declared and value not in non_integer:
+                report.errors.append(
+                    f"Label value {value} is not declared in dataset.json: {_summarize(files_with_value[value])}."
+                )
+        for value in sorted(declared - set(values)):
+            report.warnings.append(f"Label value {value} is declared in dataset.json but never used.")
+    else:
+        integers = [int(value) for value in values if value not in non_integer]
+        missing = sorted(set(range(max(integers) + 1)) - set(integers)) if integers else []
+        if missing:
+            report.errors.append(
+                f"Label values must be consecutive from 0; missing {', '.join(map(str, missing))} "
+                f"(use the color change tool to renumber)."
+            )
@@ -0,0 +1,351 @@
+"""
+Vectorized per-voxel label operations, applied chunk by chunk.
+
+The kernels here work on a chunk of frames at a time. They write into a
+preallocated output or into the chunk itself, so they create neither
+full-volume temporaries nor one temporary per input. Inside a chunk they go
+through slabs of SLAB_VOXELS voxels, so their buffers stay in the CPU cache:
+
+- LabelLUT: old -> new value remapping through a lookup table
+- merge_masks: binary masks merged into one label image by priority
+- threshold: foreground mask of a chunk
+- binarize: foreground written as a single label value
+
+Output dtypes are never guessed silently: the kernels keep the input dtype
+or use the one passed in, and they raise if a label value does not fit in
+it. label_dtype picks the smallest dtype that holds a set of values.
+
+run_chunked streams stacks through a kernel. The calling thread reads chunks
+into reused buffers (see read_into of the stack readers) and writes the
+results in order, while the kernels run on a thread pool.
+NumPy releases the GIL inside these loops, so the threads run in parallel.
+"""
+import collections
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Uncompressed bytes of one input chunk (at least a frame); small chunks keep the buffers in cache
+DEFAULT_CHUNK_BYTES = 2**20
+
+# Voxels processed at a time within a chunk; np.take's intp indices of a slab take 2 MiB
+SLAB_VOXELS = 2**18
+
+# Thread pool size of run_chunked; the kernels are memory-bound, so more threads rarely help
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+
+
+def label_dtype(values):
+    """
+    Returns the smallest integer dtype that holds all of `values`.
+
+    Unsigned types are preferred; negative values give a signed type.
+
+    Raises:
+        ValueError: If no 64-bit integer type holds the values.
+    """
+    values = [int(value) for value in values] or [0]
+    low, high = min(values), max(values)
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64) if low >= 0 else (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    raise ValueError(f"Label values from {low} to {high} do not fit in a 64-bit integer.")
+
+
+def _slabs(*arrays):
+    """Yield matching flat slabs of same-shape arrays; non-contiguous arrays are processed whole."""
+    if not all(array.flags.c_contiguous for array in arrays):
+        yield arrays
+        return
+    flat = [array.reshape(-1) for array in arrays]
+    for start in range(0, flat[0].size, SLAB_VOXELS):
+        yield [array[start:start + SLAB_VOXELS] for array in flat]
+
+
+def _greater_equal_into(chunk, value, out):
+    """Write chunk >= value as 0/1 into an integer array; byte-sized outputs skip the slow casting loop."""
+    if out.dtype.itemsize == 1:
+        np.greater_equal(chunk, value, out=out.view(bool))
+    else:
+        np.greater_equal(chunk, value, out=out, casting="unsafe")
+
+
+def check_fits(values, dtype):
+    """
+    Raises:
+        ValueError: If one of `values` cannot be stored in `dtype`.
+    """
+    dtype = np.dtype(dtype)
+    info = np.iinfo(dtype) if dtype.kind in "ui" else np.finfo(dtype)
+    for value in values:
+        if not info.min <= value <= info.max:
+            raise ValueError(f"Value {value} does not fit in the data type {dtype}.")
+
+
+class LabelLUT:
+    """
+    Remaps label values through a lookup table.
+
+    8- and 16-bit integer data are remapped with np.take over a full table,
+    no matter how many values change. Signed data is indexed through
+    its unsigned view with a rotated table, so no index array is needed.
+    Wider dtypes and floats fall back to a sorted-key search.
+
+    Args:
+        mapping (dict): Old value -> new value.
+        dtype (numpy.dtype): Dtype of the chunks that will be remapped.
+        out_dtype (numpy.dtype, optional): Dtype of the output. Defaults to `dtype`.
+
+    Raises:
+        ValueError: If a new value does not fit in `out_dtype`.
+    """
+
+    def __init__(self, mapping, dtype, out_dtype=None):
+        self.dtype = np.dtype(dtype)
+        self.out_dtype = self.dtype if out_dtype is None else np.dtype(out_dtype)
+        check_fits(mapping.values(), self.out_dtype)
+        self._lut = None
+        if self.dtype.kind in "ui" and self.dtype.itemsize <= 2:
+            info = np.iinfo(self.dtype)
+            lut = np.arange(info.min, info.max + 1, dtype=np.int64)
+            for old_value, new_value in mapping.items():
+                if info.min <= old_value <= info.max:
+                    lut[old_value - info.min] = new_value
+            changing = lut != np.arange(info.min, info.max + 1)
+            if info.min < 0:
+                # Entry u of the unsigned view is the value u (u <= max) or u - 2**bits
+                lut, changing = np.roll(lut, info.min), np.roll(changing, info.min)
+            self._lut = lut.astype(self.out_dtype)
+            self._changing = changing
+            self._index_dtype = np.dtype(f"u{self.dtype.itemsize}")
+        else:
+            self._keys = np.array(sorted(mapping), dtype=self.dtype)
+            self._values = np.array([mapping[key] for key in sorted(mapping)], dtype=self.out_dtype)
+
+    @property
+    def in_place(self):
+        """True if the output may overwrite the input chunk."""
+        return self.out_dtype == self.dtype
+
+    def changes(self, chunk):
+        """Return True if remapping `chunk` would change any of its values."""
+        if self._lut is not None:
+            slabs = _slabs(chunk.view(self._index_dtype))
+            return any(np.take(self._changing, slab, mode="clip").any() for slab, in slabs)
+        if not len(self._keys):
+            return False
+        index = np.searchsorted(self._keys, chunk).clip(max=len(self._keys) - 1)
+        return bool(np.any((self._keys[index] == chunk) & (self._values[index] != chunk)))
+
+    def __call__(self, chunk, out=None):
+        """
+        Remaps a chunk.
+
+        Args:
+            chunk (ndarray): Data of the dtype the table was built for.
+            out (ndarray, optional): Output of `out_dtype` and the chunk's
+                shape; may be `chunk` itself if in_place is True.
+
+        Returns:
+            ndarray: The remapped chunk (`out` if given).
+        """
+        if out is None:
+            out = np.empty(chunk.shape, self.out_dtype)
+        if self._lut is not None:
+            # mode="clip" skips the bounds-check copy; the table covers every index anyway
+            for slab, out_slab in _slabs(chunk.view(self._index_dtype), out):
+                np.take(self._lut, slab, out=out_slab, mode="clip")
+            return out
+        np.copyto(out, chunk, casting="unsafe")
+        if len(self._keys):
+            index = np.searchsorted(self._keys, chunk).clip(max=len(self._keys) - 1)
+            hit = self._keys[index] == chunk
+            np.copyto(out, self._values[index], where=hit)
+        return out
+
+
+def threshold(chunk, value, out=None):
+    """
+    Returns the foreground (voxels >= `value`) of a chunk as a boolean mask.
+
+    Args:
+        chunk (ndarray): Input data.
+        value (number): Smallest foreground value.
+        out (ndarray, optional): Boolean output of the chunk's shape.
+    """
+    return np.greater_equal(chunk, value, out=out)
+
+
+def binarize(chunk, value, foreground=1, out=None, out_dtype=np.uint8):
+    """
+    Writes the foreground of a chunk as `foreground` and the rest as 0.
+
+    Args:
+        chunk (ndarray): Input data.
+        value (number): Smallest foreground value.
+        foreground (int): Label value of the foreground.
+        out (ndarray, optional): Output of the chunk's shape; may be the
+            chunk itself. Its dtype overrides `out_dtype`.
+        out_dtype (numpy.dtype): Dtype of a new output.
+
+    Returns:
+        ndarray: The binarized chunk (`out` if given).
+
+    Raises:
+        ValueError: If `foreground` does not fit in the output dtype.
+    """
+    if out is None:
+        out = np.empty(chunk.shape, out_dtype)
+    check_fits([foreground], out.dtype)
+    foreground = out.dtype.type(foreground)
+    for chunk_slab, out_slab in _slabs(chunk, out):
+        # The comparison is written straight into the output, so no boolean temporary is needed
+        _greater_equal_into(chunk_slab, value, out_slab)
+        if foreground != 1:
+            np.multiply(out_slab, foreground, out=out_slab)
+    return out
+
+
+def merge_masks(chunks, label_values, value, out):
+    """
+    Merges binary masks into one label chunk.
+
+    Masks are applied in order, so where they overlap the later one wins.
+    Each mask is blended in with bitwise operations instead of a masked
+    copy, which keeps the speed independent of how fragmented the masks are.
+
+    Args:
+        chunks (list): Mask chunks of the same shape.
+        label_values (list): Label value of each mask.
+        value (number): Mask voxels >= `value` are foreground.
+        out (ndarray): Integer output chunk; its dtype must hold every label value.
+
+    Returns:
+        ndarray: `out`.
+    """
+    out.fill(0)
+    label_values = [out.dtype.type(label_value) for label_value in label_values]
+    select = np.empty(min(out.size, SLAB_VOXELS), out.dtype)
+    difference = np.empty_like(select)
+    for slabs in _slabs(out, *chunks):
+        out_slab = slabs[0]
+        select_slab, difference_slab = select[:out_slab.size], difference[:out_slab.size]
+        if out_slab.shape != select_slab.shape:
+            select_slab, difference_slab = np.empty_like(out_slab), np.empty_like(out_slab)
+        for chunk, label_value in zip(slabs[1:], label_values):
+            # select is all ones where the mask is set, so out ^= (out ^ label) & select sets those voxels
+            _greater_equal_into(chunk, value, select_slab)
+            np.negative(select_slab, out=select_slab)
+            np.bitwise_xor(out_slab, label_value, out=difference_slab)
+            np.bitwise_and(difference_slab, select_slab, out=difference_slab)
+            np.bitwise_xor(out_slab, difference_slab, out=out_slab)
+    return out
+
+
+def chunk_frames_for(stacks, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Returns how many frames make one chunk of about `chunk_bytes` per input.
+
+    The count is a multiple of the chunk depth of every Zarr reader and
+    writer among `stacks`, so every stored chunk is decoded and encoded once
+    and a Zarr writer never holds frames of an earlier chunk.
+    """
+    readers = [stack for stack in stacks if hasattr(stack, "frame_shape")]
+    frame_bytes = max(int(np.prod(reader.frame_shape)) * reader.dtype.itemsize for reader in readers)
+    frames = max(1, chunk_bytes // max(1, frame_bytes))
+    depth = 1
+    for stack in stacks:
+        stack_depth = getattr(stack, "chunk_frames", 1)
+        depth = depth * stack_depth // math.gcd(depth, stack_depth)
+    return max(depth, frames - frames % depth)
+
+
+def run_chunked(kernel, readers, writer, out_dtype=None, chunk_frames=None, threads=None, progress=None):
+    """
+    Streams stacks through a kernel a chunk of frames at a time.
+
+    The calling thread reads a chunk of the same frames from every reader,
+    hands it to the thread pool and writes finished results in frame order.
+    At most two chunks per thread are in flight, and their buffers are
+    reused for later chunks, so memory stays bounded and no time goes into
+    faulting in fresh pages for every chunk.
+
+    Args:
+        kernel (callable): Called as kernel(chunks, out) with one (frames, ...)
+            array per reader, which the kernel may overwrite, and an output
+            buffer of `out_dtype`; returns the output chunk, e.g. `out` or
+            one of the chunks.
+        readers (list): Stack readers of the same shape, e.g. from
+            nnunet_tools.open_stack.
+        writer: Stack writer taking frames with write(), or None to discard
+            the results.
+        out_dtype (numpy.dtype, optional): Dtype of the output buffers; None
+            passes out=None for kernels that work in place.
+        chunk_frames (int, optional): Frames per chunk. Defaults to
+            chunk_frames_for(readers + [writer]).
+        threads (int, optional): Kernel threads. Defaults to DEFAULT_THREADS;
+            1 runs the kernel in the calling thread.
+        progress (callable, optional): Called as progress(frames_done, num_frames,
+            bytes_read) after each chunk.
+
+    Returns:
+        int: Number of frames processed.
+    """
+    num_frames = readers[0].num_frames
+    chunk_frames = chunk_frames or chunk_frames_for(list(readers) + [writer])
+    threads = threads or DEFAULT_THREADS
+    frame_bytes = sum(int(np.prod(reader.frame_shape)) * reader.dtype.itemsize for reader in readers)
+    free_buffers = []
+    bytes_read = 0
+
+    def read(start):
+        """Read the chunk at `start` into a free buffer set; return (chunks, out, buffer set)."""
+        if free_buffers:
+            buffers = free_buffers.pop()
+        else:
+            inputs = [np.empty((chunk_frames,) + reader.frame_shape, reader.dtype) for reader in readers]
+            out = None if out_dtype is None else np.empty((chunk_frames,) + readers[0].frame_shape, out_dtype)
+            buffers = (inputs, out)
+        count = min(chunk_frames, num_frames - start)
+        chunks = [buffer[:count] for buffer in buffers[0]]
+        for reader, chunk in zip(readers, chunks):
+            reader.read_into(start, chunk)
+        return chunks, None if buffers[1] is None else buffers[1][:count], buffers
+
+    def emit(start, result, buffers):
+        nonlocal bytes_read
+        if writer is not None:
+            for frame_data in result:
+                writer.write(frame_data)
+        free_buffers.append(buffers)
+        stop = min(start + chunk_frames, num_frames)
+        bytes_read += frame_bytes * (stop - start)
+        if progress:
+            progress(stop, num_frames, bytes_read)
+
+    if threads == 1:
+        for start in range(0, num_frames, chunk_frames):
+            chunks, out, buffers = read(start)
+            emit(start, kernel(chunks, out), buffers)
+        return num_frames
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        try:
+            for start in range(0, num_frames, chunk_frames):
+                chunks, out, buffers = read(start)
+                pending.append((start, pool.submit(kernel, chunks, out), buffers))
+                while len(pending) >= 2 * threads:
+                    start, future, buffers = pending.popleft()
+                    emit(start, future.result(), buffers)
+            while pending:
+                start, future, buffers = pending.popleft()
+                emit(start, future.result(), buffers)
+        except BaseException:
+            for _, future, _ in pending:
+                future.cancel()
+            raise
+    return num_frames
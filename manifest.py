@@ -0,0 +1,153 @@
+"""
+Journal of finished work, so interrupted batch operations can resume.
+
+An operation over many files (relabeling a folder, importing a dataset,
+cutting stacks) records each finished file in a Manifest. On the next run,
+files whose entry still matches are skipped and only the remaining or
+changed work is done.
+"""
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_PREFIX = ".nnunet_manifest_"
+
+
+def file_stamp(path):
+    """
+    Return [size, mtime_ns] of a file, or None if it does not exist.
+
+    A folder such as a Zarr store is stamped with the total size and the
+    latest modification time of the files in it.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isdir(path):
+        return [stat.st_size, stat.st_mtime_ns]
+    size, mtime_ns = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+    return [size, mtime_ns]
+
+
+def params_digest(params):
+    """Return a short digest of JSON-serializable operation parameters."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    Append-only journal of the units of work a batch operation has finished.
+
+    Each line holds a key (usually a file), a digest of the parameters that
+    determine the result and the stamps (size and modification time) of the
+    files the work read and wrote. A unit only counts as done if an entry
+    with the same parameters exists and every one of those files still has its
+    recorded stamp. Changed inputs, changed parameters and outputs modified
+    since are redone; everything else is skipped. Lines are flushed to disk as
+    they are written, so a crash loses at most the unit in progress.
+
+    Args:
+        folder (str): Folder the journal is kept in; paths are stored relative to it.
+        operation (str): Operation name; each operation has its own journal per folder.
+        params (dict): Parameters that change the result, e.g. a label mapping.
+        resume (bool): Use earlier entries. False starts a new journal.
+    """
+
+    def __init__(self, folder, operation, params, resume=True):
+        self.folder = folder
+        self.path = os.path.join(folder, f"{MANIFEST_PREFIX}{operation}.jsonl")
+        self.digest = params_digest(params)
+        self._entries = {}
+        if resume:
+            self._load()
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                        self._entries[(entry["params"], entry["key"])] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Torn line from a crash
+                    lines += 1
+        except OSError:
+            return
+        # Superseded entries pile up over many runs; rewrite the journal without them
+        if lines > 2 * len(self._entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as journal:
+                for entry in self._entries.values():
+                    journal.write(json.dumps(entry) + "\n")
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Could not compact manifest {self.path}: {e}")
+
+    def relative(self, path):
+        """Return `path` as stored in the journal: relative to its folder where possible."""
+        try:
+            return os.path.relpath(path, self.folder)
+        except ValueError:  # Another drive on Windows
+            return os.path.abspath(path)
+
+    def is_done(self, key, inputs=()):
+        """
+        Checks whether a unit of work was finished with the current parameters.
+
+        Args:
+            key (str): Unit of work, as passed to record().
+            inputs (iterable): Paths that must be among the recorded files, so
+                an entry is not reused for a different input.
+
+        Returns:
+            bool: True if its entry exists and all its files are unchanged.
+        """
+        entry = self._entries.get((self.digest, key))
+        if entry is None:
+            return False
+        files = entry["files"]
+        if any(self.relative(path) not in files for path in inputs):
+            return False
+        return all(file_stamp(os.path.join(self.folder, path)) == stamp for path, stamp in files.items())
+
+    def record(self, key, files):
+        """
+        Marks a unit of work as finished.
+
+        Args:
+            key (str): Unit of work, e.g. a file name.
+            files (list or dict): Paths whose current stamps describe the
+                finished state, or path -> stamp for files that will only get
+                that stamp later (e.g. a temporary file about to be renamed
+                onto the path).
+        """
+        if not isinstance(files, dict):
+            files = {path: file_stamp(path) for path in files}
+        entry = {
+            "key": key,
+            "params": self.digest,
+            "files": {self.relative(path): stamp for path, stamp in files.items()},
+            "time": time.time(),
+        }
+        self._entries[(self.digest, key)] = entry
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
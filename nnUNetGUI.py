@@ -1,79 +1,415 @@
-import os
 import json
-import shutil
+import os
+import time
+import dataset_validation
+import nnunet_runner
+import nnunet_tools
 import numpy as np
-from PIL import Image
-from skimage import io
-import tifffile as tiff
+import tiff_preview
+import tracing
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QLineEdit, QPushButton, QLabel, QVBoxLayout, QWidget, QFormLayout, QDialog, QGridLayout, QComboBox,QMessageBox, QListWidget, QInputDialog
+    QApplication, QMainWindow, QFileDialog, QLineEdit, QPushButton, QLabel, QVBoxLayout, QWidget, QFormLayout, QDialog, QGridLayout, QComboBox,QMessageBox, QListWidget, QInputDialog, QScrollArea,
+    QProgressBar, QCheckBox, QPlainTextEdit, QSlider, QSpinBox, QTableWidget, QTableWidgetItem
 )
 
 
-def cut_tiff_into_parts(input_file_path, x_cuts, y_cuts):
+class JobSignals(QObject):
+    """Signals a FunctionJob uses to report back to the GUI thread."""
+    progress = pyqtSignal(int, int, float)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class FunctionJob(QRunnable):
+    """
+    Runs an nnunet_tools function on the thread pool.
+
+    The function gets a `progress` callback that forwards its progress to the
+    GUI and raises OperationCancelled once cancel() has been requested.
+    While a trace is recording, the job is a "job" span of it; with
+    `profile_path` set, its thread is profiled with `profiler` as well.
     """
-    Splits a TIFF file into equally sized parts and saves them into a directory.
 
-    Args:
-        input_file_path (str): Path to the TIFF file.
-        x_cuts (int): Number of cuts along the x-axis.
-        y_cuts (int): Number of cuts along the y-axis.
+    def __init__(self, function, *args, title=None, profiler=None, profile_path=None, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.title = title
+        self.profiler = profiler
+        self.profile_path = profile_path
+        self.signals = JobSignals()
+        self._cancel_requested = False
+
+    def cancel(self):
+        self._cancel_requested = True
+
+    def report_progress(self, done, total, bytes_done=0):
+        if self._cancel_requested:
+            raise nnunet_tools.OperationCancelled()
+        self.signals.progress.emit(done, total, float(bytes_done))
+
+    def run(self):
+        profile = None
+        if self.profiler:
+            try:
+                profile = tracing.Profile(self.profiler, self.profile_path).start()
+            except (ValueError, ImportError, RuntimeError) as e:
+                print(f"Not profiling {self.title}: {e}")
+        try:
+            if self._cancel_requested:
+                raise nnunet_tools.OperationCancelled()
+            with tracing.span("job", title=self.title):
+                result = self.function(*self.args, progress=self.report_progress, **self.kwargs)
+        except nnunet_tools.OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            if profile is not None:
+                print(f"Profile of {self.title} saved to {profile.stop()}")
+
+
+class JobWidget(QWidget):
+    """One row of the job panel: title, progress bar, throughput/ETA and a cancel button."""
+
+    def __init__(self, title, unit, on_cancel):
+        super().__init__()
+        self.unit = unit
+        self.on_cancel = on_cancel
+        self.start_time = time.perf_counter()
+
+        layout = QGridLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel(title), 0, 0, 1, 2)
+        self.progress_bar = QProgressBar()
+        layout.addWidget(self.progress_bar, 1, 0)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.clicked.connect(self.cancel)
+        layout.addWidget(self.btn_cancel, 1, 1)
+        self.label_status = QLabel("Waiting...")
+        layout.addWidget(self.label_status, 2, 0, 1, 2)
+
+    def cancel(self):
+        if self.on_cancel is None:
+            self.deleteLater()
+            return
+        self.label_status.setText("Cancelling...")
+        self.btn_cancel.setEnabled(False)
+        self.on_cancel()
+
+    def set_busy(self, status="Running..."):
+        """Show an indeterminate bar, e.g. for an external command."""
+        self.progress_bar.setRange(0, 0)
+        self.label_status.setText(status)
+
+    def update_progress(self, done, total, bytes_done):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+        self.progress_bar.setRange(0, max(total, 1))
+        self.progress_bar.setValue(done)
+        rate = done / elapsed
+        status = f"{done}/{total} {self.unit} | {bytes_done / 1e6 / elapsed:.1f} MB/s | {rate:.1f} {self.unit}/s"
+        if 0 < done < total:
+            status += f" | ETA {(total - done) / rate:.0f}s"
+        self.label_status.setText(status)
+
+    def set_finished(self, status):
+        """Show the final status and turn the cancel button into a clear button."""
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1)
+        self.label_status.setText(f"{status} ({time.perf_counter() - self.start_time:.1f}s)")
+        self.on_cancel = None
+        self.btn_cancel.setText("Clear")
+        self.btn_cancel.setEnabled(True)
+
+
+class RunnerSignals(QObject):
+    """Carries JobRunner callbacks from its worker threads to the GUI thread."""
+    output = pyqtSignal(object, str)
+    state = pyqtSignal(object)
+
+
+class RunnerJobWidget(JobWidget):
+    """Job panel row of an external command queued on a JobRunner, with log view and retry."""
+
+    def __init__(self, title, runner, job):
+        super().__init__(title, "", None)
+        self.runner = runner
+        self.job = job
+        self.log_view = None
+        self.btn_log = QPushButton("Log")
+        self.btn_log.clicked.connect(self.show_log)
+        self.btn_retry = QPushButton("Retry")
+        self.btn_retry.clicked.connect(lambda: self.runner.retry(self.job))
+        self.btn_retry.setVisible(False)
+        self.layout().addWidget(self.btn_log, 3, 0)
+        self.layout().addWidget(self.btn_retry, 3, 1)
+        self.update_state(job)
+
+    def set_active(self, status):
+        """Show a queued or running job, with a working cancel button."""
+        self.start_time = time.perf_counter()
+        self.on_cancel = lambda: self.runner.cancel(self.job)
+        self.btn_cancel.setText("Cancel")
+        self.btn_cancel.setEnabled(True)
+        self.btn_retry.setVisible(False)
+        self.set_busy(status)
+
+    def update_state(self, job):
+        if job.state == nnunet_runner.QUEUED:
+            self.set_active("Queued...")
+        elif job.state == nnunet_runner.RUNNING:
+            self.set_active(f"Running (attempt {job.attempts})..." if job.attempts > 1 else "Running...")
+        else:
+            if job.error:
+                status = f"Failed: {job.error}"
+            elif job.state == nnunet_runner.FAILED:
+                status = f"Failed with exit code {job.exit_code}"
+            else:
+                status = job.state.capitalize()
+            if job.peak_rss_bytes:
+                status += f", peak memory {nnunet_runner.format_memory(job.peak_rss_bytes)}"
+            self.set_finished(status)
+            self.btn_retry.setVisible(job.state in (nnunet_runner.FAILED, nnunet_runner.CANCELLED))
+
+    def append_output(self, line):
+        if line.strip():
+            self.label_status.setText(line[-120:])
+        if self.log_view is not None:
+            self.log_view.appendPlainText(line)
+
+    def show_log(self):
+        """Open the job's log file; lines printed while it is open are appended live."""
+        dialog = QDialog(self)
+        dialog.setWindowTitle(os.path.basename(self.job.log_path))
+        dialog.resize(800, 500)
+        layout = QVBoxLayout(dialog)
+        self.log_view = QPlainTextEdit()
+        self.log_view.setReadOnly(True)
+        try:
+            with open(self.job.log_path, "r", encoding="utf-8", errors="replace") as log_file:
+                self.log_view.setPlainText(log_file.read())
+        except OSError:
+            pass
+        layout.addWidget(self.log_view)
+        dialog.finished.connect(lambda _: setattr(self, "log_view", None))
+        dialog.show()
+
+
+class PreviewDialog(QDialog):
+    """
+    Slice viewer for a TIF stack, with an optional label overlay and the
+    outlines of a proposed cut or tiling.
 
-    Raises:
-        ValueError: If the image dimensions are not divisible by the specified cuts.
+    Slices are loaded in the background from a tiff_preview.PreviewPyramid at
+    the scale that fits the view, so only the frames looked at are read and a
+    large stack scrolls without loading it.
     """
-    # Open the TIFF file
-    try:
-        tiff_image = Image.open(input_file_path)
-    except FileNotFoundError:
-        raise FileNotFoundError("The specified TIFF file was not found.")
-
-    if not tiff_image.is_animated:
-        raise ValueError("The input image does not appear to be a stack.")
-
-    # Get original dimensions
-    width, height = tiff_image.size
-    num_frames = tiff_image.n_frames
-
-    # Calculate sub-region dimensions
-    sub_width = width // (x_cuts + 1)
-    sub_height = height // (y_cuts + 1)
-
-    # Validate divisibility
-    if width % (x_cuts + 1) != 0 or height % (y_cuts + 1) != 0:
-        raise ValueError("Image dimensions are not perfectly divisible by the chosen cuts.")
-
-    # Create the output directory
-    base_name = os.path.splitext(os.path.basename(input_file_path))[0]
-    save_dir = os.path.join(os.path.dirname(input_file_path), base_name)
-    os.makedirs(save_dir, exist_ok=True)
-
-    # Cut and save parts
-    part_counter = 1
-    for i in range(x_cuts + 1):
-        for j in range(y_cuts + 1):
-            x_start = i * sub_width
-            y_start = j * sub_height
-            # Create a stack for the cropped region
-            cropped_stack = []
-            for frame in range(num_frames):
-                tiff_image.seek(frame)
-                frame_data = np.array(tiff_image.crop((x_start, y_start, x_start + sub_width, y_start + sub_height)))
-                cropped_stack.append(Image.fromarray(frame_data))
-            # Save cropped stack as a new TIFF
-            part_name = f"{base_name}_x{i}_y{j}.tif"
-            part_path = os.path.join(save_dir, part_name)
-            cropped_stack[0].save(part_path, save_all=True, append_images=cropped_stack[1:])
-            part_counter += 1
-
-    print(f"Processing complete. Files saved in: {save_dir}")
+
+    GRID_MODES = ("No grid", "Equal divisions", "Overlapping tiles")
+
+    def __init__(self, parent, image_file, label_file=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Preview {os.path.basename(image_file)}")
+        self.image = tiff_preview.PreviewPyramid(image_file)
+        self.labels = None
+        self.grid_boxes = []
+        self._shown = None
+        self._job = None  # Keeps the job of the slice being loaded alive
+        # One loader thread; a slice requested while another loads is fetched right after it
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+        layout = QGridLayout(self)
+        self.view = QLabel()
+        self.view.setMinimumSize(512, 512)
+        self.view.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.view, 0, 0, 1, 4)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, self.image.num_frames - 1)
+        self.slider.setValue(self.image.num_frames // 2)
+        layout.addWidget(self.slider, 1, 0, 1, 4)
+        self.label_status = QLabel()
+        layout.addWidget(self.label_status, 2, 0, 1, 4)
+
+        self.btn_labels = QPushButton("Load Label Overlay...")
+        self.btn_labels.clicked.connect(self.select_labels)
+        layout.addWidget(self.btn_labels, 3, 0, 1, 2)
+        self.check_labels = QCheckBox("Show labels")
+        self.check_labels.setEnabled(False)
+        self.check_labels.stateChanged.connect(self.refresh)
+        layout.addWidget(self.check_labels, 3, 2, 1, 2)
+
+        # Outlines of the parts a cut or tiling would write
+        self.combo_grid = QComboBox()
+        self.combo_grid.addItems(self.GRID_MODES)
+        layout.addWidget(QLabel("Grid:"), 4, 0)
+        layout.addWidget(self.combo_grid, 4, 1, 1, 3)
+        self.spin_x = self._spin_box(1, 256, 2)
+        self.spin_y = self._spin_box(1, 256, 2)
+        layout.addWidget(QLabel("X / Y Divisions:"), 5, 0)
+        layout.addWidget(self.spin_x, 5, 1)
+        layout.addWidget(self.spin_y, 5, 2)
+        self.spin_tile_height = self._spin_box(16, 65536, 256)
+        self.spin_tile_width = self._spin_box(16, 65536, 256)
+        self.spin_overlap = self._spin_box(0, 65535, 0)
+        layout.addWidget(QLabel("Tile Height / Width / Overlap:"), 6, 0)
+        layout.addWidget(self.spin_tile_height, 6, 1)
+        layout.addWidget(self.spin_tile_width, 6, 2)
+        layout.addWidget(self.spin_overlap, 6, 3)
+        self.combo_grid.currentIndexChanged.connect(self.update_grid)
+
+        # Wait until the slider rests for a moment before reading a frame
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(30)
+        self.timer.timeout.connect(self.load_slice)
+        self.slider.valueChanged.connect(self.refresh)
+
+        if label_file:
+            self.set_labels(label_file)
+        self.update_grid()
+        self.refresh()
+
+    def _spin_box(self, minimum, maximum, value):
+        spin_box = QSpinBox()
+        spin_box.setRange(minimum, maximum)
+        spin_box.setValue(value)
+        spin_box.valueChanged.connect(self.update_grid)
+        return spin_box
+
+    def set_grid(self, mode, x_divisions=1, y_divisions=1, tile_size=(256, 256), overlap=0):
+        """Show the outlines of a cut ("Equal divisions") or tiling ("Overlapping tiles")."""
+        tile_height, tile_width = tile_size
+        for spin_box, value in ((self.spin_x, x_divisions), (self.spin_y, y_divisions), (self.spin_tile_height, tile_height),
+                                (self.spin_tile_width, tile_width), (self.spin_overlap, overlap)):
+            spin_box.blockSignals(True)
+            spin_box.setValue(value)
+            spin_box.blockSignals(False)
+        self.combo_grid.setCurrentIndex(self.GRID_MODES.index(mode))
+        self.update_grid()
+
+    def update_grid(self):
+        mode = self.combo_grid.currentIndex()
+        for widget in (self.spin_x, self.spin_y):
+            widget.setEnabled(mode == 1)
+        for widget in (self.spin_tile_height, self.spin_tile_width, self.spin_overlap):
+            widget.setEnabled(mode == 2)
+        self.grid_note = ""
+        self.grid_boxes = []
+        height, width = self.image.height, self.image.width
+        if mode == 1:
+            x_divisions, y_divisions = self.spin_x.value(), self.spin_y.value()
+            self.grid_boxes = tiff_preview.cut_boxes(height, width, x_divisions, y_divisions)
+            if width % x_divisions or height % y_divisions:
+                self.grid_note = " | not divisible, the cut would be refused"
+        elif mode == 2:
+            try:
+                tile_size = (self.spin_tile_height.value(), self.spin_tile_width.value())
+                self.grid_boxes = tiff_preview.tile_boxes(height, width, tile_size, self.spin_overlap.value())
+                self.grid_note = f" | {len(self.grid_boxes)} tiles"
+            except ValueError as e:
+                self.grid_note = f" | {e}"
+        self.render()
+
+    def select_labels(self):
+        label_file, _ = QFileDialog.getOpenFileName(self, "Select Label TIF", "", "TIF Files (*.tif)")
+        if label_file:
+            self.set_labels(label_file)
+
+    def set_labels(self, label_file):
+        try:
+            labels = tiff_preview.PreviewPyramid(label_file)
+        except Exception as e:
+            QMessageBox.warning(self, "Invalid Labels", f"Could not open {label_file}: {e}")
+            return
+        if (labels.num_frames, labels.height, labels.width) != (self.image.num_frames, self.image.height, self.image.width):
+            labels.close()
+            QMessageBox.warning(self, "Invalid Labels", "The label stack does not have the shape of the image stack.")
+            return
+        if self.labels is not None:
+            self.labels.close()
+        self.labels = labels
+        self.check_labels.setEnabled(True)
+        self.check_labels.setChecked(True)
+        self.refresh()
+
+    def refresh(self, *_):
+        self.timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.refresh()
+
+    def load_slice(self):
+        """Read the selected frame at the scale that fits the view on the loader thread."""
+        if self._job is not None:
+            return  # show_slice loads the newest frame when the current one arrives
+        index = self.slider.value()
+        level = self.image.level_for(self.view.height(), self.view.width())
+        labels = self.labels if self.check_labels.isChecked() else None
+        image = self.image
+
+        def load(progress=None):
+            label_slice = labels.slice(index, level) if labels is not None else None
+            return index, level, image.slice(index, level), label_slice, image.display_range()
+
+        self._job = FunctionJob(load)
+        self._job.signals.finished.connect(self.show_slice)
+        self._job.signals.failed.connect(self.load_failed)
+        self.thread_pool.start(self._job)
+
+    def load_failed(self, message):
+        self._job = None
+        self.label_status.setText(f"Could not read frame: {message}")
+
+    def show_slice(self, result):
+        self._job = None
+        self._shown = result
+        self.render()
+        index, level = result[:2]
+        wanted_labels = self.labels is not None and self.check_labels.isChecked()
+        wanted_level = self.image.level_for(self.view.height(), self.view.width())
+        if (index, level, wanted_labels) != (self.slider.value(), wanted_level, result[3] is not None):
+            self.load_slice()
+
+    def render(self):
+        if self._shown is None:
+            return
+        index, level, image, labels, display_range = self._shown
+        rgb = tiff_preview.render_slice(image, display_range, labels, boxes=self.grid_boxes, scale=2 ** level)
+        height, width = rgb.shape[:2]
+        qimage = QImage(rgb.data, width, height, 3 * width, QImage.Format_RGB888).copy()
+        self.view.setPixmap(QPixmap.fromImage(qimage))
+        status = f"Frame {index} (0-{self.image.num_frames - 1}) | scale 1:{2 ** level}{self.grid_note}"
+        if labels is not None:
+            values = np.unique(labels)
+            shown = ", ".join(str(value) for value in values[:20]) + (", ..." if len(values) > 20 else "")
+            status += f" | label values here: {shown}"
+        self.label_status.setText(status)
+
+    def done(self, result):
+        self.timer.stop()
+        self.thread_pool.waitForDone()
+        self.image.close()
+        if self.labels is not None:
+            self.labels.close()
+        super().done(result)
+
 
 class NNUnetGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         print("Initializing GUI...")
         self.setWindowTitle("nnUNet Folder Setup")
-        self.setGeometry(100, 100, 600, 600)
+        self.setGeometry(100, 100, 600, 800)
 
         # Main widget and layout
         self.central_widget = QWidget()
@@ -101,6 +437,18 @@ class NNUnetGUI(QMainWindow):
         self.layout.addWidget(self.input_folder)
         self.layout.addWidget(self.btn_select_folder)
 
+        # Import Mode and Concurrency for Folder Creation
+        self.label_import_mode = QLabel("Import Mode (copy, or link files where the filesystem allows it):")
+        self.combo_import_mode = QComboBox()
+        self.combo_import_mode.addItems(nnunet_tools.IMPORT_MODES)
+        self.layout.addWidget(self.label_import_mode)
+        self.layout.addWidget(self.combo_import_mode)
+
+        self.label_import_workers = QLabel("Concurrent Transfers:")
+        self.input_import_workers = QLineEdit("8")
+        self.layout.addWidget(self.label_import_workers)
+        self.layout.addWidget(self.input_import_workers)
+
         # Create Folder Button
         self.btn_run = QPushButton("Create Folder Structure")
         self.btn_run.clicked.connect(self.run_processing)
@@ -117,10 +465,35 @@ class NNUnetGUI(QMainWindow):
         self.layout.addWidget(self.label_plan_preprocess)
         self.layout.addWidget(self.input_plan_preprocess)
 
+        self.label_plan_processes = QLabel(
+            "Preprocessing Processes -np (e.g. 8 or 8 4 8) and Fingerprint Processes -npfp (optional):"
+        )
+        self.input_plan_np = QLineEdit()
+        self.input_plan_np.setPlaceholderText("-np")
+        self.input_plan_npfp = QLineEdit()
+        self.input_plan_npfp.setPlaceholderText("-npfp")
+        self.layout.addWidget(self.label_plan_processes)
+        self.layout.addWidget(self.input_plan_np)
+        self.layout.addWidget(self.input_plan_npfp)
+
+        self.label_plan_concurrent = QLabel("Datasets Planned at the Same Time (one job per dataset):")
+        self.input_plan_concurrent = QLineEdit("1")
+        self.layout.addWidget(self.label_plan_concurrent)
+        self.layout.addWidget(self.input_plan_concurrent)
+
         self.btn_plan_preprocess = QPushButton("Run nnUNetv2 Plan and Preprocess")
         self.btn_plan_preprocess.clicked.connect(self.run_nnunet_plan_preprocess)
         self.layout.addWidget(self.btn_plan_preprocess)
 
+        # Output format of the TIF files written by the tools below
+        self.label_output_compression = QLabel("Output TIF Compression (zlib/zstd shrink sparse labels the most):")
+        self.combo_output_compression = QComboBox()
+        self.combo_output_compression.addItems(nnunet_tools.TIFF_COMPRESSIONS)
+        self.check_output_tiled = QCheckBox("Tiled output pages (256 x 256)")
+        self.layout.addWidget(self.label_output_compression)
+        self.layout.addWidget(self.combo_output_compression)
+        self.layout.addWidget(self.check_output_tiled)
+
         # Change TIF File Values Button
         self.btn_change_color = QPushButton("Change TIF File Colors in Folder")
         self.btn_change_color.clicked.connect(self.change_tif_colors_folder)
@@ -132,6 +505,16 @@ class NNUnetGUI(QMainWindow):
         self.btn_cut_tif_stack.clicked.connect(self.cut_tif_file)
         self.layout.addWidget(self.btn_cut_tif_stack)
 
+        # Preview TIF Stack Button
+        self.btn_preview = QPushButton("Preview TIF Stack")
+        self.btn_preview.clicked.connect(self.preview_tif_stack)
+        self.layout.addWidget(self.btn_preview)
+
+        # Stitch Tiles Button
+        self.btn_stitch_tiles = QPushButton("Stitch Tiles")
+        self.btn_stitch_tiles.clicked.connect(self.stitch_tiles)
+        self.layout.addWidget(self.btn_stitch_tiles)
+
 
          # Add Combine Labels Button
         self.btn_combine_labels = QPushButton("Combine Labels")
@@ -142,7 +525,47 @@ class NNUnetGUI(QMainWindow):
         self.btn_create_substacks = QPushButton("Create Substacks")
         self.btn_create_substacks.clicked.connect(self.create_substacks)
         self.layout.addWidget(self.btn_create_substacks)
-        
+
+        # Convert between TIF and Zarr Button
+        self.btn_convert = QPushButton("Convert TIF / Zarr")
+        self.btn_convert.clicked.connect(self.convert_stacks)
+        self.layout.addWidget(self.btn_convert)
+
+        # Timing traces of the jobs below; see tracing.py
+        self.check_trace = QCheckBox("Record timing traces of jobs")
+        self.check_trace.toggled.connect(self.toggle_trace)
+        self.combo_profiler = QComboBox()
+        self.combo_profiler.addItems(("no profiler",) + tracing.PROFILERS)
+        self.btn_trace_summary = QPushButton("Show Trace Summary")
+        self.btn_trace_summary.clicked.connect(self.show_trace_summary)
+        self.layout.addWidget(self.check_trace)
+        self.layout.addWidget(self.combo_profiler)
+        self.layout.addWidget(self.btn_trace_summary)
+        self.trace = None
+        self.trace_path = os.path.join(tracing.DEFAULT_TRACE_DIR, time.strftime("%Y%m%d-%H%M%S") + ".jsonl")
+        self.profiled_jobs = 0
+
+        # Job queue panel; long operations run in the background and show up here
+        self.layout.addWidget(QLabel("Jobs:"))
+        self.jobs_widget = QWidget()
+        self.jobs_layout = QVBoxLayout(self.jobs_widget)
+        self.jobs_layout.setAlignment(Qt.AlignTop)
+        jobs_scroll_area = QScrollArea()
+        jobs_scroll_area.setWidgetResizable(True)
+        jobs_scroll_area.setWidget(self.jobs_widget)
+        self.layout.addWidget(jobs_scroll_area, 1)
+        self.thread_pool = QThreadPool.globalInstance()
+        self.jobs = set()
+
+        # External nnUNet commands are queued on a runner; logs go to nnunet_runner.DEFAULT_LOG_DIR
+        self.runner_signals = RunnerSignals()
+        self.runner_signals.output.connect(self.runner_output)
+        self.runner_signals.state.connect(self.runner_state)
+        self.runner = nnunet_runner.JobRunner(
+            on_output=self.runner_signals.output.emit, on_state=self.runner_signals.state.emit
+        )
+        self.runner_widgets = {}
+
         # Set layout
         self.central_widget.setLayout(self.layout)
         self.setCentralWidget(self.central_widget)
@@ -154,6 +577,172 @@ class NNUnetGUI(QMainWindow):
 
         print("GUI initialized.")
 
+    def output_options(self):
+        """Return the TiffOutputOptions selected in the main window."""
+        return nnunet_tools.TiffOutputOptions(
+            compression=self.combo_output_compression.currentText(),
+            tile=256 if self.check_output_tiled.isChecked() else None,
+        )
+
+    def start_job(self, title, unit, function, *args, on_success=None, **kwargs):
+        """
+        Run an nnunet_tools function in the background and add it to the job panel.
+
+        Args:
+            title (str): Title shown in the job panel.
+            unit (str): What the function reports progress in, e.g. "files".
+            function (callable): Function accepting a `progress` keyword argument.
+            on_success (callable, optional): Called with the result in the GUI thread.
+        """
+        profiler = None
+        profile_path = None
+        if self.trace is not None and self.combo_profiler.currentIndex() > 0:
+            self.profiled_jobs += 1
+            profiler = self.combo_profiler.currentText()
+            profile_path = f"{os.path.splitext(self.trace_path)[0]}-job{self.profiled_jobs}"
+        job = FunctionJob(function, *args, title=title, profiler=profiler, profile_path=profile_path, **kwargs)
+        widget = JobWidget(title, unit, job.cancel)
+        self.jobs.add(job)
+
+        def finished(result):
+            self.jobs.discard(job)
+            widget.set_finished("Done")
+            if on_success:
+                on_success(result)
+
+        def failed(message):
+            self.jobs.discard(job)
+            widget.set_finished(f"Failed: {message}")
+            QMessageBox.critical(self, "Error", f"{title} failed: {message}")
+
+        def cancelled():
+            self.jobs.discard(job)
+            widget.set_finished("Cancelled")
+
+        job.signals.progress.connect(widget.update_progress)
+        job.signals.finished.connect(finished)
+        job.signals.failed.connect(failed)
+        job.signals.cancelled.connect(cancelled)
+        self.jobs_layout.addWidget(widget)
+        self.thread_pool.start(job)
+
+    def submit_command(self, name, title, command):
+        """Queue an external command on the job runner and add it to the job panel."""
+        print(f"Queueing command: {' '.join(command)}")
+        job = self.runner.submit(name, command)
+        widget = RunnerJobWidget(title, self.runner, job)
+        widget.destroyed.connect(lambda: self.runner_widgets.pop(job, None))
+        self.runner_widgets[job] = widget
+        self.jobs_layout.addWidget(widget)
+        widget.update_state(job)
+        return job
+
+    def runner_output(self, job, line):
+        print(f"[{job.name}] {line}")
+        widget = self.runner_widgets.get(job)
+        if widget is not None:
+            widget.append_output(line)
+
+    def runner_state(self, job):
+        widget = self.runner_widgets.get(job)
+        if widget is not None:
+            widget.update_state(job)
+
+    def closeEvent(self, event):
+        """
+        Closing the window cancels queued and running nnUNet jobs, after asking.
+
+        The window closes right away; the program exits once the cancelled
+        process trees are gone (see the end of this file).
+        """
+        active = [job for job in self.runner.jobs() if not job.done]
+        if active:
+            answer = QMessageBox.question(
+                self, "Jobs Running",
+                f"{len(active)} nnUNet job(s) are still queued or running. Cancel them and quit?",
+            )
+            if answer != QMessageBox.Yes:
+                event.ignore()
+                return
+            self.runner.shutdown(cancel=True, wait=False)
+        if self.trace is not None:
+            self.trace.stop()
+            self.trace = None
+        event.accept()
+
+    def toggle_trace(self, enabled):
+        """Start or stop recording the session trace; jobs started while it records get spans."""
+        if enabled and self.trace is None:
+            try:
+                self.trace = tracing.Trace(self.trace_path).start()
+            except (OSError, RuntimeError) as e:
+                QMessageBox.warning(self, "Error", f"Could not start the trace: {e}")
+                self.check_trace.setChecked(False)
+                return
+            print(f"Recording timing traces to {self.trace_path}")
+        elif not enabled and self.trace is not None:
+            self.trace.stop()
+            self.trace = None
+            print(f"Stopped recording timing traces to {self.trace_path}")
+
+    def show_trace_summary(self):
+        """Show the per-operation timing table of the session trace, or of a trace file to pick."""
+        trace_path = self.trace_path
+        if not os.path.exists(trace_path):
+            os.makedirs(tracing.DEFAULT_TRACE_DIR, exist_ok=True)
+            trace_path, _ = QFileDialog.getOpenFileName(
+                self, "Select Trace File", tracing.DEFAULT_TRACE_DIR, "Trace files (*.jsonl)"
+            )
+            if not trace_path:
+                return
+        try:
+            rows = tracing.summarize(tracing.load(trace_path))
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not read {trace_path}: {e}")
+            return
+        if not rows:
+            QMessageBox.information(self, "Trace Summary", "The trace has no finished operations yet.")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f"Trace Summary - {os.path.basename(trace_path)}")
+        dialog.resize(1000, 400)
+        layout = QVBoxLayout()
+        headers = [
+            "Span", "Count", "Wall (s)", "Read (MB)", "Written (MB)", "MB/s", "I/O %", "Decode %", "Encode %",
+            "Compute %", "Peak RSS (MiB)", "Bound By", "Slowest File",
+        ]
+        table = QTableWidget(len(rows), len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for row_index, row in enumerate(rows):
+            shares = tracing.phase_shares(row)
+            values = [
+                row["name"] + (f" ({row['errors']} failed)" if row["errors"] else ""),
+                str(row["count"]),
+                f"{row['wall_seconds']:.2f}",
+                f"{row['bytes_read'] / 1e6:.1f}",
+                f"{row['bytes_written'] / 1e6:.1f}",
+                f"{row['mb_per_second']:.0f}" if row["mb_per_second"] is not None else "-",
+            ] + [f"{shares[phase]:.0%}" for phase in tracing.PHASES + ("compute",)] + [
+                f"{row['peak_rss_bytes'] / 2**20:.0f}" if row["peak_rss_bytes"] else "-",
+                row["bound"] or "-",
+                os.path.basename(row["slowest_file"]) if row["slowest_file"] else "-",
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == len(values) - 1 and row["slowest_file"]:
+                    item.setToolTip(f"{row['slowest_file']} ({row['slowest_seconds']:.2f}s)")
+                table.setItem(row_index, column, item)
+        table.resizeColumnsToContents()
+        layout.addWidget(QLabel(
+            "Time per operation, split into reading files (I/O), decoding, encoding and computing. "
+            f"Trace file: {trace_path}"
+        ))
+        layout.addWidget(table)
+        dialog.setLayout(layout)
+        dialog.exec_()
+
     def select_folder(self):
         """Open a file dialog to select the input folder."""
         print("Opening folder selection dialog...")  # Debug print
@@ -212,66 +801,38 @@ class NNUnetGUI(QMainWindow):
         if not self.input_folder_path:
             QMessageBox.warning(self, "Invalid Input", "Please select an input folder!")
             return
-
         try:
-            print(f"Creating folder structure for dataset {self.dataset_id}_{self.dataset_name}...")  # Debug print
-            self.create_folder_structure(self.input_folder_path, self.validate_dataset_id, self.dataset_name)
-            QMessageBox.information(self, "Success", "Folder structure created successfully!")
-            print("Folder structure created successfully!")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error occurred: {str(e)}")
-            print(f"Exception occurred: {str(e)}")
-
-    def create_folder_structure(self, input_folder, dataset_id, dataset_name):
-        """Create the nnUNet folder structure."""
-        print("Starting folder creation...")  # Debug print
-        # Destination folder
-        base_path = f"Z:/zhonghui-wen/nnUNet_raw/Dataset{self.dataset_id}_{self.dataset_name}"
-        imagesTr_path = os.path.join(base_path, "imagesTr")
-        imagesTs_path = os.path.join(base_path, "imagesTs")
-        labelsTr_path = os.path.join(base_path, "labelsTr")
-
-        # Create directories
-        os.makedirs(imagesTr_path, exist_ok=True)
-        os.makedirs(imagesTs_path, exist_ok=True)
-        os.makedirs(labelsTr_path, exist_ok=True)
-        print(f"Directories created at: {base_path}")  # Debug print
-
-        # Copy files and generate JSON
-        for root, dirs, files in os.walk(input_folder):
-            for file in files:
-                if file.endswith(".tif"):
-                    src_file = os.path.join(root, file)
-                    rel_dir = os.path.relpath(root, input_folder)
-                    print(f"Processing file: {src_file} in {rel_dir}")  # Debug print
-
-                    if rel_dir == "imagesTr":
-                        dest_file = os.path.join(imagesTr_path, file.replace(".tif", "_0000.tif"))
-                        shutil.copy(src_file, dest_file)
-                        self.create_json(os.path.join(imagesTr_path, file))
-
-                    elif rel_dir == "imagesTs":
-                        dest_file = os.path.join(imagesTs_path, file.replace(".tif", "_0000.tif"))
-                        shutil.copy(src_file, dest_file)
-                        self.create_json(os.path.join(imagesTs_path, file))
-
-                    elif rel_dir == "labelsTr":
-                        dest_file = os.path.join(labelsTr_path, file)
-                        shutil.copy(src_file, dest_file)
-                        self.create_json(dest_file)
-
-    def create_json(self, file_path):
-        """Generate a JSON file with spacing metadata."""
-        json_content = {"spacing": [1, 1, 1]}
-        json_file_path = file_path.replace(".tif", ".json")
-        print(f"Creating JSON file: {json_file_path}")  # Debug print
-        with open(json_file_path, "w") as json_file:
-            json.dump(json_content, json_file, indent=4)
+            import_workers = int(self.input_import_workers.text())
+            if import_workers <= 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Invalid Input", "Concurrent transfers must be a positive integer.")
+            return
+
+        print(f"Creating folder structure for dataset {self.dataset_id}_{self.dataset_name}...")  # Debug print
+        self.start_job(
+            f"Create Dataset{self.dataset_id}_{self.dataset_name}", "files",
+            nnunet_tools.create_folder_structure, self.input_folder_path, self.dataset_id, self.dataset_name,
+            mode=self.combo_import_mode.currentText(), max_workers=import_workers,
+            on_success=lambda base_path: QMessageBox.information(self, "Success", "Folder structure created successfully!"),
+        )
 
     def generate_dataset_json_dialog(self):
-        """Open a dialog to input label names and generate dataset.json."""
+        """Take the label census of the dataset, then open a dialog to name the labels."""
         print("Starting dataset.json generation...")
-        labels = self.analyze_labels()
+        base_path = nnunet_tools.dataset_folder(self.dataset_id, self.dataset_name)
+        if not self.dataset_id or not os.path.isdir(os.path.join(base_path, "labelsTr")):
+            QMessageBox.warning(self, "Error", "Please create the folder structure first!")
+            return
+
+        self.start_job(
+            f"Label census of {os.path.basename(base_path)}", "files",
+            dataset_validation.validate_dataset, base_path, on_success=self.show_dataset_json_dialog,
+        )
+
+    def show_dataset_json_dialog(self, report):
+        """Open a dialog to name the labels of a validation report's census and write dataset.json."""
+        labels = report.labels
         if not labels:
             QMessageBox.warning(self, "Error", "No labels found in labelsTr folder!")
             return
@@ -282,16 +843,26 @@ class NNUnetGUI(QMainWindow):
 
         # Ensure background (0) is added automatically
         label_widgets = {}
-        for idx, label_value in enumerate(sorted(labels)):
+        for idx, label_value in enumerate(labels):
             label_name = "background" if label_value == 0 else ""
-            layout.addWidget(QLabel(f"Label {label_value}:"), idx, 0)
+            layout.addWidget(QLabel(
+                f"Label {label_value} ({report.label_counts[label_value]:,} voxels in "
+                f"{report.label_files[label_value]} files):"
+            ), idx, 0)
             input_field = QLineEdit(label_name)
             input_field.setReadOnly(label_value == 0)  # Background is predefined
             layout.addWidget(input_field, idx, 1)
             label_widgets[label_value] = input_field
 
+        row = len(labels)
+        if not report.ok:
+            btn_report = QPushButton(f"{len(report.errors)} dataset problem(s) found - show report")
+            btn_report.clicked.connect(lambda: self.confirm_validation_report(report, allow_continue=False))
+            layout.addWidget(btn_report, row, 0, 1, 2)
+            row += 1
+
         btn_generate = QPushButton("Generate")
-        layout.addWidget(btn_generate, len(labels), 0, 1, 2)
+        layout.addWidget(btn_generate, row, 0, 1, 2)
 
         def generate_dataset_json():
             print("Generating dataset.json...")
@@ -301,50 +872,47 @@ class NNUnetGUI(QMainWindow):
                 if label_name and label_name not in label_dict:
                     label_dict[label_name] = int(label_value)  # Ensure values are integers
 
-            dataset_json_content = {
-                "channel_names": {"0": "Tomo"},
-                "labels": label_dict,
-                "numTraining": len(os.listdir(os.path.join(self.input_folder_path, "imagesTr"))),
-                "file_ending": ".tif",
-            }
-
-            base_path = f"Z:/zhonghui-wen/nnUNet_raw/Dataset{self.dataset_id}_{self.dataset_name}"
-            json_path = os.path.join(base_path, "dataset.json")
-            with open(json_path, "w") as json_file:
-                json.dump(dataset_json_content, json_file, indent=4)
-
-            print(f"dataset.json created at {json_path}")
+            nnunet_tools.generate_dataset_json(report.dataset_dir, label_dict, num_training=report.num_cases)
             dialog.accept()
 
         btn_generate.clicked.connect(generate_dataset_json)
         dialog.setLayout(layout)
         dialog.exec_()
 
-    def analyze_labels(self):
-        """Analyze labels from a random labelsTr file."""
-        labels_tr_path = os.path.join(self.input_folder_path, "labelsTr")
-        if not os.path.exists(labels_tr_path):
-            return None
-
-        label_files = [f for f in os.listdir(labels_tr_path) if f.endswith(".tif")]
-        if not label_files:
-            return None
+    def validate_datasets(self, dataset_dirs, on_valid):
+        """
+        Validate datasets one after another in the background, then call on_valid().
 
-        random_file = os.path.join(labels_tr_path, label_files[0])
-        try:
-            with Image.open(random_file) as img:
-                label_values = np.unique(np.array(img))
-                return list(map(int, label_values))  # Convert to standard Python int
-        except Exception as e:
-            print(f"Error reading label file: {e}")
-            return None
+        If a dataset has problems its report is shown, and the remaining
+        datasets are only checked if the user chooses to continue.
+        """
+        if not dataset_dirs:
+            on_valid()
+            return
 
-    def create_json(self, file_path):
-        """Generate a JSON file with spacing metadata."""
-        json_content = {"spacing": [1, 1, 1]}
-        json_file_path = file_path.replace(".tif", ".json")
-        with open(json_file_path, "w") as json_file:
-            json.dump(json_content, json_file, indent=4)
+        def checked(report):
+            if report.ok or self.confirm_validation_report(report):
+                self.validate_datasets(dataset_dirs[1:], on_valid)
+
+        self.start_job(
+            f"Validate {os.path.basename(dataset_dirs[0])}", "files",
+            dataset_validation.validate_dataset, dataset_dirs[0], on_success=checked,
+        )
+
+    def confirm_validation_report(self, report, allow_continue=True):
+        """Show the problems of a validation report; returns True if the user continues anyway."""
+        box = QMessageBox(self)
+        box.setIcon(QMessageBox.Warning)
+        box.setWindowTitle("Dataset Problems")
+        box.setText(
+            f"{os.path.basename(report.dataset_dir)} has {len(report.errors)} problem(s) that make "
+            f"nnUNet's dataset integrity check fail:\n\n" + "\n".join(report.errors[:10])
+        )
+        box.setDetailedText(report.format())
+        continue_button = box.addButton("Continue Anyway", QMessageBox.AcceptRole) if allow_continue else None
+        box.addButton(QMessageBox.Cancel if allow_continue else QMessageBox.Ok)
+        box.exec_()
+        return continue_button is not None and box.clickedButton() is continue_button
 
     def run_nnunet_plan_preprocess(self):
         """Run the nnUNetv2 planning and preprocessing command."""
@@ -352,9 +920,37 @@ class NNUnetGUI(QMainWindow):
         if not dataset_ids:
             return
 
-        command = f"nnUNetv2_plan_and_preprocess -d {' '.join(dataset_ids)} --verify_dataset_integrity"
-        print(f"Executing command: {command}")
-        os.system(command)  # Execute command in the console
+        try:
+            dataset_dirs = [nnunet_tools.find_dataset_folder(dataset_id) for dataset_id in dataset_ids]
+        except FileNotFoundError as e:
+            QMessageBox.warning(self, "Dataset Not Found", str(e))
+            return
+
+        try:
+            num_processes = [int(count) for count in self.input_plan_np.text().split()] or None
+            npfp_text = self.input_plan_npfp.text().strip()
+            num_processes_fingerprint = int(npfp_text) if npfp_text else None
+            max_concurrent = int(self.input_plan_concurrent.text())
+            if max_concurrent <= 0:
+                raise ValueError("The number of datasets planned at the same time must be a positive integer.")
+            # One job per dataset, so datasets can run in parallel and be retried on their own
+            commands = {
+                dataset_id: nnunet_tools.plan_and_preprocess_command(
+                    [dataset_id], num_processes, num_processes_fingerprint
+                )
+                for dataset_id in dataset_ids
+            }
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Input", str(e))
+            return
+
+        def queue_jobs():
+            self.runner.set_max_concurrent(max_concurrent)
+            for dataset_id, command in commands.items():
+                self.submit_command(f"plan_{dataset_id}", f"Plan and preprocess {dataset_id}", command)
+
+        # Catch missing pairs, shape mismatches and stray labels before nnUNet spends hours on them
+        self.validate_datasets(dataset_dirs, queue_jobs)
 
     def change_tif_colors_folder(self):
         """Change color values for all TIF files in a folder."""
@@ -363,91 +959,83 @@ class NNUnetGUI(QMainWindow):
             QMessageBox.warning(self, "No Folder Selected", "Please select a folder.")
             return
 
-        # Detect all unique values in the folder
-        try:
-            unique_values = self.get_unique_values_in_folder(folder)
-            if not unique_values:
-                QMessageBox.warning(self, "No Data", "No valid TIF files found in the folder.")
-                return
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error reading TIF files: {e}")
+        # Detect all unique values in the folder in the background; files scanned before come from the cache
+        self.start_job(
+            f"Label values of {os.path.basename(folder)}", "files",
+            nnunet_tools.scan_label_values, folder,
+            on_success=lambda unique_values: self.show_color_change_dialog(folder, unique_values),
+        )
+
+    def show_color_change_dialog(self, folder, unique_values):
+        """Open a dialog to map the values found in a folder to new ones and relabel its files."""
+        if not unique_values:
+            QMessageBox.warning(self, "No Data", "No valid TIF files found in the folder.")
             return
 
-        # Pop-up window to select values
+        # Pop-up window to map every value to a new one
         dialog = QDialog(self)
         dialog.setWindowTitle("Change TIF File Colors")
         layout = QGridLayout()
 
-        layout.addWidget(QLabel("Select Value to Change:"), 0, 0)
-        dropdown_old_value = QComboBox()
-        dropdown_old_value.addItems([str(v) for v in unique_values])
-        layout.addWidget(dropdown_old_value, 0, 1)
-
-        layout.addWidget(QLabel("Enter New Value:"), 1, 0)
-        input_new_value = QLineEdit()
-        layout.addWidget(input_new_value, 1, 1)
+        layout.addWidget(QLabel("Enter new values (leave blank to keep a value):"), 0, 0, 1, 2)
+        value_inputs = {}
+        values_widget = QWidget()
+        values_layout = QGridLayout(values_widget)
+        for idx, value in enumerate(unique_values):
+            values_layout.addWidget(QLabel(f"Value {value}:"), idx, 0)
+            input_new_value = QLineEdit()
+            input_new_value.setPlaceholderText(str(value))
+            values_layout.addWidget(input_new_value, idx, 1)
+            value_inputs[int(value)] = input_new_value
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setWidget(values_widget)
+        layout.addWidget(scroll_area, 1, 0, 1, 2)
+
+        layout.addWidget(QLabel("Worker Processes:"), 2, 0)
+        input_workers = QLineEdit(str(os.cpu_count() or 1))
+        layout.addWidget(input_workers, 2, 1)
 
         btn_process = QPushButton("Process")
-        layout.addWidget(btn_process, 2, 0, 1, 2)
+        layout.addWidget(btn_process, 3, 0, 1, 2)
 
         dialog.setLayout(layout)
 
         def process_color_change():
-            # Validate new value input
+            # Validate new value inputs
             try:
-                old_value = int(dropdown_old_value.currentText())
-                new_value = int(input_new_value.text())
+                mapping = {
+                    old_value: int(widget.text())
+                    for old_value, widget in value_inputs.items()
+                    if widget.text().strip()
+                }
+                workers = int(input_workers.text())
             except ValueError:
-                QMessageBox.warning(dialog, "Invalid Input", "Please enter a valid integer for the new value.")
+                QMessageBox.warning(dialog, "Invalid Input", "Please enter valid integers for the new values and workers.")
+                return
+            if workers <= 0:
+                QMessageBox.warning(dialog, "Invalid Input", "Worker count must be a positive integer.")
                 return
 
-            # Perform the color change on all files in the folder
-            try:
-                for fname in os.listdir(folder):
-                    filepath = os.path.join(folder, fname)
-                    if os.path.isfile(filepath) and fname.endswith(".tif"):
-                        print(f"Processing file: {fname}")
-                        self.change_color_in_tif(filepath, old_value, new_value)
-                QMessageBox.information(dialog, "Success", "Color values updated successfully.")
-                dialog.accept()
-            except Exception as e:
-                QMessageBox.critical(dialog, "Error", f"Failed to process files: {e}")
+            # Apply the whole mapping to all files in the folder in one pass
+            filepaths = [
+                os.path.join(folder, fname) for fname in os.listdir(folder)
+                if os.path.isfile(os.path.join(folder, fname)) and fname.endswith(".tif")
+            ]
+            self.start_job(
+                f"Change colors in {os.path.basename(folder)}", "files",
+                nnunet_tools.relabel_tif_files, filepaths, mapping, max_workers=workers,
+                output_options=self.output_options(),
+                on_success=lambda changed_files: QMessageBox.information(
+                    self, "Success", f"Color values updated successfully in {len(changed_files)} file(s)."),
+            )
+            dialog.accept()
 
         btn_process.clicked.connect(process_color_change)
         dialog.exec_()
 
-    def get_unique_values_in_folder(self, folder):
-        """Get unique pixel values across all TIF files in a folder."""
-        unique_values = set()
-        for fname in os.listdir(folder):
-            filepath = os.path.join(folder, fname)
-            if os.path.isfile(filepath) and fname.endswith(".tif"):
-                with Image.open(filepath) as img:
-                    for i in range(img.n_frames):
-                        img.seek(i)
-                        frame_data = np.array(img)
-                        unique_values.update(np.unique(frame_data))
-        return sorted(unique_values)
-
-    def change_color_in_tif(self, filepath, old_value, new_value):
-        """Change a specific color value in all frames of a TIF file."""
-        with Image.open(filepath) as img:
-            frames = []
-            for i in range(img.n_frames):
-                img.seek(i)
-                frame_data = np.array(img)
-                frame_data[frame_data == old_value] = new_value
-                frames.append(frame_data)
-
-            # Save the updated file
-            output_file = filepath  # Overwrite the original file
-            io.imsave(output_file, np.stack(frames).astype(np.uint8))
-
-
-
-
     def cut_tif_file(self):
-        """Cut a TIF stack into smaller pieces based on nnUNet-style user input."""
+        """Cut a TIF stack into equal parts or overlapping tiles based on nnUNet-style user input."""
         file, _ = QFileDialog.getOpenFileName(self, "Select TIF File", "", "TIF Files (*.tif)")
         if not file:
             QMessageBox.warning(self, "No File Selected", "Please select a TIF file.")
@@ -458,22 +1046,93 @@ class NNUnetGUI(QMainWindow):
         dialog.setWindowTitle("Cut TIF Stack")
         layout = QGridLayout()
 
-        layout.addWidget(QLabel("Enter divisions for x and y axes (e.g., 2x2 for 1 cut per axis):"), 0, 0, 1, 2)
+        layout.addWidget(QLabel("Mode:"), 0, 0)
+        combo_mode = QComboBox()
+        combo_mode.addItems(["Equal divisions", "Overlapping tiles"])
+        layout.addWidget(combo_mode, 0, 1)
+
+        layout.addWidget(QLabel("Enter divisions for x and y axes (e.g., 2x2 for 1 cut per axis):"), 1, 0, 1, 2)
 
-        layout.addWidget(QLabel("X Divisions:"), 1, 0)
+        layout.addWidget(QLabel("X Divisions:"), 2, 0)
         input_x = QLineEdit()
-        layout.addWidget(input_x, 1, 1)
+        layout.addWidget(input_x, 2, 1)
 
-        layout.addWidget(QLabel("Y Divisions:"), 2, 0)
+        layout.addWidget(QLabel("Y Divisions:"), 3, 0)
         input_y = QLineEdit()
-        layout.addWidget(input_y, 2, 1)
+        layout.addWidget(input_y, 3, 1)
+
+        layout.addWidget(QLabel("Tile size (e.g., 256 or 192x160):"), 4, 0)
+        input_tile = QLineEdit()
+        layout.addWidget(input_tile, 4, 1)
+
+        btn_plans = QPushButton("Use patch size from nnUNetPlans.json...")
+        layout.addWidget(btn_plans, 5, 1)
+
+        layout.addWidget(QLabel("Overlap (pixels):"), 6, 0)
+        input_overlap = QLineEdit("0")
+        layout.addWidget(input_overlap, 6, 1)
 
+        check_pad = QCheckBox("Zero-pad edge tiles instead of moving them inwards")
+        layout.addWidget(check_pad, 7, 0, 1, 2)
+
+        btn_preview = QPushButton("Preview...")
+        layout.addWidget(btn_preview, 8, 0)
         btn_process = QPushButton("Process")
-        layout.addWidget(btn_process, 3, 0, 1, 2)
+        layout.addWidget(btn_process, 8, 1)
 
         dialog.setLayout(layout)
 
+        def update_mode():
+            tiles = combo_mode.currentIndex() == 1
+            for widget in (input_x, input_y):
+                widget.setEnabled(not tiles)
+            for widget in (input_tile, btn_plans, input_overlap, check_pad):
+                widget.setEnabled(tiles)
+
+        def load_plans():
+            plans_file, _ = QFileDialog.getOpenFileName(dialog, "Select nnUNetPlans.json", "", "JSON Files (*.json)")
+            if not plans_file:
+                return
+            try:
+                with open(plans_file, "r") as f:
+                    configurations = list(json.load(f).get("configurations", {}))
+                if not configurations:
+                    raise KeyError(f"{plans_file} has no configurations.")
+                default = configurations.index("3d_fullres") if "3d_fullres" in configurations else 0
+                configuration, ok = QInputDialog.getItem(
+                    dialog, "nnUNet Configuration", "Configuration:", configurations, default, False
+                )
+                if not ok:
+                    return
+                tile_height, tile_width = nnunet_tools.read_plans_patch_size(plans_file, configuration)
+            except (OSError, ValueError, KeyError) as e:
+                QMessageBox.warning(dialog, "Invalid Plans", str(e))
+                return
+            input_tile.setText(f"{tile_height}x{tile_width}")
+
+        def preview():
+            """Show the stack with the outlines of the parts the current settings would write."""
+            try:
+                preview_dialog = PreviewDialog(dialog, file)
+            except Exception as e:
+                QMessageBox.critical(dialog, "Error", f"Could not open {file}: {e}")
+                return
+            try:
+                if combo_mode.currentIndex() == 1:
+                    tile_size = [int(size) for size in (input_tile.text() or "256").lower().split("x")]
+                    preview_dialog.set_grid(
+                        "Overlapping tiles", tile_size=(tile_size[0], tile_size[-1]), overlap=int(input_overlap.text() or 0)
+                    )
+                else:
+                    preview_dialog.set_grid("Equal divisions", int(input_x.text() or 1), int(input_y.text() or 1))
+            except ValueError:
+                pass  # Keep the default grid for input that is not filled in yet
+            preview_dialog.exec_()
+
         def process_cut():
+            if combo_mode.currentIndex() == 1:
+                process_tiles()
+                return
             try:
                 x_divisions = int(input_x.text()) if input_x.text() else 1
                 y_divisions = int(input_y.text()) if input_y.text() else 1
@@ -488,17 +1147,106 @@ class NNUnetGUI(QMainWindow):
             x_cuts = x_divisions - 1
             y_cuts = y_divisions - 1
 
+            self.start_job(
+                f"Cut {os.path.basename(file)} into {x_divisions}x{y_divisions}", "frames",
+                nnunet_tools.cut_tiff_into_parts, file, x_cuts, y_cuts, output_options=self.output_options(),
+                on_success=lambda save_dir: QMessageBox.information(self, "Success", "TIF file successfully cut into parts."),
+            )
+            dialog.accept()
+
+        def process_tiles():
             try:
-                cut_tiff_into_parts(file, x_cuts, y_cuts)
-                QMessageBox.information(dialog, "Success", "TIF file successfully cut into parts.")
-                dialog.accept()
-            except ValueError as ve:
-                QMessageBox.warning(dialog, "Invalid Cuts", str(ve))
-            except Exception as e:
-                QMessageBox.critical(dialog, "Error", f"Failed to cut TIF file: {e}")
+                tile_size = [int(size) for size in input_tile.text().lower().split("x")]
+                overlap = int(input_overlap.text() or 0)
+            except ValueError:
+                QMessageBox.warning(dialog, "Invalid Input", "Please enter the tile size as 256 or 192x160 and an integer overlap.")
+                return
+            try:
+                with nnunet_tools.TiffStackReader(file) as reader:
+                    num_tiles = len(nnunet_tools.tile_grid(*reader.frame_shape[:2], tile_size, overlap, check_pad.isChecked()))
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(dialog, "Invalid Input", str(e))
+                return
 
+            self.start_job(
+                f"Tile {os.path.basename(file)} into {num_tiles} tiles", "frames",
+                nnunet_tools.tile_tiff, file, tile_size, overlap=overlap, pad=check_pad.isChecked(),
+                output_options=self.output_options(),
+                on_success=lambda index_path: QMessageBox.information(
+                    self, "Success", f"TIF file successfully split into {num_tiles} tiles.\nIndex: {index_path}"
+                ),
+            )
+            dialog.accept()
+
+        combo_mode.currentIndexChanged.connect(update_mode)
+        btn_plans.clicked.connect(load_plans)
+        btn_preview.clicked.connect(preview)
         btn_process.clicked.connect(process_cut)
+        update_mode()
         dialog.exec_()
+
+    def preview_tif_stack(self):
+        """Browse the slices of a TIF stack, optionally with a label overlay and a cut grid."""
+        file, _ = QFileDialog.getOpenFileName(self, "Select TIF File", "", "TIF Files (*.tif)")
+        if not file:
+            return
+        try:
+            dialog = PreviewDialog(self, file)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Could not open {file}: {e}")
+            return
+        dialog.exec_()
+
+    def stitch_tiles(self):
+        """Reassemble cut or tiled stacks, e.g. nnUNet predictions on the tiles, into one stack."""
+        index_file, _ = QFileDialog.getOpenFileName(
+            self, "Select Tile Index or Tile", "", "Tile Index (*_tiles.json);;TIF Tiles (*.tif)"
+        )
+        if not index_file:
+            QMessageBox.warning(self, "No File Selected", "Please select a tile index or a tile.")
+            return
+        tiles = os.path.dirname(index_file) if index_file.endswith(".tif") else index_file
+
+        tiles_dir = QFileDialog.getExistingDirectory(
+            self, "Select Folder with the Tiles to Stitch (Cancel: same folder)", os.path.dirname(index_file)
+        )
+        blend, ok = QInputDialog.getItem(
+            self, "Blend Mode", "Merge overlapping tiles by (center keeps label values):",
+            list(nnunet_tools.BLEND_MODES), 0, False,
+        )
+        if not ok:
+            return
+        output_file, _ = QFileDialog.getSaveFileName(self, "Save Stitched Stack", "", "TIF Files (*.tif)")
+        if not output_file:
+            return
+
+        self.start_job(
+            f"Stitch {os.path.basename(index_file)}", "frames",
+            nnunet_tools.stitch_tiles, tiles, output_file, tiles_dir=tiles_dir or None, blend=blend,
+            output_options=self.output_options(),
+            on_success=lambda path: QMessageBox.information(self, "Success", f"Tiles stitched into {path}."),
+        )
+
+    def convert_stacks(self):
+        """Convert TIF stacks to OME-Zarr stores, or a Zarr store back to a TIF stack."""
+        directions = ["TIF files to OME-Zarr", "Zarr store to TIF"]
+        direction, ok = QInputDialog.getItem(self, "Convert", "Convert:", directions, 0, False)
+        if not ok:
+            return
+        if direction == directions[0]:
+            inputs, _ = QFileDialog.getOpenFileNames(self, "Select TIF Files", "", "TIF Files (*.tif)")
+        else:
+            store = QFileDialog.getExistingDirectory(self, "Select Zarr Store (*.zarr Folder)")
+            inputs = [store] if store else []
+            if store and not store.endswith(".zarr"):
+                QMessageBox.warning(self, "Not a Zarr Store", "Please select a folder ending in .zarr.")
+                return
+        for input_path in inputs:
+            self.start_job(
+                f"Convert {os.path.basename(input_path)}", "frames",
+                nnunet_tools.convert_stack, input_path, output_options=self.output_options(),
+            )
+
     def combine_labels(self):
         """Combine multiple TIFF files into a single labeled TIFF."""
         files, _ = QFileDialog.getOpenFileNames(self, "Select TIFF Files", "", "TIFF Files (*.tif)")
@@ -517,33 +1265,38 @@ class NNUnetGUI(QMainWindow):
             layout.addWidget(label_input, idx, 1)
             labels[file] = label_input
 
+        layout.addWidget(QLabel("Foreground Threshold (values >= threshold):"), len(files), 0)
+        input_threshold = QLineEdit("255")
+        layout.addWidget(input_threshold, len(files), 1)
+
+        layout.addWidget(QLabel("Overlap Priority:"), len(files) + 1, 0)
+        combo_priority = QComboBox()
+        combo_priority.addItems(nnunet_tools.COMBINE_PRIORITIES)
+        layout.addWidget(combo_priority, len(files) + 1, 1)
+
         btn_process = QPushButton("Combine")
-        layout.addWidget(btn_process, len(files), 0, 1, 2)
+        layout.addWidget(btn_process, len(files) + 2, 0, 1, 2)
         dialog.setLayout(layout)
 
         def process_combine():
             try:
-                combined = None
-                for file, label_input in labels.items():
-                    label_value = int(label_input.text())
-                    data = tiff.imread(file)
-                    if combined is None:
-                        combined = np.zeros_like(data, dtype=np.uint8)
-
-                    combined[data == 255] = label_value
+                label_files = {file: int(label_input.text()) for file, label_input in labels.items()}
+                threshold = int(input_threshold.text())
 
                 output_file = QFileDialog.getSaveFileName(self, "Save Combined TIFF", "", "TIFF Files (*.tif)")[0]
                 if not output_file:
                     return
 
-                tiff.imwrite(output_file, combined)
-                QMessageBox.information(dialog, "Success", f"Combined TIFF saved at {output_file}")
-                print(f"Combined TIFF saved at {output_file}")
+                self.start_job(
+                    f"Combine {len(label_files)} labels", "frames",
+                    nnunet_tools.combine_labels, label_files, output_file,
+                    threshold=threshold, priority=combo_priority.currentText(),
+                    output_options=self.output_options(),
+                    on_success=lambda path: QMessageBox.information(self, "Success", f"Combined TIFF saved at {path}"),
+                )
                 dialog.accept()
             except ValueError:
-                QMessageBox.warning(dialog, "Invalid Input", "Please enter valid integers for all labels.")
-            except Exception as e:
-                QMessageBox.critical(dialog, "Error", f"Failed to combine labels: {e}")
+                QMessageBox.warning(dialog, "Invalid Input", "Please enter valid integers for all labels and the threshold.")
 
         btn_process.clicked.connect(process_combine)
         dialog.exec_()
@@ -571,8 +1324,15 @@ class NNUnetGUI(QMainWindow):
         input_size = QLineEdit()
         layout.addWidget(input_size, 2, 1)
 
+        layout.addWidget(QLabel("Stride (optional, < size overlaps):"), 3, 0)
+        input_stride = QLineEdit()
+        layout.addWidget(input_stride, 3, 1)
+
+        check_partial = QCheckBox("Keep trailing partial substack")
+        layout.addWidget(check_partial, 4, 0, 1, 2)
+
         btn_process = QPushButton("Generate Substacks")
-        layout.addWidget(btn_process, 3, 0, 1, 2)
+        layout.addWidget(btn_process, 5, 0, 1, 2)
         dialog.setLayout(layout)
 
         def process_substacks():
@@ -580,36 +1340,23 @@ class NNUnetGUI(QMainWindow):
                 start_frame = int(input_start.text())
                 end_frame = int(input_end.text())
                 substack_size = int(input_size.text())
+                stride = int(input_stride.text()) if input_stride.text().strip() else None
 
                 output_dir = QFileDialog.getExistingDirectory(self, "Select Output Directory")
                 if not output_dir:
                     return
 
-                with tiff.TiffFile(file) as tif:
-                    frames = tif.asarray()
-
-                if start_frame < 0 or end_frame >= frames.shape[0]:
-                    raise ValueError("Start or end frame is out of bounds.")
-
-                frames_to_process = frames[start_frame:end_frame + 1]
-
-                substack_count = 0
-                for i in range(0, len(frames_to_process), substack_size):
-                    substack = frames_to_process[i:i + substack_size]
-                    if len(substack) == substack_size:
-                        substack_start = start_frame + i
-                        substack_end = substack_start + substack_size - 1
-                        output_path = os.path.join(output_dir, f"substack_{substack_start}_{substack_end}.tif")
-                        tiff.imwrite(output_path, substack)
-                        substack_count += 1
-
-                QMessageBox.information(dialog, "Success", f"Successfully created {substack_count} substacks.")
-                print(f"Successfully created {substack_count} substacks in '{output_dir}'.")
+                self.start_job(
+                    f"Substacks of {os.path.basename(file)}", "substacks",
+                    nnunet_tools.create_substacks, file, output_dir, start_frame, end_frame, substack_size,
+                    stride=stride, include_partial=check_partial.isChecked(),
+                    output_options=self.output_options(),
+                    on_success=lambda substack_count: QMessageBox.information(
+                        self, "Success", f"Successfully created {substack_count} substacks."),
+                )
                 dialog.accept()
             except ValueError as ve:
                 QMessageBox.warning(dialog, "Invalid Input", str(ve))
-            except Exception as e:
-                QMessageBox.critical(dialog, "Error", f"Failed to create substacks: {e}")
 
         btn_process.clicked.connect(process_substacks)
         dialog.exec_()
@@ -620,3 +1367,4 @@ if __name__ == "__main__":
     window = NNUnetGUI()
     window.show()
     app.exec_()
+    window.runner.wait()
@@ -0,0 +1,568 @@
+"""
+Command-line interface for the nnUNet GUI tools.
+
+Every GUI operation can be run without a display, either directly:
+
+    python nnunet_cli.py create-dataset ./cute --id 003 --name cute
+    python nnunet_cli.py recolor ./labelsTr --map 255=1 --map 128=2 --workers 8
+    python nnunet_cli.py binarize probabilities.tif --output mask.tif --threshold 0.5
+    python nnunet_cli.py cut a.tif b.tif --x 2 --y 2
+    python nnunet_cli.py tile a.tif --plans nnUNetPlans.json --overlap 32
+    python nnunet_cli.py stitch a_tiles/a_tiles.json --tiles-dir ./predictions
+    python nnunet_cli.py convert a.tif b.tif --to ome.zarr --zarr-chunks 16 256 256
+    python nnunet_cli.py validate /data/nnUNet_raw/Dataset003_cute
+    python nnunet_cli.py plan 1 2 3 --max-concurrent 2 --np 4 --npfp 8
+    python nnunet_cli.py --trace run.jsonl recolor ./labelsTr --map 255=1
+    python nnunet_cli.py trace-summary run.jsonl
+
+or as a batch of jobs described in a YAML or JSON file:
+
+    python nnunet_cli.py run jobs.yaml
+
+A job file is a list of jobs (or a mapping with a "jobs" list). Each job names
+its operation and passes the remaining keys as arguments, e.g.
+
+    jobs:
+      - operation: create-dataset
+        input_folder: /data/cute
+        dataset_id: "003"
+        dataset_name: cute
+      - operation: dataset-json
+        dataset_dir: /data/nnUNet_raw/Dataset003_cute
+        labels: {mito: 1, membrane: 2}
+      - operation: cut
+        input_files: [/data/a.tif, /data/b.tif]
+        x_divisions: 2
+        y_divisions: 2
+        output: {compression: zstd, tile: 256}
+
+Operations that write TIF files (cut, tile, stitch, recolor, combine, binarize,
+substacks, convert) take an optional "output" mapping with the TiffOutputOptions of nnunet_tools
+(compression, level, predictor, tile, bigtiff, threads), or the matching
+--compression/--level/--predictor/--tile/--bigtiff/--encode-threads flags.
+
+Wherever a stack is expected, a Zarr or OME-Zarr store (a folder ending in
+.zarr) can be given instead of a TIF file if the zarr package is installed.
+Parts, tiles and substacks of a store are written as stores too; the "zarr"
+entry of "output" (chunks, compression, level) or --zarr-chunks and
+--zarr-compression set how they are chunked and compressed.
+
+create-dataset, recolor, cut and tile keep a manifest of the files they finished,
+so an interrupted run picks up where it stopped when started again. Pass
+--no-resume (or "resume: false" in a job) to process everything again.
+
+--trace FILE records a timing span per operation and per file into a
+JSON-lines file (see tracing.py) and prints where the time went when the run
+ends: reading, decoding, encoding or computing. --profile cprofile (or
+pyinstrument) also profiles the main thread and saves the profile next to the
+trace; trace-summary prints the table of an existing trace again.
+
+PyQt5 is never imported, so this starts quickly on cluster nodes.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import dataset_validation
+import nnunet_runner
+import nnunet_tools
+import tracing
+import zarr_storage
+
+
+def run_create_dataset(input_folder, dataset_id, dataset_name, raw_path=None, mode="copy", workers=8, resume=True):
+    """Create the nnUNet folder structure for one dataset."""
+    return nnunet_tools.create_folder_structure(
+        input_folder, str(dataset_id).zfill(3), dataset_name, raw_path, mode=mode, max_workers=workers, resume=resume
+    )
+
+
+def run_validate(dataset_dir, workers=None, report=None):
+    """Check a dataset before planning; raises if nnUNet's integrity check would fail."""
+    result = dataset_validation.validate_dataset(dataset_dir, max_workers=workers)
+    print(result.format())
+    if report:
+        result.save(report)
+    if not result.ok:
+        raise ValueError(f"{dataset_dir} has {len(result.errors)} problem(s).")
+    return result
+
+
+def run_dataset_json(dataset_dir, labels=None, num_training=None, workers=None):
+    """Write dataset.json; without labels, every value of the labelsTr census is called label_<value>."""
+    if labels is None or num_training is None:
+        census = dataset_validation.validate_dataset(dataset_dir, max_workers=workers)
+        for message in census.errors + census.warnings:
+            print(message)
+        if labels is None:
+            if not census.labels:
+                raise ValueError(f"No labels found in {os.path.join(dataset_dir, 'labelsTr')}")
+            labels = census.dataset_labels()
+        if num_training is None:
+            num_training = census.num_cases
+    return nnunet_tools.generate_dataset_json(dataset_dir, labels, num_training=num_training)
+
+
+def run_recolor(folder, mapping, workers=None, output=None, resume=True, dtype=None):
+    """Apply an old->new value mapping to every TIF file and Zarr store in a folder; `dtype` changes their data type."""
+    filepaths = [
+        os.path.join(folder, fname) for fname in sorted(os.listdir(folder))
+        if os.path.isfile(os.path.join(folder, fname)) and fname.endswith(".tif")
+        or os.path.isdir(os.path.join(folder, fname)) and zarr_storage.is_zarr_path(fname)
+    ]
+    return nnunet_tools.relabel_tif_files(
+        filepaths, mapping, max_workers=workers, output_options=nnunet_tools.TiffOutputOptions.from_dict(output),
+        resume=resume, out_dtype=dtype,
+    )
+
+
+def run_cut(input_files, x_divisions=1, y_divisions=1, output=None, resume=True):
+    """Cut one or more TIF stacks into x_divisions * y_divisions parts."""
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    if x_divisions <= 0 or y_divisions <= 0:
+        raise ValueError("Division numbers must be positive integers.")
+    output_options = nnunet_tools.TiffOutputOptions.from_dict(output)
+    return [
+        nnunet_tools.cut_tiff_into_parts(
+            file, x_divisions - 1, y_divisions - 1, output_options=output_options, resume=resume
+        )
+        for file in input_files
+    ]
+
+
+def run_tile(input_files, tile_size=None, overlap=0, pad=False, plans=None, configuration="3d_fullres",
+             output_dir=None, workers=None, output=None, resume=True):
+    """Split one or more TIF stacks into overlapping tiles; the tile size may come from nnUNetPlans.json."""
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    output_options = nnunet_tools.TiffOutputOptions.from_dict(output)
+    return [
+        nnunet_tools.tile_tiff(
+            file, tile_size, overlap=overlap, pad=pad, plans_file=plans, configuration=configuration,
+            output_dir=output_dir, max_workers=workers, output_options=output_options, resume=resume,
+        )
+        for file in input_files
+    ]
+
+
+def run_stitch(tiles, output_file=None, tiles_dir=None, blend=None, chunk_frames=None, workers=None, output=None):
+    """Reassemble tiles (a tile index or a folder of cut parts) into one stack."""
+    return nnunet_tools.stitch_tiles(
+        tiles, output_file, tiles_dir=tiles_dir, blend=blend, chunk_frames=chunk_frames, max_workers=workers,
+        output_options=nnunet_tools.TiffOutputOptions.from_dict(output),
+    )
+
+
+def run_combine(label_files, output_file, threshold=255, priority="last", dtype=None, workers=None, output=None):
+    """Combine binary masks (path -> label value) into one label TIFF."""
+    return nnunet_tools.combine_labels(
+        label_files, output_file, threshold=threshold, priority=priority, out_dtype=dtype, threads=workers,
+        output_options=nnunet_tools.TiffOutputOptions.from_dict(output),
+    )
+
+
+def run_binarize(input_file, output_file, threshold, foreground=1, dtype="uint8", workers=None, output=None):
+    """Threshold a stack, e.g. a probability map, into a binary label stack."""
+    return nnunet_tools.binarize_stack(
+        input_file, output_file, threshold, foreground=foreground, out_dtype=dtype, threads=workers,
+        output_options=nnunet_tools.TiffOutputOptions.from_dict(output),
+    )
+
+
+def run_substacks(input_file, output_dir, start_frame, end_frame, substack_size, stride=None,
+                  include_partial=False, workers=4, output=None):
+    """Split a frame range of a TIF stack into substacks."""
+    os.makedirs(output_dir, exist_ok=True)
+    return nnunet_tools.create_substacks(
+        input_file, output_dir, start_frame, end_frame, substack_size,
+        stride=stride, include_partial=include_partial, max_workers=workers,
+        output_options=nnunet_tools.TiffOutputOptions.from_dict(output),
+    )
+
+
+def run_convert(input_files, to=None, output_dir=None, output=None):
+    """Convert stacks between TIF and Zarr; `to` is "tif", "zarr" or "ome.zarr" (default: the other format)."""
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    output_options = nnunet_tools.TiffOutputOptions.from_dict(output)
+    outputs = []
+    for file in input_files:
+        output_path = None
+        if to is not None or output_dir is not None:
+            suffix = "." + to if to else (".tif" if zarr_storage.is_zarr_path(file) else zarr_storage.OME_ZARR_SUFFIX)
+            folder = output_dir or os.path.dirname(os.path.normpath(file))
+            output_path = os.path.join(folder, nnunet_tools.split_stack_name(file)[0] + suffix)
+        outputs.append(nnunet_tools.convert_stack(file, output_path, output_options=output_options))
+    return outputs
+
+
+def run_plan(dataset_ids, validate=True, raw_path=None, workers=None, num_processes=None,
+             num_processes_fingerprint=None, max_concurrent=1, retries=0, log_dir=None):
+    """
+    Run nnUNetv2_plan_and_preprocess as one queued job per dataset ID, validating the datasets first.
+
+    Each job's output is printed with its name and saved to a log file; wall
+    time and peak memory of every attempt are appended to jobs.jsonl in the
+    log folder.
+    """
+    if isinstance(dataset_ids, (int, str)):
+        dataset_ids = [dataset_ids]
+    if validate:
+        for dataset_id in dataset_ids:
+            run_validate(nnunet_tools.find_dataset_folder(dataset_id, raw_path), workers=workers)
+
+    commands = [
+        nnunet_tools.plan_and_preprocess_command([dataset_id], num_processes, num_processes_fingerprint)
+        for dataset_id in dataset_ids
+    ]
+    runner = nnunet_runner.JobRunner(
+        log_dir, max_concurrent, on_output=lambda job, line: print(f"[{job.name}] {line}", flush=True)
+    )
+    jobs = [
+        runner.submit(f"plan_{dataset_id}", command, max_retries=retries)
+        for dataset_id, command in zip(dataset_ids, commands)
+    ]
+    try:
+        runner.wait()
+    except KeyboardInterrupt:
+        runner.shutdown(cancel=True)
+        raise
+
+    for job in jobs:
+        wall = f"{job.wall_seconds:.0f}s" if job.wall_seconds is not None else "-"
+        print(f"{job.name}: {job.state} (exit code {job.exit_code}, {wall}, "
+              f"peak memory {nnunet_runner.format_memory(job.peak_rss_bytes)}, log {job.log_path})")
+    failed = [job.name for job in jobs if job.state != nnunet_runner.SUCCEEDED]
+    if failed:
+        raise RuntimeError(f"{', '.join(failed)} failed; see the logs in {runner.log_dir}")
+    return [job.to_dict() for job in jobs]
+
+
+def run_trace_summary(trace_file, json_output=None):
+    """Print the per-operation timing table of a trace recorded with --trace."""
+    rows = tracing.summarize(tracing.load(trace_file))
+    print(tracing.format_summary(rows))
+    if json_output:
+        with open(json_output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+OPERATIONS = {
+    "create-dataset": run_create_dataset,
+    "validate": run_validate,
+    "dataset-json": run_dataset_json,
+    "recolor": run_recolor,
+    "cut": run_cut,
+    "tile": run_tile,
+    "stitch": run_stitch,
+    "combine": run_combine,
+    "binarize": run_binarize,
+    "substacks": run_substacks,
+    "convert": run_convert,
+    "plan": run_plan,
+    "trace-summary": run_trace_summary,
+}
+
+
+def run_job(job):
+    """
+    Runs a single job.
+
+    Args:
+        job (dict): {"operation": <name>, **arguments}.
+
+    Returns:
+        The result of the operation.
+    """
+    job = dict(job)
+    operation = job.pop("operation", None)
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation {operation!r}; expected one of {', '.join(OPERATIONS)}")
+    return OPERATIONS[operation](**job)
+
+
+def load_jobs(job_file):
+    """Load a list of jobs from a YAML or JSON file."""
+    with open(job_file, "r") as f:
+        if job_file.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is required to read YAML job files (pip install pyyaml).")
+            content = yaml.safe_load(f)
+        else:
+            content = json.load(f)
+    jobs = content.get("jobs", []) if isinstance(content, dict) else content
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError(f"{job_file} must contain a list of jobs.")
+    return jobs
+
+
+def run_jobs(jobs, keep_going=False):
+    """
+    Runs jobs in order and prints a summary.
+
+    Args:
+        jobs (list): Jobs as accepted by run_job.
+        keep_going (bool): Continue with the remaining jobs after a failure.
+
+    Returns:
+        int: Number of failed jobs.
+    """
+    failures = 0
+    for index, job in enumerate(jobs, start=1):
+        operation = job.get("operation")
+        print(f"[{index}/{len(jobs)}] {operation}")
+        start_time = time.perf_counter()
+        try:
+            run_job(job)
+        except Exception as e:
+            failures += 1
+            print(f"[{index}/{len(jobs)}] {operation} failed: {e}", file=sys.stderr)
+            if not keep_going:
+                break
+        else:
+            print(f"[{index}/{len(jobs)}] {operation} done in {time.perf_counter() - start_time:.1f}s")
+    return failures
+
+
+def _parse_pairs(pairs, value_type=int):
+    """Parse KEY=VALUE strings; the key is split off at the last '='."""
+    parsed = {}
+    for pair in pairs:
+        key, sep, value = pair.rpartition("=")
+        if not sep or not key:
+            raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {pair!r}")
+        parsed[key] = value_type(value)
+    return parsed
+
+
+_OUTPUT_ARGUMENTS = ("compression", "level", "predictor", "tile", "bigtiff", "threads")
+
+LABEL_DTYPES = ("uint8", "uint16", "uint32", "int8", "int16", "int32")
+
+
+def _add_output_arguments(parser):
+    """Add the TIF output format options to a subcommand."""
+    group = parser.add_argument_group("output format")
+    group.add_argument("--compression", choices=nnunet_tools.TIFF_COMPRESSIONS, default=None,
+                       help="Compress written TIF files (default: none).")
+    group.add_argument("--level", type=int, default=None, help="Compression level for zlib/zstd.")
+    group.add_argument("--predictor", action="store_true", default=None,
+                       help="Difference pixels before compressing; helps intensity images.")
+    group.add_argument("--tile", type=int, default=None, metavar="PIXELS",
+                       help="Write tiled pages of PIXELS x PIXELS (multiple of 16).")
+    group.add_argument("--bigtiff", action="store_true", default=None,
+                       help="Always write BigTIFF (default: only when a file may exceed 4 GB).")
+    group.add_argument("--encode-threads", dest="threads", type=int, default=None,
+                       help="Threads compressing each page.")
+    group.add_argument("--zarr-chunks", type=int, nargs=3, default=None, metavar=("FRAMES", "ROWS", "COLUMNS"),
+                       help=f"Chunk size of Zarr outputs (default: {' '.join(map(str, zarr_storage.DEFAULT_CHUNKS))}).")
+    group.add_argument("--zarr-compression", choices=zarr_storage.ZARR_COMPRESSIONS, default=None,
+                       help="Compression of Zarr outputs (default: zstd).")
+
+
+def _pop_output_arguments(arguments):
+    """Move the output format options given on the command line into an "output" dict."""
+    output = {key: arguments.pop(key) for key in _OUTPUT_ARGUMENTS if key in arguments}
+    output = {key: value for key, value in output.items() if value is not None}
+    zarr_options = {"chunks": arguments.pop("zarr_chunks", None), "compression": arguments.pop("zarr_compression", None)}
+    zarr_options = {key: value for key, value in zarr_options.items() if value is not None}
+    if zarr_options:
+        output["zarr"] = zarr_options
+    if output:
+        arguments["output"] = output
+
+
+def _add_resume_argument(parser):
+    """Add --no-resume to a subcommand that keeps a manifest of finished files."""
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Ignore the manifest of an earlier run and process every file again.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless nnUNet dataset and TIF tools.")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="Record timing spans of the run into a JSON-lines file and print a summary.")
+    parser.add_argument("--profile", choices=tracing.PROFILERS, default=None,
+                        help="Also profile the main thread; the profile is saved next to the trace.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("run", help="Run a YAML/JSON job file.")
+    p.add_argument("job_files", nargs="+")
+    p.add_argument("--keep-going", action="store_true", help="Continue after a failed job.")
+
+    p = subparsers.add_parser("create-dataset", help="Create the nnUNet folder structure.")
+    p.add_argument("input_folder", help="Folder containing imagesTr/labelsTr/imagesTs.")
+    p.add_argument("--id", dest="dataset_id", required=True)
+    p.add_argument("--name", dest="dataset_name", required=True)
+    p.add_argument("--raw-path", default=None, help=f"nnUNet_raw folder (default: {nnunet_tools.NNUNET_RAW}).")
+    p.add_argument("--mode", choices=nnunet_tools.IMPORT_MODES, default="copy",
+                   help="copy, or link files where the filesystem allows it (auto: reflink, hardlink, then copy).")
+    p.add_argument("--workers", type=int, default=8, help="Number of concurrent transfers.")
+    _add_resume_argument(p)
+
+    p = subparsers.add_parser("validate", help="Check a dataset before nnUNetv2_plan_and_preprocess.")
+    p.add_argument("dataset_dir")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes for the label census.")
+    p.add_argument("--report", default=None, help="Also save the report as JSON.")
+
+    p = subparsers.add_parser("dataset-json", help="Generate dataset.json.")
+    p.add_argument("dataset_dir")
+    p.add_argument("--label", action="append", default=[], metavar="NAME=VALUE",
+                   help="Label name and value; repeat per label. Defaults to the values found in labelsTr.")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes for the label census.")
+
+    p = subparsers.add_parser("recolor", help="Change label values in all TIF files and Zarr stores of a folder.")
+    p.add_argument("folder")
+    p.add_argument("--map", action="append", required=True, metavar="OLD=NEW", help="Repeat per value.")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--dtype", choices=LABEL_DTYPES, default=None,
+                   help="Rewrite the files with this data type (default: keep each file's).")
+    _add_resume_argument(p)
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("cut", help="Cut TIF stacks into X/Y parts.")
+    p.add_argument("input_files", nargs="+")
+    p.add_argument("--x", dest="x_divisions", type=int, default=1)
+    p.add_argument("--y", dest="y_divisions", type=int, default=1)
+    _add_resume_argument(p)
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("tile", help="Split TIF stacks into overlapping tiles of a fixed size.")
+    p.add_argument("input_files", nargs="+")
+    p.add_argument("--size", dest="tile_size", type=int, nargs="+", default=None, metavar="PIXELS",
+                   help="Tile size, or height and width.")
+    p.add_argument("--plans", default=None, help="Take the tile size from the patch size in this nnUNetPlans.json.")
+    p.add_argument("--configuration", default="3d_fullres", help="Configuration of --plans (default: 3d_fullres).")
+    p.add_argument("--overlap", type=int, nargs="+", default=[0], metavar="PIXELS",
+                   help="Pixels shared by neighbouring tiles, or y and x.")
+    p.add_argument("--pad", action="store_true", help="Zero-pad edge tiles instead of moving them inwards.")
+    p.add_argument("--output-dir", default=None, help="Default: {name}_tiles next to each input.")
+    p.add_argument("--workers", type=int, default=None, help="Threads writing tiles.")
+    _add_resume_argument(p)
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("stitch", help="Reassemble tiles, e.g. predictions on them, into one TIF stack.")
+    p.add_argument("tiles", help="Tile index (*_tiles.json) or folder of {name}_x{col}_y{row}.tif tiles.")
+    p.add_argument("--output", dest="output_file", default=None, help="Default: {name}_stitched.tif next to the index.")
+    p.add_argument("--tiles-dir", default=None, help="Read the tiles from here, e.g. the nnUNet prediction folder.")
+    p.add_argument("--blend", choices=nnunet_tools.BLEND_MODES, default=None,
+                   help="How overlaps are merged (default: center for labels, gaussian for float data).")
+    p.add_argument("--chunk-frames", type=int, default=None, help="Frames assembled at a time.")
+    p.add_argument("--workers", type=int, default=None, help="Threads reading tiles.")
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("combine", help="Combine binary masks into one label TIF.")
+    p.add_argument("label_files", nargs="+", metavar="FILE=LABEL")
+    p.add_argument("--output", dest="output_file", required=True)
+    p.add_argument("--threshold", type=int, default=255, help="Mask values >= threshold are foreground.")
+    p.add_argument("--priority", choices=nnunet_tools.COMBINE_PRIORITIES, default="last",
+                   help="Which label wins where masks overlap.")
+    p.add_argument("--dtype", choices=LABEL_DTYPES, default=None,
+                   help="Data type of the output (default: the smallest one holding the labels).")
+    p.add_argument("--workers", type=int, default=None, help="Threads merging chunks of frames.")
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("binarize", help="Threshold a stack into a binary label TIF.")
+    p.add_argument("input_file")
+    p.add_argument("--output", dest="output_file", required=True)
+    p.add_argument("--threshold", type=float, required=True, help="Values >= threshold are foreground.")
+    p.add_argument("--foreground", type=int, default=1, help="Label value of the foreground (default: 1).")
+    p.add_argument("--dtype", choices=LABEL_DTYPES, default="uint8", help="Data type of the output.")
+    p.add_argument("--workers", type=int, default=None, help="Threads thresholding chunks of frames.")
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("substacks", help="Split a TIF stack into substacks.")
+    p.add_argument("input_file")
+    p.add_argument("--output-dir", required=True)
+    p.add_argument("--start", dest="start_frame", type=int, required=True)
+    p.add_argument("--end", dest="end_frame", type=int, required=True)
+    p.add_argument("--size", dest="substack_size", type=int, required=True)
+    p.add_argument("--stride", type=int, default=None, help="Frames between substack starts (default: --size).")
+    p.add_argument("--include-partial", action="store_true", help="Also write the shorter trailing substack.")
+    p.add_argument("--workers", type=int, default=4, help="Number of substacks written concurrently.")
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("convert", help="Convert stacks between TIF and Zarr/OME-Zarr.")
+    p.add_argument("input_files", nargs="+", help="TIF files or .zarr stores.")
+    p.add_argument("--to", choices=("tif", "zarr", "ome.zarr"), default=None,
+                   help="Output format (default: OME-Zarr for TIF inputs, TIF for stores).")
+    p.add_argument("--output-dir", default=None, help="Default: next to each input.")
+    _add_output_arguments(p)
+
+    p = subparsers.add_parser("plan", help="Run nnUNetv2_plan_and_preprocess.")
+    p.add_argument("dataset_ids", nargs="+")
+    p.add_argument("--no-validate", dest="validate", action="store_false",
+                   help="Skip the dataset check before planning.")
+    p.add_argument("--np", dest="num_processes", type=int, nargs="+", default=None,
+                   help="Preprocessing processes, one number or one per configuration (nnUNet -np).")
+    p.add_argument("--npfp", dest="num_processes_fingerprint", type=int, default=None,
+                   help="Fingerprint extraction processes (nnUNet -npfp).")
+    p.add_argument("--max-concurrent", type=int, default=1, help="Datasets planned at the same time.")
+    p.add_argument("--retries", type=int, default=0, help="Times a failed dataset is started again.")
+    p.add_argument("--log-dir", default=None, help=f"Folder for the job logs (default: {nnunet_runner.DEFAULT_LOG_DIR}).")
+    p.add_argument("--raw-path", default=None, help=f"nnUNet_raw folder (default: {nnunet_tools.NNUNET_RAW}).")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes for the label census.")
+
+    p = subparsers.add_parser("trace-summary", help="Summarize a trace recorded with --trace.")
+    p.add_argument("trace_file")
+    p.add_argument("--json", dest="json_output", default=None, metavar="FILE",
+                   help="Also write the summary rows as JSON.")
+
+    return parser
+
+
+def _run_traced(trace_path, profile, function):
+    """Call `function` while recording a trace, then print its summary; returns the result of `function`."""
+    if trace_path is None:
+        trace_path = os.path.join(tracing.DEFAULT_TRACE_DIR, time.strftime("%Y%m%d-%H%M%S") + ".jsonl")
+    trace = tracing.Trace(trace_path, profile)
+    with trace:
+        result = function()
+    print(f"\nTrace written to {trace.path}")
+    if trace.profile:
+        print(f"Profile written to {trace.profile.path}")
+    print(tracing.format_summary(tracing.summarize(tracing.load(trace.path))))
+    return result
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    command = args.command
+    arguments = vars(args)
+    del arguments["command"]
+    trace_path, profile = arguments.pop("trace"), arguments.pop("profile")
+
+    try:
+        if command == "run":
+            jobs = [job for job_file in args.job_files for job in load_jobs(job_file)]
+        elif command == "dataset-json":
+            arguments["labels"] = _parse_pairs(arguments.pop("label")) or None
+        elif command == "recolor":
+            arguments["mapping"] = {int(k): v for k, v in _parse_pairs(arguments.pop("map")).items()}
+        elif command == "combine":
+            arguments["label_files"] = _parse_pairs(arguments["label_files"])
+        if command != "run":
+            _pop_output_arguments(arguments)
+            if "output" in arguments:
+                nnunet_tools.TiffOutputOptions.from_dict(arguments["output"])  # Validate before running
+            jobs = [{"operation": command, **arguments}]
+        if profile:
+            tracing.Profile(profile, "")  # Fail early if the profiler is missing
+    except (argparse.ArgumentTypeError, ValueError, ImportError, OSError) as e:
+        parser.error(str(e))
+
+    keep_going = command == "run" and args.keep_going
+    if trace_path is None and profile is None:
+        return 1 if run_jobs(jobs, keep_going=keep_going) else 0
+    return 1 if _run_traced(trace_path, profile, lambda: run_jobs(jobs, keep_going=keep_going)) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
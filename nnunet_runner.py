@@ -0,0 +1,406 @@
+"""
+Queue for long-running external commands such as nnUNetv2_plan_and_preprocess.
+
+A JobRunner runs submitted commands with at most `max_concurrent` at a time.
+Every job's output goes to its own log file and to an optional callback for a
+live view. Its wall time and peak memory are measured over the whole process
+tree, and it can be cancelled or retried. A line per finished attempt is
+appended to jobs.jsonl in the log folder, so process counts can be tuned from
+the numbers of earlier runs.
+"""
+import collections
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_LOG_DIR = os.environ.get("NNUNET_GUI_LOG_DIR", os.path.join(os.path.expanduser("~"), ".nnunet_gui", "jobs"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Seconds a cancelled process tree gets to exit after SIGTERM before it is killed
+_KILL_GRACE = 10
+
+
+def process_tree_rss(pid):
+    """
+    Returns the resident memory of a process and all its descendants in bytes.
+
+    Uses psutil if it is installed and /proc on Linux otherwise; returns None
+    where neither is available or the process is gone.
+    """
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    if not os.path.isdir("/proc"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # Fields after the parenthesized command name: state, ppid, ..., rss is the 22nd
+        fields = stat[stat.rfind(")") + 2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * page_size
+    if pid not in rss:
+        return None
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+def format_memory(num_bytes):
+    """Format a memory size for logs and status lines, e.g. "512 MiB" or "3.2 GiB"."""
+    if num_bytes is None:
+        return "unknown"
+    if num_bytes < 2**30:
+        return f"{num_bytes / 2**20:.0f} MiB"
+    return f"{num_bytes / 2**30:.1f} GiB"
+
+
+def _signal_tree(process, kill=False):
+    """
+    Ask a process started by JobRunner to stop, together with everything it spawned.
+
+    Sends SIGTERM, or SIGKILL with `kill`, to its process group and returns
+    right away. On Windows the tree is always killed.
+    """
+    if process.poll() is not None:
+        return
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+class RunnerJob:
+    """
+    A command queued on a JobRunner.
+
+    Attributes:
+        job_id (int): Number of the job within its runner.
+        name (str): Short name, used for the log file.
+        command (list): The command and its arguments.
+        state (str): QUEUED, RUNNING, SUCCEEDED, FAILED or CANCELLED.
+        attempts (int): Number of times the command was started.
+        exit_code (int): Exit code of the last attempt.
+        wall_seconds (float): Duration of the last attempt.
+        peak_rss_bytes (int): Peak memory of the last attempt's process tree, if measurable.
+        log_path (str): File receiving the output of all attempts.
+        last_line (str): Most recent output line.
+    """
+
+    def __init__(self, job_id, name, command, log_path, max_retries=0, env=None, cwd=None):
+        self.job_id = job_id
+        self.name = name
+        self.command = [str(part) for part in command]
+        self.log_path = log_path
+        self.max_retries = max_retries
+        self.env = env
+        self.cwd = cwd
+        self.state = QUEUED
+        self.attempts = 0
+        self.exit_code = None
+        self.started = None
+        self.finished = None
+        self.wall_seconds = None
+        self.peak_rss_bytes = None
+        self.last_line = ""
+        self.error = None
+        self._process = None
+        self._cancel_requested = False
+        self._kill_deadline = None
+
+    @property
+    def done(self):
+        return self.state in (SUCCEEDED, FAILED, CANCELLED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "command": self.command,
+            "state": self.state,
+            "attempt": self.attempts,
+            "exit_code": self.exit_code,
+            "started": self.started,
+            "finished": self.finished,
+            "wall_seconds": self.wall_seconds,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "log_path": self.log_path,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """
+    Runs queued commands with bounded concurrency.
+
+    Args:
+        log_dir (str, optional): Folder for the job logs and jobs.jsonl.
+            Defaults to DEFAULT_LOG_DIR.
+        max_concurrent (int): Number of jobs running at the same time.
+        on_output (callable, optional): Called as on_output(job, line) for
+            every output line, from a background thread.
+        on_state (callable, optional): Called as on_state(job) whenever a job
+            changes state, from a background thread.
+        poll_interval (float): Seconds between memory samples.
+    """
+
+    def __init__(self, log_dir=None, max_concurrent=1, on_output=None, on_state=None, poll_interval=1.0):
+        self.log_dir = log_dir or DEFAULT_LOG_DIR
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.on_output = on_output
+        self.on_state = on_state
+        self.poll_interval = poll_interval
+        self._session = time.strftime("%Y%m%d-%H%M%S")
+        self._jobs = []
+        self._queue = collections.deque()
+        self._running = set()
+        self._condition = threading.Condition()
+        os.makedirs(self.log_dir, exist_ok=True)
+
+    def submit(self, name, command, max_retries=0, env=None, cwd=None):
+        """
+        Queues a command.
+
+        Args:
+            name (str): Short name of the job, e.g. "plan_001".
+            command (list): The command and its arguments.
+            max_retries (int): How often a failed command is started again automatically.
+            env (dict, optional): Environment of the command; inherits ours by default.
+            cwd (str, optional): Working directory of the command.
+
+        Returns:
+            RunnerJob: The queued job.
+        """
+        with self._condition:
+            job_id = len(self._jobs) + 1
+            safe_name = re.sub(r"[^\w.-]+", "_", name)
+            log_path = os.path.join(self.log_dir, f"{self._session}_{job_id:03d}_{safe_name}.log")
+            job = RunnerJob(job_id, name, command, log_path, max_retries, env, cwd)
+            self._jobs.append(job)
+            self._queue.append(job)
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def jobs(self):
+        """Return all jobs submitted so far."""
+        with self._condition:
+            return list(self._jobs)
+
+    def set_max_concurrent(self, max_concurrent):
+        """Change the concurrency limit; extra queued jobs start right away."""
+        with self._condition:
+            self.max_concurrent = max(1, int(max_concurrent))
+        self._dispatch()
+
+    def cancel(self, job):
+        """
+        Cancel a queued job, or stop a running one with its child processes.
+
+        Does not block: a running job's process tree gets SIGTERM now and is
+        killed by the job's thread if it has not exited after _KILL_GRACE
+        seconds. The job turns CANCELLED once its process has exited.
+        """
+        with self._condition:
+            if job.done or job._cancel_requested:
+                return
+            job._cancel_requested = True
+            was_queued = job.state == QUEUED
+            if was_queued:
+                if job in self._queue:
+                    self._queue.remove(job)
+                job.state = CANCELLED
+                self._condition.notify_all()
+            process = job._process
+            if process is not None:
+                job._kill_deadline = time.monotonic() + _KILL_GRACE
+        if process is not None:
+            _signal_tree(process)
+        if was_queued:
+            self._notify(job)
+
+    def retry(self, job):
+        """
+        Queues a failed or cancelled job again; its output is appended to the same log.
+
+        Raises:
+            ValueError: If the job is still queued, running or has succeeded.
+        """
+        with self._condition:
+            if job.state not in (FAILED, CANCELLED):
+                raise ValueError(f"Job {job.name} is {job.state} and cannot be retried.")
+            job._cancel_requested = False
+            job.state = QUEUED
+            self._queue.append(job)
+        self._notify(job)
+        self._dispatch()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until nothing is queued or running.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._running, timeout)
+
+    def shutdown(self, cancel=False, wait=True):
+        """Cancel queued jobs and, if `cancel` is set, running ones too; then wait for them unless `wait` is False."""
+        with self._condition:
+            queued = list(self._queue)
+            running = list(self._running)
+        for job in queued + (running if cancel else []):
+            self.cancel(job)
+        if wait:
+            self.wait()
+
+    def _notify(self, job):
+        if self.on_state:
+            self.on_state(job)
+
+    def _dispatch(self):
+        with self._condition:
+            while self._queue and len(self._running) < self.max_concurrent:
+                job = self._queue.popleft()
+                job.state = RUNNING
+                self._running.add(job)
+                threading.Thread(target=self._run, args=(job,), name=f"job-{job.job_id}", daemon=True).start()
+
+    def _run(self, job):
+        job.attempts += 1
+        job.exit_code = None
+        job.error = None
+        job.peak_rss_bytes = None
+        job._kill_deadline = None
+        job.started = time.time()
+        self._notify(job)
+
+        with open(job.log_path, "a", encoding="utf-8", errors="replace") as log:
+            log.write(f"# Attempt {job.attempts} started {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            log.write(f"$ {subprocess.list2cmdline(job.command)}\n")
+            log.flush()
+            try:
+                self._execute(job, log)
+            except OSError as e:
+                job.error = str(e)
+                log.write(f"# Could not start: {e}\n")
+            job.finished = time.time()
+            job.wall_seconds = job.finished - job.started
+            log.write(f"# Exit code {job.exit_code} after {job.wall_seconds:.1f}s, "
+                      f"peak memory {format_memory(job.peak_rss_bytes)}\n")
+
+        with self._condition:
+            job._process = None
+            self._running.discard(job)
+            if job._cancel_requested:
+                job.state = CANCELLED
+            elif job.exit_code == 0:
+                job.state = SUCCEEDED
+            elif job.attempts <= job.max_retries:
+                job.state = QUEUED
+                self._queue.append(job)
+            else:
+                job.state = FAILED
+            self._record(job)
+            self._condition.notify_all()
+        self._notify(job)
+        self._dispatch()
+
+    def _execute(self, job, log):
+        popen_options = {}
+        if sys.platform == "win32":
+            popen_options["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_options["start_new_session"] = True  # Own process group, so cancel reaches the workers
+        env = None if job.env is None else {**os.environ, **job.env}
+        process = subprocess.Popen(
+            job.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            env=env, cwd=job.cwd, text=True, encoding="utf-8", errors="replace", bufsize=1, **popen_options,
+        )
+        with self._condition:
+            job._process = process
+            cancel = job._cancel_requested
+            if cancel:
+                job._kill_deadline = time.monotonic() + _KILL_GRACE
+        if cancel:
+            _signal_tree(process)
+
+        def read_output():
+            for line in process.stdout:
+                log.write(line)
+                log.flush()
+                line = line.rstrip("\r\n")
+                if line.strip():
+                    job.last_line = line
+                if self.on_output:
+                    self.on_output(job, line)
+
+        reader = threading.Thread(target=read_output, daemon=True)
+        reader.start()
+        while process.poll() is None:
+            rss = process_tree_rss(process.pid)
+            if rss is not None:
+                job.peak_rss_bytes = max(job.peak_rss_bytes or 0, rss)
+            # A cancelled tree that ignores SIGTERM is killed from here, not from the thread that cancelled it
+            timeout = self.poll_interval
+            deadline = job._kill_deadline
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    _signal_tree(process, kill=True)
+                    job._kill_deadline = None
+                else:
+                    timeout = min(timeout, deadline - time.monotonic())
+            reader.join(max(0.0, timeout))
+        reader.join()
+        process.stdout.close()
+        job.exit_code = process.returncode
+
+    def _record(self, job):
+        """Append the finished attempt to jobs.jsonl; a read-only log folder is not fatal."""
+        try:
+            with open(os.path.join(self.log_dir, "jobs.jsonl"), "a") as summary_file:
+                summary_file.write(json.dumps(job.to_dict()) + "\n")
+        except OSError as e:
+            print(f"Could not write job summary: {e}")
@@ -0,0 +1,2045 @@
+"""
+Headless processing functions behind the nnUNet GUI.
+
+Everything here works without a display and without importing PyQt5, so it
+can be used from scripts, the command line (see nnunet_cli.py) or the GUI.
+
+Stacks are multi-page TIFF files or, where the zarr package is installed,
+Zarr / OME-Zarr stores (see zarr_storage). open_stack and open_stack_writer
+pick the backend from the path, so the cut, tile, stitch, substack, combine
+and color change operations work on both. Outputs derived from an input
+keep its format; convert_stack converts between them.
+
+The operations record timing spans while a tracing.Trace is active: the
+stack readers and writers time their decoding and encoding and count the
+bytes, so a trace shows where the time of a slow run went.
+"""
+import os
+import json
+import re
+import shutil
+import sys
+import subprocess
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import ExitStack
+import numpy as np
+import tifffile as tiff
+
+import label_kernels
+import tiff_metadata
+import tracing
+import zarr_storage
+from manifest import Manifest, file_stamp
+
+# Root of the nnUNet raw data folder; nnUNet itself reads the same variable
+NNUNET_RAW = os.environ.get("nnUNet_raw", "Z:/zhonghui-wen/nnUNet_raw")
+
+
+class OperationCancelled(Exception):
+    """
+    Raised by a progress callback to stop a running operation.
+
+    Long operations accept a `progress(done, total, bytes_done)` callback that
+    is called after each unit of work (a frame or a file); raising this from
+    the callback aborts the operation at that point.
+    """
+
+
+class TiffStackReader:
+    """
+    Reads a multi-page TIFF one frame at a time.
+
+    Uncompressed, contiguous stacks are memory-mapped so frames come straight
+    from the page cache; compressed or fragmented stacks are decoded page by
+    page. Either way only one frame is held in memory at a time.
+
+    Args:
+        input_file_path (str): Path to the TIFF file.
+    """
+
+    # Frames decoded together; Zarr readers report the chunk depth of their store
+    chunk_frames = 1
+
+    def __init__(self, input_file_path):
+        self.path = input_file_path
+        self._tif = tiff.TiffFile(input_file_path)
+        try:
+            self._series = self._tif.series[0]
+            self.frame_shape = tuple(self._series.keyframe.shape)
+            self.dtype = np.dtype(self._series.dtype)
+            self.num_frames = int(self._series.size // max(1, int(np.prod(self.frame_shape))))
+            self._frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+            self._memmap = None
+            if self._series.dataoffset is not None:
+                self._memmap = tiff.memmap(input_file_path, mode="r").reshape((self.num_frames,) + self.frame_shape)
+        except Exception:
+            self._tif.close()
+            raise
+
+    @property
+    def tiff_file(self):
+        """The underlying tifffile.TiffFile, e.g. to read tags."""
+        return self._tif
+
+    def read_frame(self, index):
+        """Return frame `index` as an array."""
+        if self._memmap is not None:
+            tracing.count(bytes_read=self._frame_bytes)
+            return self._memmap[index]
+        with tracing.phase("decode", bytes_read=self._frame_bytes):
+            return self._series.pages[index].asarray()
+
+    def iter_frames(self, start=0, stop=None):
+        """Yield frames `start` to `stop` (exclusive), reading each page once."""
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        for index in range(start, stop):
+            yield self.read_frame(index)
+
+    def read_block(self, start, stop, rows=slice(None), cols=slice(None)):
+        """Return frames `start` to `stop` (exclusive), cropped to the `rows` and `cols` slices."""
+        if self._memmap is not None:
+            block = self._memmap[start:stop, rows, cols]
+            with tracing.phase("io", bytes_read=block.nbytes):
+                return np.array(block)
+        return np.stack([frame_data[rows, cols] for frame_data in self.iter_frames(start, stop)])
+
+    def read_into(self, start, out):
+        """Read frames `start` to `start + len(out)` into the array `out`, e.g. a reused buffer."""
+        if self._memmap is not None:
+            with tracing.phase("io", bytes_read=out.nbytes):
+                np.copyto(out, self._memmap[start:start + len(out)])
+        else:
+            with tracing.phase("decode", bytes_read=out.nbytes):
+                for index, frame_out in enumerate(out):
+                    self._series.pages[start + index].asarray(out=frame_out)
+        return out
+
+    def close(self):
+        self._memmap = None
+        self._tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+TIFF_COMPRESSIONS = ("none", "zlib", "zstd", "lzw")
+
+# Classic TIFF uses 32-bit offsets; leave headroom for tags and page headers
+_BIGTIFF_THRESHOLD = 2**32 - 2**25
+
+
+class TiffOutputOptions:
+    """
+    How the TIFF writers of this module encode their output.
+
+    The defaults write uncompressed, strip-based pages that can be memory-mapped
+    by the next step. Sparse label stacks typically shrink 20-100x with zlib or
+    zstd at little cost in write time; see benchmarks/bench_tiff_output.py.
+
+    Args:
+        compression (str, optional): "none", "zlib", "zstd" or "lzw".
+        level (int, optional): Compression level for zlib (1-9) and zstd (1-22).
+        predictor (bool): Apply horizontal (or floating point) differencing
+            before compressing; helps smooth intensity images, rarely labels.
+        tile (int, optional): Write tiled pages of tile x tile pixels instead of strips.
+        bigtiff (bool, optional): Force BigTIFF on or off; by default it is
+            used when the uncompressed output could exceed 4 GB.
+        threads (int, optional): Threads encoding the strips or tiles of each page.
+        zarr (dict or zarr_storage.ZarrOutputOptions, optional): Chunking and
+            compression of outputs written as Zarr stores.
+
+    Raises:
+        ValueError: If an option is invalid.
+    """
+
+    def __init__(self, compression=None, level=None, predictor=False, tile=None, bigtiff=None, threads=None,
+                 zarr=None):
+        compression = (compression or "none").lower()
+        if compression not in TIFF_COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}; expected one of {', '.join(TIFF_COMPRESSIONS)}.")
+        if tile is not None and (int(tile) <= 0 or int(tile) % 16):
+            raise ValueError("Tile size must be a positive multiple of 16.")
+        if compression == "none" and (level is not None or predictor):
+            raise ValueError("A compression level or predictor needs a compression.")
+        self.compression = compression
+        self.level = None if level is None else int(level)
+        self.predictor = bool(predictor)
+        self.tile = None if tile is None else int(tile)
+        self.bigtiff = bigtiff
+        self.threads = None if threads is None else int(threads)
+        self.zarr = zarr_storage.ZarrOutputOptions.from_dict(zarr)
+
+    @classmethod
+    def from_dict(cls, options):
+        """Build options from a dict such as the `output` entry of a job file; None gives the defaults."""
+        if isinstance(options, cls):
+            return options
+        return cls(**(options or {}))
+
+    @property
+    def contiguous(self):
+        """True if pages are stored uncompressed and untiled, so the file can be memory-mapped."""
+        return self.compression == "none" and self.tile is None
+
+    def write_kwargs(self):
+        """Return the keyword arguments passed to TiffWriter.write for each frame."""
+        if self.contiguous:
+            return {"contiguous": True}
+        # Every page is written separately; metadata=None lets readers treat them as one stack
+        kwargs = {"metadata": None}
+        if self.compression != "none":
+            kwargs["compression"] = self.compression
+            if self.level is not None:
+                kwargs["compressionargs"] = {"level": self.level}
+            if self.predictor:
+                kwargs["predictor"] = True
+        if self.tile is not None:
+            kwargs["tile"] = (self.tile, self.tile)
+        if self.threads is not None:
+            kwargs["maxworkers"] = self.threads
+        return kwargs
+
+    def open(self, path, uncompressed_bytes=0):
+        """
+        Opens a TiffStackWriter for `path`.
+
+        Args:
+            path (str): Output file.
+            uncompressed_bytes (int): Expected size of the raw data, used to
+                decide whether BigTIFF is needed.
+
+        Returns:
+            TiffStackWriter: Writer to append frames to.
+        """
+        bigtiff = self.bigtiff if self.bigtiff is not None else uncompressed_bytes > _BIGTIFF_THRESHOLD
+        return TiffStackWriter(path, self, bigtiff)
+
+    def __repr__(self):
+        return (f"TiffOutputOptions(compression={self.compression!r}, level={self.level!r}, "
+                f"predictor={self.predictor!r}, tile={self.tile!r}, bigtiff={self.bigtiff!r}, "
+                f"threads={self.threads!r}, zarr={self.zarr!r})")
+
+
+class TiffStackWriter:
+    """
+    Appends frames to a multi-page TIFF using a TiffOutputOptions encoding.
+
+    Args:
+        path (str): Output file.
+        options (TiffOutputOptions): Encoding of the pages.
+        bigtiff (bool): Write a BigTIFF file.
+    """
+
+    def __init__(self, path, options, bigtiff=False):
+        self.path = path
+        self._writer = tiff.TiffWriter(path, bigtiff=bigtiff)
+        self._kwargs = options.write_kwargs()
+
+    def write(self, frame):
+        """Append one frame as a page."""
+        with tracing.phase("encode", bytes_written=frame.nbytes):
+            self._writer.write(frame, **self._kwargs)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_stack(path):
+    """
+    Opens an image stack for reading: a Zarr store if the path ends in `.zarr`, a TIFF file otherwise.
+
+    Returns:
+        TiffStackReader or zarr_storage.ZarrStackReader: Reader with num_frames,
+        frame_shape, dtype, read_frame, iter_frames and read_block.
+    """
+    if zarr_storage.is_zarr_path(path):
+        return zarr_storage.ZarrStackReader(path)
+    return TiffStackReader(path)
+
+
+def open_stack_writer(path, shape, dtype, output_options=None, target=None):
+    """
+    Opens a writer for a stack of known shape.
+
+    Args:
+        path (str): File or store to write.
+        shape (tuple): (frames, rows, columns, ...) of the stack.
+        dtype (numpy.dtype): Data type of the stack.
+        output_options (TiffOutputOptions, optional): Encoding of the output;
+            Zarr stores use its `zarr` options.
+        target (str, optional): Final path if `path` is a temporary name;
+            its suffix decides the format instead.
+
+    Returns:
+        TiffStackWriter or zarr_storage.ZarrStackWriter: Writer to append frames to.
+    """
+    output_options = TiffOutputOptions.from_dict(output_options)
+    target = target or path
+    if zarr_storage.is_zarr_path(target):
+        return output_options.zarr.open(path, shape, dtype, ome=zarr_storage.is_ome_zarr_path(target))
+    return output_options.open(path, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+
+
+def split_stack_name(path):
+    """Return the base name and suffix of a stack, e.g. ("a", ".ome.zarr") or ("b", ".tif")."""
+    name = os.path.basename(os.path.normpath(path))
+    for suffix in (zarr_storage.OME_ZARR_SUFFIX, zarr_storage.ZARR_SUFFIX):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)], name[-len(suffix):]
+    return os.path.splitext(name)
+
+
+def _output_suffix(path):
+    """Suffix of the outputs derived from a stack: its own for a Zarr store, .tif otherwise."""
+    return split_stack_name(path)[1] if zarr_storage.is_zarr_path(path) else ".tif"
+
+
+def remove_stack(path):
+    """Delete a TIFF file or Zarr store, if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def replace_stack(source, destination):
+    """
+    Moves a finished stack onto its final path.
+
+    Files replace their destination atomically. A Zarr store is a folder and
+    cannot be renamed onto an existing one, so an old store is moved aside
+    first and deleted once the new one is in place.
+    """
+    if not os.path.isdir(destination):
+        os.replace(source, destination)
+        return
+    old_path = destination + ".old"
+    remove_stack(old_path)
+    os.replace(destination, old_path)
+    os.replace(source, destination)
+    remove_stack(old_path)
+
+
+@tracing.traced("convert", file="input_path")
+def convert_stack(input_path, output_path=None, output_options=None, progress=None):
+    """
+    Converts a stack between TIFF and Zarr, e.g. a.tif -> a.ome.zarr.
+
+    Frames are streamed from the reader to the writer, so memory stays at
+    about one chunk of frames. The output is written under a temporary name
+    and only moved into place once it is complete.
+
+    Args:
+        input_path (str): TIFF file or Zarr store.
+        output_path (str, optional): The suffix (.tif, .zarr or .ome.zarr)
+            decides the format. Defaults to an OME-Zarr store next to a TIFF
+            input and a TIFF file next to a Zarr input.
+        output_options (TiffOutputOptions, optional): Encoding of the output.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+
+    Returns:
+        str: Path of the converted stack.
+    """
+    base_name, suffix = split_stack_name(input_path)
+    if output_path is None:
+        suffix = ".tif" if zarr_storage.is_zarr_path(input_path) else zarr_storage.OME_ZARR_SUFFIX
+        output_path = os.path.join(os.path.dirname(os.path.normpath(input_path)), base_name + suffix)
+    if os.path.abspath(output_path) == os.path.abspath(input_path):
+        raise ValueError("The output must differ from the input.")
+    partial_path = output_path + ".partial"
+
+    with ExitStack() as stack:
+        finished = False
+
+        def remove_partial_output():
+            if not finished:
+                remove_stack(partial_path)
+
+        # Callbacks run in reverse order: this one last, after the reader and the writer are closed
+        stack.callback(remove_partial_output)
+        reader = stack.enter_context(open_stack(input_path))
+        writer = stack.enter_context(open_stack_writer(
+            partial_path, (reader.num_frames,) + reader.frame_shape, reader.dtype, output_options, target=output_path
+        ))
+        bytes_read = 0
+        for frame_index, frame_data in enumerate(reader.iter_frames()):
+            writer.write(frame_data)
+            bytes_read += frame_data.nbytes
+            if progress:
+                progress(frame_index + 1, reader.num_frames, bytes_read)
+        finished = True
+
+    replace_stack(partial_path, output_path)
+    print(f"Converted {input_path} to {output_path}")
+    return output_path
+
+
+# Index written next to cut or tiled parts; stitch_tiles reads it to put them back together
+TILE_INDEX_SUFFIX = "_tiles.json"
+
+
+def _write_tiles(reader, tiles, tile_shape, output_options, progress=None, max_workers=None):
+    """
+    Streams a stack into one output file per tile in a single pass.
+
+    Every frame is decoded once and padded with zeros where tiles reach past
+    its edge. A thread pool then appends its tiles to their files, so
+    compressed tiles are encoded in parallel while memory use stays at about
+    one frame. Files are written under ".partial" names and renamed once all
+    frames are done; if anything fails they are removed.
+
+    A Zarr input is tiled into Zarr outputs a chunk of frames at a time
+    instead: every tile reads just its own region, so each thread only
+    decodes the input chunks its tile overlaps.
+
+    Args:
+        reader (TiffStackReader or zarr_storage.ZarrStackReader): Open input stack.
+        tiles (list): (path, y, x) of every tile.
+        tile_shape (tuple): (height, width) of the tiles.
+        output_options (TiffOutputOptions): Encoding of the tiles.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        max_workers (int, optional): Threads writing tiles.
+    """
+    tile_height, tile_width = tile_shape
+    height, width = reader.frame_shape[:2]
+    pad_y = max(0, max(y for _, y, _ in tiles) + tile_height - height)
+    pad_x = max(0, max(x for _, _, x in tiles) + tile_width - width)
+    tile_stack_shape = (reader.num_frames, tile_height, tile_width) + tuple(reader.frame_shape[2:])
+
+    def write_tile(part, frame):
+        writer, y, x = part
+        writer.write(frame[y:y + tile_height, x:x + tile_width])
+
+    def write_tile_block(part, start, stop):
+        writer, y, x = part
+        data = reader.read_block(start, stop, slice(y, y + tile_height), slice(x, x + tile_width))
+        bytes_read = data.nbytes
+        if data.shape[1:3] != tile_shape:  # Tile reaching past the edge of the frame
+            padding = ((0, 0), (0, tile_height - data.shape[1]), (0, tile_width - data.shape[2]))
+            data = np.pad(data, padding + ((0, 0),) * (data.ndim - 3))
+        writer.write_block(start, data)
+        return bytes_read
+
+    with ExitStack() as stack:
+        finished = False
+
+        def remove_partial_tiles():
+            if not finished:
+                for path, _, _ in tiles:
+                    remove_stack(path + ".partial")
+
+        # Callbacks run in reverse order: this one last, after the pool and the writers are closed
+        stack.callback(remove_partial_tiles)
+        parts = [(stack.enter_context(open_stack_writer(path + ".partial", tile_stack_shape, reader.dtype,
+                                                        output_options, target=path)), y, x)
+                 for path, y, x in tiles]
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+
+        bytes_read = 0
+        if isinstance(reader, zarr_storage.ZarrStackReader) and \
+                all(isinstance(writer, zarr_storage.ZarrStackWriter) for writer, _, _ in parts):
+            # Blocks match the output chunks, so no two threads write the same chunk
+            block_frames = parts[0][0].chunk_frames
+            write_block = tracing.bind(write_tile_block)
+            for start in range(0, reader.num_frames, block_frames):
+                stop = min(start + block_frames, reader.num_frames)
+                bytes_read += sum(pool.map(write_block, parts, [start] * len(parts), [stop] * len(parts)))
+                if progress:
+                    progress(stop, reader.num_frames, bytes_read)
+        else:
+            for frame_index, frame_data in enumerate(reader.iter_frames()):
+                bytes_read += frame_data.nbytes
+                if pad_y or pad_x:
+                    frame_data = np.pad(frame_data, ((0, pad_y), (0, pad_x)) + ((0, 0),) * (frame_data.ndim - 2))
+                for _ in pool.map(tracing.bind(write_tile), parts, [frame_data] * len(parts)):
+                    pass
+                if progress:
+                    progress(frame_index + 1, reader.num_frames, bytes_read)
+        finished = True
+
+    for path, _, _ in tiles:
+        replace_stack(path + ".partial", path)
+
+
+def _write_tile_index(index_path, input_file_path, reader, tile_shape, overlap, padded, tiles):
+    """
+    Writes the JSON index of a set of tiles.
+
+    Args:
+        tiles (list): (path, row, col, y, x) of every tile; paths are stored
+            relative to the index.
+    """
+    index = {
+        "source": os.path.abspath(input_file_path),
+        "shape": [reader.num_frames] + list(reader.frame_shape),
+        "dtype": str(reader.dtype),
+        "tile_size": list(tile_shape),
+        "overlap": list(overlap),
+        "padded": padded,
+        "tiles": [
+            {"file": os.path.relpath(path, os.path.dirname(index_path)), "row": row, "col": col, "y": y, "x": x}
+            for path, row, col, y, x in tiles
+        ],
+    }
+    temp_path = index_path + ".partial"
+    with open(temp_path, "w") as index_file:
+        json.dump(index, index_file, indent=2)
+    os.replace(temp_path, index_path)
+
+
+@tracing.traced("cut", file="input_file_path")
+def cut_tiff_into_parts(input_file_path, x_cuts, y_cuts, progress=None, output_options=None, resume=True,
+                        max_workers=None):
+    """
+    Splits a TIFF file into equally sized parts and saves them into a directory.
+
+    The stack is read in a single pass: every frame is decoded once and its
+    tiles are appended to one output file per part, so memory use stays at
+    roughly one frame regardless of stack depth. The positions of the parts
+    are saved in an index (`{base}_tiles.json`) for stitch_tiles. A Zarr
+    store is cut into Zarr parts, each reading only the chunks it overlaps.
+
+    Parts are written under temporary names and renamed together once the
+    whole stack is done, then recorded in a Manifest in the output directory.
+    An interrupted cut leaves no truncated parts behind, and cutting the same
+    unchanged file with the same settings again is skipped.
+
+    Args:
+        input_file_path (str): Path to the TIFF file or Zarr store.
+        x_cuts (int): Number of cuts along the x-axis.
+        y_cuts (int): Number of cuts along the y-axis.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        output_options (TiffOutputOptions, optional): Encoding of the parts; uncompressed by default.
+        resume (bool): Skip the cut if the manifest shows it was already done.
+        max_workers (int, optional): Threads writing parts.
+
+    Returns:
+        str: Directory the parts were saved in.
+
+    Raises:
+        ValueError: If the image dimensions are not divisible by the specified cuts.
+    """
+    if not os.path.exists(input_file_path):
+        raise FileNotFoundError("The specified TIFF file was not found.")
+    output_options = TiffOutputOptions.from_dict(output_options)
+
+    with open_stack(input_file_path) as reader:
+        if reader.num_frames < 2:
+            raise ValueError("The input image does not appear to be a stack.")
+
+        # Get original dimensions
+        height, width = reader.frame_shape[:2]
+
+        # Calculate sub-region dimensions
+        sub_width = width // (x_cuts + 1)
+        sub_height = height // (y_cuts + 1)
+
+        # Validate divisibility
+        if width % (x_cuts + 1) != 0 or height % (y_cuts + 1) != 0:
+            raise ValueError("Image dimensions are not perfectly divisible by the chosen cuts.")
+
+        # Create the output directory
+        base_name, suffix = split_stack_name(input_file_path)[0], _output_suffix(input_file_path)
+        save_dir = os.path.join(os.path.dirname(os.path.normpath(input_file_path)), base_name)
+        os.makedirs(save_dir, exist_ok=True)
+
+        parts = [(os.path.join(save_dir, f"{base_name}_x{i}_y{j}{suffix}"), j, i, j * sub_height, i * sub_width)
+                 for i in range(x_cuts + 1) for j in range(y_cuts + 1)]
+        index_path = os.path.join(save_dir, base_name + TILE_INDEX_SUFFIX)
+        outputs = [part[0] for part in parts] + [index_path]
+        journal = Manifest(save_dir, "cut", {"x_cuts": x_cuts, "y_cuts": y_cuts, "output": repr(output_options)},
+                           resume=resume)
+        if journal.is_done(base_name, inputs=[input_file_path] + outputs):
+            print(f"Parts are up to date, skipping: {save_dir}")
+            return save_dir
+
+        _write_tiles(reader, [(path, y, x) for path, _, _, y, x in parts], (sub_height, sub_width),
+                     output_options, progress, max_workers)
+        _write_tile_index(index_path, input_file_path, reader, (sub_height, sub_width), (0, 0), False, parts)
+
+    journal.record(base_name, [input_file_path] + outputs)
+    print(f"Processing complete. Files saved in: {save_dir}")
+    return save_dir
+
+
+def read_plans_patch_size(plans_file, configuration="3d_fullres"):
+    """
+    Reads the patch size nnUNet planned for a configuration.
+
+    Args:
+        plans_file (str): Path to an nnUNetPlans.json.
+        configuration (str): Configuration name, e.g. "2d" or "3d_fullres".
+
+    Returns:
+        tuple: (height, width) of the patch; for 3D configurations the last
+        two (in-plane) axes.
+
+    Raises:
+        KeyError: If the configuration or its patch size is not in the plans.
+    """
+    with open(plans_file, "r") as f:
+        configurations = json.load(f).get("configurations", {})
+    name = configuration
+    # Configurations such as 3d_cascade_fullres inherit their patch size
+    while name in configurations and "patch_size" not in configurations[name]:
+        name = configurations[name].get("inherits_from")
+    if name not in configurations:
+        raise KeyError(f"{plans_file} has no patch size for configuration {configuration!r} "
+                       f"(available: {', '.join(configurations)}).")
+    return tuple(int(size) for size in configurations[name]["patch_size"][-2:])
+
+
+def _pair(value, name):
+    """Return one number or a (y, x) pair as a tuple of two ints."""
+    if np.ndim(value) == 0:
+        value = (value, value)
+    value = tuple(int(v) for v in value)
+    if len(value) == 1:
+        value = value * 2
+    if len(value) != 2:
+        raise ValueError(f"{name} must be one number or a (y, x) pair.")
+    return value
+
+
+def _tile_starts(size, tile, stride, pad, axis):
+    """Return the start positions of the tiles along one axis."""
+    if size <= tile:
+        if size < tile and not pad:
+            raise ValueError(f"The image {axis} ({size}) is smaller than the tile; enable padding.")
+        return [0]
+    count = -(-(size - tile) // stride) + 1
+    starts = [i * stride for i in range(count)]
+    if not pad:
+        # The last tile ends at the edge and overlaps its neighbour by more than requested
+        starts[-1] = size - tile
+    return starts
+
+
+def tile_grid(height, width, tile_size, overlap=0, pad=False):
+    """
+    Computes the positions of overlapping tiles covering a frame.
+
+    A new tile starts every `tile_size - overlap` pixels. Without padding the
+    last tile of each row and column is moved back to end at the frame edge;
+    with padding it keeps its position and reaches past the edge, where the
+    written tile is filled with zeros.
+
+    Args:
+        height (int): Frame height.
+        width (int): Frame width.
+        tile_size (int or tuple): Tile size, or (height, width).
+        overlap (int or tuple): Pixels shared by neighbouring tiles, or (y, x).
+        pad (bool): Pad instead of moving the last tiles; also allows frames
+            smaller than a tile.
+
+    Returns:
+        list: (row, col, y, x) of every tile, row by row.
+
+    Raises:
+        ValueError: If the overlap is not smaller than the tile, or the frame
+            is smaller than a tile without padding.
+    """
+    tile_height, tile_width = _pair(tile_size, "Tile size")
+    overlap_y, overlap_x = _pair(overlap, "Overlap")
+    if tile_height <= 0 or tile_width <= 0:
+        raise ValueError("Tile size must be positive.")
+    if not (0 <= overlap_y < tile_height and 0 <= overlap_x < tile_width):
+        raise ValueError("Overlap must be at least 0 and smaller than the tile size.")
+    ys = _tile_starts(height, tile_height, tile_height - overlap_y, pad, "height")
+    xs = _tile_starts(width, tile_width, tile_width - overlap_x, pad, "width")
+    return [(row, col, y, x) for row, y in enumerate(ys) for col, x in enumerate(xs)]
+
+
+@tracing.traced("tile", file="input_file_path")
+def tile_tiff(input_file_path, tile_size=None, overlap=0, pad=False, plans_file=None, configuration="3d_fullres",
+              output_dir=None, max_workers=None, progress=None, output_options=None, resume=True):
+    """
+    Splits a TIFF stack into overlapping tiles of a fixed size.
+
+    Unlike cut_tiff_into_parts the frame size does not have to be divisible:
+    the tile grid comes from tile_grid, and the tile size can be taken from
+    the patch size of an nnUNetPlans.json. Tiles are written in one pass as
+    `{base}_x{col}_y{row}.tif` (or `.zarr` stores for a Zarr input) together
+    with an index (`{base}_tiles.json`)
+    holding every tile's position, which stitch_tiles uses to reassemble
+    predictions on the tiles. Like cuts, finished tilings are recorded in a Manifest and
+    skipped when run again with the same settings.
+
+    Args:
+        input_file_path (str): Path to the TIFF stack or Zarr store.
+        tile_size (int or tuple, optional): Tile size, or (height, width).
+            Required unless `plans_file` is given.
+        overlap (int or tuple): Pixels shared by neighbouring tiles, or (y, x).
+        pad (bool): Zero-pad tiles at the right and bottom edges instead of
+            moving them inwards.
+        plans_file (str, optional): nnUNetPlans.json to take the tile size from.
+        configuration (str): Configuration of `plans_file` to use.
+        output_dir (str, optional): Defaults to `{base}_tiles` next to the input.
+        max_workers (int, optional): Threads writing tiles.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        output_options (TiffOutputOptions, optional): Encoding of the tiles; uncompressed by default.
+        resume (bool): Skip the tiling if the manifest shows it was already done.
+
+    Returns:
+        str: Path of the tile index.
+    """
+    if not os.path.exists(input_file_path):
+        raise FileNotFoundError("The specified TIFF file was not found.")
+    if tile_size is None:
+        if plans_file is None:
+            raise ValueError("Give a tile size or an nnUNetPlans.json to take it from.")
+        tile_size = read_plans_patch_size(plans_file, configuration)
+    tile_shape = _pair(tile_size, "Tile size")
+    overlap = _pair(overlap, "Overlap")
+    output_options = TiffOutputOptions.from_dict(output_options)
+
+    base_name, suffix = split_stack_name(input_file_path)[0], _output_suffix(input_file_path)
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.normpath(input_file_path)), f"{base_name}_tiles")
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, base_name + TILE_INDEX_SUFFIX)
+
+    with open_stack(input_file_path) as reader:
+        height, width = reader.frame_shape[:2]
+        grid = tile_grid(height, width, tile_shape, overlap, pad)
+        tiles = [(os.path.join(output_dir, f"{base_name}_x{col}_y{row}{suffix}"), row, col, y, x)
+                 for row, col, y, x in grid]
+        outputs = [tile[0] for tile in tiles] + [index_path]
+        params = {"tile_size": tile_shape, "overlap": overlap, "pad": pad, "output": repr(output_options)}
+        journal = Manifest(output_dir, "tile", params, resume=resume)
+        if journal.is_done(base_name, inputs=[input_file_path] + outputs):
+            print(f"Tiles are up to date, skipping: {output_dir}")
+            return index_path
+
+        print(f"Writing {len(tiles)} tiles of {tile_shape[0]}x{tile_shape[1]} pixels to {output_dir}")
+        _write_tiles(reader, [(path, y, x) for path, _, _, y, x in tiles], tile_shape,
+                     output_options, progress, max_workers)
+        _write_tile_index(index_path, input_file_path, reader, tile_shape, overlap, pad, tiles)
+
+    journal.record(base_name, [input_file_path] + outputs)
+    print(f"Processing complete. Tile index saved as: {index_path}")
+    return index_path
+
+
+BLEND_MODES = ("center", "gaussian", "average", "max")
+
+# Tile files written by cut_tiff_into_parts and tile_tiff: {base}_x{col}_y{row}.tif, or .zarr/.ome.zarr stores
+_TILE_NAME = re.compile(r"^(?P<base>.+)_x(?P<col>\d+)_y(?P<row>\d+)(?P<suffix>\.tif|\.ome\.zarr|\.zarr)$")
+
+
+def tile_index_from_names(folder, base_name=None):
+    """
+    Builds a tile index from the names of the tiles in a folder.
+
+    For parts without an index, e.g. from an older cut: tiles named
+    `{base}_x{col}_y{row}.tif` are assumed to be equally sized and not to
+    overlap, as cut_tiff_into_parts writes them.
+
+    Args:
+        folder (str): Folder containing the tiles.
+        base_name (str, optional): Base name of the tiles, needed if the
+            folder holds tiles of several stacks.
+
+    Returns:
+        dict: Tile index in the format written by tile_tiff.
+
+    Raises:
+        FileNotFoundError: If no tiles are found.
+        ValueError: If the folder holds tiles of several stacks and no base name is given.
+    """
+    tiles = {}
+    for fname in sorted(os.listdir(folder)):
+        match = _TILE_NAME.match(fname)
+        if match and (base_name is None or match.group("base") == base_name):
+            tiles.setdefault(match.group("base"), []).append(
+                (int(match.group("row")), int(match.group("col")), fname, match.group("suffix"))
+            )
+    if not tiles:
+        raise FileNotFoundError(f"No tiles named {{base}}_x{{col}}_y{{row}}.tif found in {folder}.")
+    if len(tiles) > 1:
+        raise ValueError(f"{folder} holds tiles of several stacks ({', '.join(sorted(tiles))}); choose one.")
+    base_name, tiles = tiles.popitem()
+
+    with open_stack(os.path.join(folder, tiles[0][2])) as reader:
+        num_frames, frame_shape, dtype = reader.num_frames, reader.frame_shape, reader.dtype
+    tile_height, tile_width = frame_shape[:2]
+    rows = max(row for row, _, _, _ in tiles) + 1
+    cols = max(col for _, col, _, _ in tiles) + 1
+    return {
+        "source": base_name + tiles[0][3],
+        "shape": [num_frames, rows * tile_height, cols * tile_width] + list(frame_shape[2:]),
+        "dtype": str(dtype),
+        "tile_size": [tile_height, tile_width],
+        "overlap": [0, 0],
+        "padded": False,
+        "tiles": [{"file": fname, "row": row, "col": col, "y": row * tile_height, "x": col * tile_width}
+                  for row, col, fname, _ in tiles],
+    }
+
+
+def _tile_weights(tile_shape, blend):
+    """Return the 2D blending weights of a tile: a Gaussian around its center, or uniform."""
+    if blend == "average":
+        return np.ones(tile_shape, dtype=np.float32)
+    # Like nnUNet's sliding window: sigma is 1/8 of the tile, and the edges keep a small weight
+    axes = [np.exp(-0.5 * ((np.arange(size) - (size - 1) / 2) / (size / 8)) ** 2) for size in tile_shape]
+    weights = np.outer(axes[0], axes[1]).astype(np.float32)
+    return np.maximum(weights / weights.max(), np.float32(1e-3))
+
+
+@tracing.traced("stitch", file="output_file")
+def stitch_tiles(tiles, output_file=None, tiles_dir=None, blend=None, chunk_frames=None, max_workers=None,
+                 progress=None, output_options=None):
+    """
+    Reassembles tiles, e.g. nnUNet predictions on them, into a full stack.
+
+    Tile positions come from the index written by tile_tiff and
+    cut_tiff_into_parts or, for a folder of tiles without an index, from
+    their `{base}_x{col}_y{row}.tif` names. The output is built a chunk of
+    frames at a time: the tiles' frames of a chunk are read in parallel,
+    merged with vectorized operations and appended to the output file, so
+    memory stays bounded by the chunk size whatever the stack size.
+
+    Overlapping tiles are merged according to `blend`:
+        center    every pixel comes from the tile whose center is nearest;
+                  keeps label values intact (default for integer tiles)
+        gaussian  weighted mean with a Gaussian weight per tile, as nnUNet
+                  blends its patches (default for float tiles)
+        average   plain mean
+        max       per-voxel maximum
+
+    Args:
+        tiles (str): Tile index (`*_tiles.json`) or folder of tiles.
+        output_file (str, optional): Defaults to `{base}_stitched.tif` next to
+            the index (`.zarr` for a Zarr source). A `.zarr` path writes a Zarr store.
+        tiles_dir (str, optional): Folder to read the tile files from, e.g. the
+            nnUNet prediction folder. Defaults to the folder of the index.
+        blend (str, optional): One of BLEND_MODES.
+        chunk_frames (int, optional): Frames assembled at a time; by default
+            as many as fit into about 256 MB.
+        max_workers (int, optional): Threads reading tiles.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        output_options (TiffOutputOptions, optional): Encoding of the output; uncompressed by default.
+
+    Returns:
+        str: Path of the stitched stack.
+
+    Raises:
+        ValueError: If the tiles disagree in depth or the blend mode is unknown.
+    """
+    if os.path.isdir(tiles):
+        indexes = [fname for fname in os.listdir(tiles) if fname.endswith(TILE_INDEX_SUFFIX)]
+        if len(indexes) == 1:
+            tiles = os.path.join(tiles, indexes[0])
+    if os.path.isdir(tiles):
+        index_dir = tiles
+        index = tile_index_from_names(tiles)
+    else:
+        index_dir = os.path.dirname(tiles)
+        with open(tiles, "r") as f:
+            index = json.load(f)
+    tiles_dir = tiles_dir or index_dir
+    base_name, suffix = split_stack_name(index["source"])[0], _output_suffix(index["source"])
+    if output_file is None:
+        output_file = os.path.join(index_dir, f"{base_name}_stitched{suffix}")
+    output_options = TiffOutputOptions.from_dict(output_options)
+    height, width = index["shape"][1:3]
+    tile_shape = tuple(index["tile_size"])
+
+    with ExitStack() as stack:
+        readers = [stack.enter_context(open_stack(os.path.join(tiles_dir, tile["file"]))) for tile in index["tiles"]]
+        num_frames = readers[0].num_frames
+        dtype = readers[0].dtype
+        extra_shape = readers[0].frame_shape[2:]
+        for reader in readers:
+            if reader.num_frames != num_frames or reader.frame_shape[:2] != tile_shape:
+                raise ValueError(f"{reader.path} has {reader.num_frames} frames of {reader.frame_shape[:2]}, "
+                                 f"expected {num_frames} of {tile_shape}.")
+        if blend is None:
+            blend = "center" if dtype.kind in "iub" else "gaussian"
+        if blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode {blend!r}; expected one of {', '.join(BLEND_MODES)}.")
+
+        # Tile regions inside the output; tiles padded past the edge are cropped
+        regions = []
+        for tile in index["tiles"]:
+            y, x = tile["y"], tile["x"]
+            regions.append((slice(y, min(y + tile_shape[0], height)), slice(x, min(x + tile_shape[1], width)),
+                            min(tile_shape[0], height - y), min(tile_shape[1], width - x)))
+
+        # Everything that depends only on the tile positions is computed once for all frames
+        weights = _tile_weights(tile_shape, blend)
+        covered = np.zeros((height, width), dtype=bool)
+        if blend == "center":
+            best = np.zeros((height, width), dtype=np.float32)
+            owner = np.full((height, width), -1, dtype=np.int64)
+            for number, (ys, xs, h, w) in enumerate(regions):
+                wins = weights[:h, :w] > best[ys, xs]
+                best[ys, xs][wins] = weights[:h, :w][wins]
+                owner[ys, xs][wins] = number
+            masks = [(owner[ys, xs] == number).reshape((h, w) + (1,) * len(extra_shape))
+                     for number, (ys, xs, h, w) in enumerate(regions)]
+            covered = owner >= 0
+            del best, owner
+        elif blend in ("gaussian", "average"):
+            weight_sum = np.zeros((height, width), dtype=np.float32)
+            for ys, xs, h, w in regions:
+                weight_sum[ys, xs] += weights[:h, :w]
+            covered = weight_sum > 0
+            weight_sum[~covered] = 1
+            weight_sum = weight_sum.reshape(weight_sum.shape + (1,) * len(extra_shape))
+        else:
+            for ys, xs, _, _ in regions:
+                covered[ys, xs] = True
+        weights = weights.reshape(weights.shape + (1,) * len(extra_shape))
+
+        frame_bytes = height * width * dtype.itemsize * int(np.prod(extra_shape))
+        if chunk_frames is None:
+            chunk_frames = max(1, 2**28 // (frame_bytes // dtype.itemsize * 4))
+
+        def read_tile(number, start, stop):
+            return number, np.stack(list(readers[number].iter_frames(start, stop)))
+
+        partial_file = output_file + ".partial"
+        finished = False
+
+        def remove_partial_file():
+            if not finished:
+                remove_stack(partial_file)
+
+        # Callbacks run in reverse order: this one last, after the pool and the writer are closed
+        stack.callback(remove_partial_file)
+        writer = stack.enter_context(open_stack_writer(
+            partial_file, (num_frames, height, width) + extra_shape, dtype, output_options, target=output_file
+        ))
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=max_workers))
+        if dtype.kind == "f":
+            lowest = -np.inf
+        else:
+            lowest = np.iinfo(dtype).min if dtype.kind == "i" else 0
+        print(f"Stitching {len(readers)} tiles into {output_file} ({blend})")
+
+        bytes_read = 0
+        for start in range(0, num_frames, chunk_frames):
+            stop = min(start + chunk_frames, num_frames)
+            chunk_shape = (stop - start, height, width) + extra_shape
+            if blend == "center":
+                merged = np.zeros(chunk_shape, dtype=dtype)
+            elif blend == "max":
+                merged = np.full(chunk_shape, lowest, dtype=dtype)
+            else:
+                merged = np.zeros(chunk_shape, dtype=np.float32)
+
+            futures = [pool.submit(tracing.bind(read_tile), number, start, stop) for number in range(len(readers))]
+            try:
+                for future in as_completed(futures):
+                    number, data = future.result()
+                    bytes_read += data.nbytes
+                    ys, xs, h, w = regions[number]
+                    data = data[:, :h, :w]
+                    if blend == "center":
+                        np.copyto(merged[:, ys, xs], data, where=masks[number])
+                    elif blend == "max":
+                        np.maximum(merged[:, ys, xs], data, out=merged[:, ys, xs])
+                    else:
+                        merged[:, ys, xs] += data * weights[:h, :w]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+            if blend in ("gaussian", "average"):
+                merged /= weight_sum
+                if dtype.kind in "iub":
+                    np.rint(merged, out=merged)
+                merged = merged.astype(dtype)
+            merged[:, ~covered] = 0
+            for frame in merged:
+                writer.write(frame)
+            if progress:
+                progress(stop, num_frames, bytes_read)
+        finished = True
+
+    replace_stack(partial_file, output_file)
+    print(f"Processing complete. Stitched stack saved as: {output_file}")
+    return output_file
+
+
+def make_label_lut(mapping, dtype, out_dtype=None):
+    """
+    Builds a vectorized old->new value remapping function for one dtype.
+
+    8- and 16-bit integer data are remapped through a full lookup table, so a
+    frame is relabeled with a single pass no matter how many values change.
+    Wider dtypes fall back to a sorted-key search.
+
+    Args:
+        mapping (dict): Old value -> new value.
+        dtype (numpy.dtype): Dtype of the frames that will be remapped.
+        out_dtype (numpy.dtype, optional): Dtype of the remapped frames. Defaults to `dtype`.
+
+    Returns:
+        label_kernels.LabelLUT: Callable taking a frame (and optionally an
+        `out` array) and returning the remapped frame.
+
+    Raises:
+        ValueError: If a new value does not fit in the output dtype.
+    """
+    return label_kernels.LabelLUT(mapping, dtype, out_dtype)
+
+
+def _normalize_mapping(mapping):
+    """Return an old->new mapping as ints, without values that map to themselves."""
+    return {int(k): int(v) for k, v in mapping.items() if int(k) != int(v)}
+
+
+@tracing.traced("relabel_file", file="filepath")
+def _relabel_to_temp(filepath, mapping, output_options, out_dtype=None, threads=None):
+    """
+    Writes the relabeled version of a TIF file or Zarr store to a temporary one next to it.
+
+    Chunks of frames are remapped in place on `threads` threads.
+
+    Returns:
+        str: Path of the temporary file, or None if the file would not change.
+    """
+    folder = os.path.dirname(os.path.normpath(filepath)) or "."
+    prefix = f".relabel_{os.path.basename(os.path.normpath(filepath))}_"
+    if zarr_storage.is_zarr_path(filepath):
+        temp_path = tempfile.mkdtemp(suffix=".tmp", prefix=prefix, dir=folder)
+    else:
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", prefix=prefix, dir=folder)
+        os.close(fd)
+    try:
+        with open_stack(filepath) as reader:
+            remap = make_label_lut(mapping, reader.dtype, out_dtype)
+            changed = not remap.in_place
+
+            def relabel_chunk(chunks, out):
+                nonlocal changed
+                chunk = chunks[0]
+                # Only looked at until the first change; threads racing here all set True
+                if not changed and remap.changes(chunk):
+                    changed = True
+                return remap(chunk, out=chunk if out is None else out)
+
+            shape = (reader.num_frames,) + reader.frame_shape
+            with open_stack_writer(temp_path, shape, remap.out_dtype, output_options, target=filepath) as writer:
+                label_kernels.run_chunked(relabel_chunk, [reader], writer, None if remap.in_place else remap.out_dtype,
+                                          threads=threads)
+    except BaseException:
+        remove_stack(temp_path)
+        raise
+    if not changed:
+        remove_stack(temp_path)
+        return None
+    return temp_path
+
+
+def relabel_tif_file(filepath, mapping, output_options=None, out_dtype=None):
+    """
+    Applies an old->new value mapping to every frame of a TIF file.
+
+    Frames are streamed into a temporary file next to the original, which then
+    atomically replaces it; the original is left untouched if anything fails
+    or if no value actually changes. The data type of the file is preserved
+    unless `out_dtype` is given. Zarr stores are relabeled the same way.
+
+    Args:
+        filepath (str): Path to the TIF file or Zarr store.
+        mapping (dict): Old value -> new value.
+        output_options (TiffOutputOptions, optional): Encoding of the rewritten
+            file; uncompressed by default.
+        out_dtype (numpy.dtype, optional): Data type of the rewritten file,
+            e.g. uint16 for new values above 255 in a uint8 file.
+
+    Returns:
+        bool: True if the file was rewritten.
+
+    Raises:
+        ValueError: If a new value does not fit in the output data type.
+    """
+    mapping = _normalize_mapping(mapping)
+    if not mapping and out_dtype is None:
+        return False
+    temp_path = _relabel_to_temp(filepath, mapping, TiffOutputOptions.from_dict(output_options), out_dtype)
+    if temp_path is None:
+        return False
+    replace_stack(temp_path, filepath)
+    return True
+
+
+@tracing.traced("relabel")
+def relabel_tif_files(filepaths, mapping, max_workers=None, progress=None, output_options=None, resume=True,
+                      out_dtype=None):
+    """
+    Relabels many TIF files in parallel, reading and writing each file once.
+
+    Each file is recorded in a Manifest in its folder just before its
+    relabeled version replaces it. Running the same mapping again, after an
+    interruption or after it completed, only processes the files that were
+    not finished, so a mapping is never applied to a file twice.
+
+    Args:
+        filepaths (list): Paths of the TIF files to relabel.
+        mapping (dict): Old value -> new value, applied in a single pass.
+        max_workers (int, optional): Number of worker processes. Defaults to
+            the number of CPUs; 1 runs everything in the calling process.
+        progress (callable, optional): Called as progress(files_done, num_files, bytes_read).
+            Files already being rewritten when it cancels are left unchanged.
+        output_options (TiffOutputOptions, optional): Encoding of the rewritten
+            files; uncompressed by default.
+        resume (bool): Skip files already relabeled with this mapping. False
+            applies the mapping to every file again.
+        out_dtype (numpy.dtype, optional): Data type of the rewritten files;
+            each file keeps its own by default.
+
+    Returns:
+        list: Paths of the files that were rewritten.
+    """
+    filepaths = list(filepaths)
+    mapping = _normalize_mapping(mapping)
+    if not mapping and out_dtype is None:
+        return []
+    output_options = TiffOutputOptions.from_dict(output_options)
+
+    # Only the mapping and dtype decide the result; other output options must not relabel a file again
+    params = {"mapping": sorted(mapping.items())}
+    if out_dtype is not None:
+        out_dtype = np.dtype(out_dtype)
+        params["dtype"] = out_dtype.name
+    manifests = {}
+
+    def manifest_for(path):
+        folder = os.path.dirname(path) or "."
+        if folder not in manifests:
+            manifests[folder] = Manifest(folder, "relabel", params, resume=resume)
+        return manifests[folder]
+
+    pending = [path for path in filepaths if not manifest_for(path).is_done(os.path.basename(path), inputs=[path])]
+    if len(pending) < len(filepaths):
+        print(f"Skipping {len(filepaths) - len(pending)} file(s) already relabeled with this mapping.")
+    changed_files = []
+    files_done = len(filepaths) - len(pending)
+    bytes_read = 0
+    if progress and files_done:
+        progress(files_done, len(filepaths), 0)
+
+    def commit(path, temp_path):
+        """Journal the new state of a file, then move it into place."""
+        nonlocal files_done, bytes_read
+        if temp_path is None:
+            manifest_for(path).record(os.path.basename(path), [path])
+        else:
+            # The rename keeps size and mtime, so the journal can name the final stamp in advance
+            manifest_for(path).record(os.path.basename(path), {path: file_stamp(temp_path)})
+            replace_stack(temp_path, path)
+            changed_files.append(path)
+        print(f"Processed file: {os.path.basename(path)}")
+        files_done += 1
+        bytes_read += file_stamp(path)[0]
+        if progress:
+            progress(files_done, len(filepaths), bytes_read)
+
+    if max_workers == 1 or len(pending) <= 1:
+        for path in pending:
+            commit(path, _relabel_to_temp(path, mapping, output_options, out_dtype))
+        return changed_files
+
+    # The processes already keep every CPU busy, so each remaps its file in one thread
+    committed = set()
+    relabel = tracing.bind(_relabel_to_temp)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(relabel, path, mapping, output_options, out_dtype, 1): path for path in pending
+        }
+        try:
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    temp_path = future.result()
+                except Exception as e:
+                    raise RuntimeError(f"{os.path.basename(path)}: {e}") from e
+                commit(path, temp_path)
+                committed.add(future)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+            # Files that finished after the failure keep their old content
+            for future in futures:
+                if future in committed or not future.done() or future.cancelled() or future.exception():
+                    continue
+                if future.result():
+                    remove_stack(future.result())
+            raise
+    return changed_files
+
+
+@tracing.traced("label_counts", file="filepath")
+def compute_label_counts(filepath):
+    """
+    Counts the voxels of every value in a TIF file, one frame at a time.
+
+    Args:
+        filepath (str): Path to the TIF file.
+
+    Returns:
+        dict: Value -> voxel count.
+    """
+    counts = {}
+    with TiffStackReader(filepath) as reader:
+        use_bincount = reader.dtype.kind == "u" and reader.dtype.itemsize <= 2
+        totals = np.zeros(2 ** (8 * reader.dtype.itemsize), dtype=np.int64) if use_bincount else None
+        for frame_data in reader.iter_frames():
+            if use_bincount:
+                frame_counts = np.bincount(frame_data.ravel())
+                totals[:len(frame_counts)] += frame_counts
+            else:
+                values, value_counts = np.unique(frame_data, return_counts=True)
+                for value, count in zip(values.tolist(), value_counts.tolist()):
+                    counts[value] = counts.get(value, 0) + count
+    if totals is not None:
+        counts = {int(value): int(totals[value]) for value in np.flatnonzero(totals)}
+    return counts
+
+
+class LabelStatsCache:
+    """
+    Sidecar JSON index of per-file label statistics for a folder of TIF files.
+
+    Entries are keyed by file name and stamped with the file's size and
+    modification time, so only new or changed files are decoded again; entries
+    for deleted files are dropped. The index lives in the folder itself and is
+    shared by the recolor dialog and the dataset.json label scan.
+
+    Args:
+        folder (str): Folder containing the TIF files.
+    """
+
+    FILE_NAME = ".label_stats.json"
+    VERSION = 1
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, self.FILE_NAME)
+        self._entries = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r") as json_file:
+                content = json.load(json_file)
+            if content.get("version") == self.VERSION:
+                self._entries = content.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def scan(self, max_workers=None, progress=None):
+        """
+        Brings the index up to date and returns the statistics of every file.
+
+        Args:
+            max_workers (int, optional): Number of worker processes used to
+                decode new or changed files.
+            progress (callable, optional): Called as progress(files_done, num_files, bytes_read)
+                for the new or changed files.
+
+        Returns:
+            dict: File name -> {value: voxel count}.
+        """
+        stamps = {}
+        for fname in os.listdir(self.folder):
+            filepath = os.path.join(self.folder, fname)
+            if fname.endswith(".tif") and os.path.isfile(filepath):
+                stat = os.stat(filepath)
+                stamps[fname] = (stat.st_size, stat.st_mtime_ns)
+
+        for fname in set(self._entries) - set(stamps):
+            del self._entries[fname]
+            self._dirty = True
+
+        stale = [
+            fname for fname, (size, mtime_ns) in stamps.items()
+            if fname not in self._entries
+            or self._entries[fname]["size"] != size
+            or self._entries[fname]["mtime_ns"] != mtime_ns
+        ]
+        if stale:
+            print(f"Scanning label values in {len(stale)} file(s)...")
+            filepaths = [os.path.join(self.folder, fname) for fname in stale]
+            if max_workers == 1 or len(stale) == 1:
+                self._store(stale, map(compute_label_counts, filepaths), stamps, progress)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                    self._store(stale, pool.map(tracing.bind(compute_label_counts), filepaths), stamps, progress)
+
+        self.save()
+        return {fname: self.counts(fname) for fname in sorted(stamps)}
+
+    def _store(self, fnames, results, stamps, progress=None):
+        bytes_read = 0
+        for files_done, (fname, counts) in enumerate(zip(fnames, results), start=1):
+            size, mtime_ns = stamps[fname]
+            self._entries[fname] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "counts": {str(value): count for value, count in counts.items()},
+            }
+            self._dirty = True
+            bytes_read += size
+            if progress:
+                progress(files_done, len(fnames), bytes_read)
+
+    def record(self, fname, counts):
+        """Store counts computed elsewhere, e.g. during import, under the file's current stamp."""
+        stat = os.stat(os.path.join(self.folder, fname))
+        self._entries[fname] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "counts": {str(value): count for value, count in counts.items()},
+        }
+        self._dirty = True
+
+    def counts(self, fname):
+        """Return the cached {value: voxel count} of one file."""
+        return {_parse_label_value(value): count for value, count in self._entries[fname]["counts"].items()}
+
+    def save(self):
+        """Write the index atomically if it changed; a read-only folder just goes uncached."""
+        if not self._dirty:
+            return
+        content = {"version": self.VERSION, "files": self._entries}
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as json_file:
+                json.dump(content, json_file)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not write label cache {self.path}: {e}")
+
+
+def _parse_label_value(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def scan_label_values(folder, max_workers=None, progress=None):
+    """
+    Returns the sorted union of the values found in all TIF files of a folder.
+
+    Args:
+        folder (str): Folder containing the TIF files.
+        max_workers (int, optional): Number of worker processes for uncached files.
+        progress (callable, optional): Called as progress(files_done, num_files, bytes_read)
+            for the uncached files.
+
+    Returns:
+        list: Sorted unique values.
+    """
+    unique_values = set()
+    for counts in LabelStatsCache(folder).scan(max_workers=max_workers, progress=progress).values():
+        unique_values.update(counts)
+    return sorted(unique_values)
+
+
+def validate_dataset_id(dataset_id):
+    """
+    Checks that a dataset ID is a 3-digit number.
+
+    Args:
+        dataset_id (str): Dataset ID, e.g. "001".
+
+    Returns:
+        str: The stripped dataset ID.
+
+    Raises:
+        ValueError: If the ID is not a 3-digit number.
+    """
+    dataset_id = str(dataset_id).strip()
+    if not dataset_id.isdigit() or len(dataset_id) != 3:
+        raise ValueError("Dataset ID must be a 3-digit number (e.g., 001).")
+    return dataset_id
+
+
+def dataset_folder(dataset_id, dataset_name, raw_path=None):
+    """Return the nnUNet_raw folder of a dataset, e.g. .../Dataset001_Name."""
+    return os.path.join(raw_path or NNUNET_RAW, f"Dataset{dataset_id}_{dataset_name}")
+
+
+def find_dataset_folder(dataset_id, raw_path=None):
+    """
+    Finds the nnUNet_raw folder of a dataset from its ID alone.
+
+    Args:
+        dataset_id (str): Dataset ID, e.g. "1" or "001".
+        raw_path (str, optional): nnUNet_raw folder. Defaults to NNUNET_RAW.
+
+    Returns:
+        str: Path of the Dataset<ID>_<Name> folder.
+
+    Raises:
+        FileNotFoundError: If no folder, or more than one, has that ID.
+    """
+    raw_path = raw_path or NNUNET_RAW
+    prefix = f"Dataset{int(dataset_id):03d}_"
+    try:
+        matches = sorted(name for name in os.listdir(raw_path)
+                         if name.startswith(prefix) and os.path.isdir(os.path.join(raw_path, name)))
+    except OSError:
+        matches = []
+    if len(matches) != 1:
+        found = f": {', '.join(matches)}" if matches else ""
+        raise FileNotFoundError(f"Expected one {prefix}* folder in {raw_path}, found {len(matches)}{found}.")
+    return os.path.join(raw_path, matches[0])
+
+
+def create_json(file_path, metadata=None):
+    """
+    Generate a JSON file with spacing metadata.
+
+    Args:
+        file_path (str): TIF file the JSON belongs to.
+        metadata (dict, optional): Result of tiff_metadata.compute_file_metadata,
+            stored alongside the spacing. Without it the spacing is [1, 1, 1].
+    """
+    json_file_path = file_path.replace(".tif", ".json")
+    print(f"Creating JSON file: {json_file_path}")
+    tiff_metadata.write_sidecar(json_file_path, metadata or {"spacing": [1, 1, 1]})
+
+
+def _spacing_from_image(label_metadata, image_metadata, label_file):
+    """
+    Give a label the spacing of its case image, which nnUNet requires to match.
+
+    Masks exported from other tools often lose the calibration of the image,
+    so a label without a spacing of its own silently takes the image's; a
+    label stating a different spacing is overridden with a warning.
+    """
+    if not image_metadata or "spacing" not in image_metadata:
+        return label_metadata
+    spacing = [float(value) for value in image_metadata["spacing"]]
+    label_spacing = [float(value) for value in label_metadata.get("spacing", [])]
+    if label_spacing == spacing:
+        return label_metadata
+    if label_metadata.get("spacing_source", "default") not in ("default", "image"):
+        print(f"Warning: {label_file} states spacing {label_spacing}, its image {spacing}; using the image's.")
+    return dict(label_metadata, spacing=spacing, spacing_source="image")
+
+
+# How create_folder_structure brings files into nnUNet_raw
+IMPORT_MODES = ("copy", "auto", "reflink", "hardlink", "symlink")
+
+# ioctl request number of Linux's FICLONE (copy-on-write clone of a whole file)
+_FICLONE = 0x40049409
+
+
+def _reflink(src_file, dest_file):
+    """Clone a file copy-on-write (Btrfs, XFS, ...); raises OSError where unsupported."""
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are only supported on Linux.")
+    import fcntl
+
+    with open(src_file, "rb") as src, open(dest_file, "wb") as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.remove(dest_file)
+            raise
+    shutil.copystat(src_file, dest_file)
+
+
+@tracing.traced("transfer", file="src_file")
+def transfer_file(src_file, dest_file, mode="copy"):
+    """
+    Brings one file into the dataset, skipping it if it is already there.
+
+    A destination with the same size and modification time as the source is
+    considered up to date. "auto" tries a reflink, then a hardlink, then falls
+    back to a copy. Linked files are safe to relabel afterwards because the
+    writers in this module replace files instead of modifying them in place.
+
+    Args:
+        src_file (str): Source file.
+        dest_file (str): Destination file.
+        mode (str): One of IMPORT_MODES.
+
+    Returns:
+        str: How the file was transferred ("copy", "reflink", "hardlink",
+        "symlink") or "skipped".
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode {mode!r}; expected one of {', '.join(IMPORT_MODES)}.")
+
+    src_stat = os.stat(src_file)
+    if os.path.exists(dest_file):
+        dest_stat = os.stat(dest_file)
+        if dest_stat.st_size == src_stat.st_size and int(dest_stat.st_mtime) == int(src_stat.st_mtime):
+            return "skipped"
+    if os.path.lexists(dest_file):
+        os.remove(dest_file)
+
+    if mode == "symlink":
+        os.symlink(os.path.abspath(src_file), dest_file)
+        return "symlink"
+    if mode in ("reflink", "auto"):
+        try:
+            _reflink(src_file, dest_file)
+            return "reflink"
+        except OSError:
+            if mode == "reflink":
+                raise
+    if mode in ("hardlink", "auto"):
+        try:
+            os.link(src_file, dest_file)
+            return "hardlink"
+        except OSError:
+            if mode == "hardlink":
+                raise
+    # Copy under a temporary name, so an interrupted copy is never taken for a finished one
+    partial_file = dest_file + ".partial"
+    with tracing.phase("io", bytes_read=src_stat.st_size, bytes_written=src_stat.st_size):
+        shutil.copy2(src_file, partial_file)
+    os.replace(partial_file, dest_file)
+    return "copy"
+
+
+@tracing.traced("create_dataset", file="input_folder")
+def create_folder_structure(input_folder, dataset_id, dataset_name, raw_path=None, mode="copy",
+                            max_workers=8, progress=None, resume=True, metadata_workers=None):
+    """
+    Creates the nnUNet folder structure for a dataset and brings its files in.
+
+    Images get the `_0000` channel suffix and every file gets a spacing JSON.
+    As soon as a file is transferred, worker processes read it once to take
+    its spacing from the ImageJ/OME metadata and to compute its shape, dtype,
+    intensity percentiles or label counts (see tiff_metadata). The results go
+    into the spacing JSON, the dataset's MetadataIndex and the label stats
+    cache of labelsTr, so later steps do not decode the files again. Labels
+    get the spacing of their case's image, as nnUNet rejects cases whose
+    spacings differ.
+
+    Files are transferred concurrently, and files that are already present with
+    the same size and modification time are skipped, so re-running an import
+    only handles what changed. Every imported file is recorded in a Manifest
+    in the dataset folder; files whose source, destination and spacing JSON
+    are unchanged since are skipped without being looked at again.
+
+    Args:
+        input_folder (str): Folder containing imagesTr, labelsTr and optionally imagesTs.
+        dataset_id (str): 3-digit dataset ID.
+        dataset_name (str): Dataset name.
+        raw_path (str, optional): nnUNet_raw folder. Defaults to NNUNET_RAW.
+        mode (str): How files are transferred, one of IMPORT_MODES (see transfer_file).
+        max_workers (int): Number of concurrent transfers.
+        progress (callable, optional): Called as progress(files_done, num_files, bytes_copied).
+        resume (bool): Skip files the manifest records as imported. False
+            checks every file again.
+        metadata_workers (int, optional): Worker processes computing the
+            file metadata. Defaults to the number of CPUs.
+
+    Returns:
+        str: Path of the created dataset folder.
+    """
+    dataset_id = validate_dataset_id(dataset_id)
+    if not dataset_name:
+        raise ValueError("Please enter a dataset name!")
+
+    # Destination folder
+    base_path = dataset_folder(dataset_id, dataset_name, raw_path)
+    imagesTr_path = os.path.join(base_path, "imagesTr")
+    imagesTs_path = os.path.join(base_path, "imagesTs")
+    labelsTr_path = os.path.join(base_path, "labelsTr")
+
+    # Create directories
+    os.makedirs(imagesTr_path, exist_ok=True)
+    os.makedirs(imagesTs_path, exist_ok=True)
+    os.makedirs(labelsTr_path, exist_ok=True)
+    print(f"Directories created at: {base_path}")
+
+    # Collect the files first so progress can be reported against a total
+    copies = []
+    for root, dirs, files in os.walk(input_folder):
+        for file in files:
+            if file.endswith(".tif"):
+                src_file = os.path.join(root, file)
+                rel_dir = os.path.relpath(root, input_folder)
+
+                if rel_dir == "imagesTr":
+                    dest_file = os.path.join(imagesTr_path, file.replace(".tif", "_0000.tif"))
+                    copies.append((src_file, dest_file, os.path.join(imagesTr_path, file)))
+
+                elif rel_dir == "imagesTs":
+                    dest_file = os.path.join(imagesTs_path, file.replace(".tif", "_0000.tif"))
+                    copies.append((src_file, dest_file, os.path.join(imagesTs_path, file)))
+
+                elif rel_dir == "labelsTr":
+                    dest_file = os.path.join(labelsTr_path, file)
+                    copies.append((src_file, dest_file, dest_file))
+
+    journal = Manifest(base_path, "import", {"mode": mode}, resume=resume)
+    pending = [copy for copy in copies if not journal.is_done(journal.relative(copy[1]), inputs=[copy[0]])]
+    counts = {"skipped": len(copies) - len(pending)} if len(pending) < len(copies) else {}
+
+    index = tiff_metadata.MetadataIndex(base_path)
+    label_cache = LabelStatsCache(labelsTr_path)
+    bytes_copied = 0
+    files_done = len(copies) - len(pending)
+    if progress and files_done:
+        progress(files_done, len(copies), 0)
+
+    # Labels wait for the metadata of their case's image, to take its spacing
+    images_pending = {os.path.basename(copy[2]) for copy in pending if os.path.dirname(copy[2]) == imagesTr_path}
+    image_metadata = {}
+    waiting_labels = {}
+
+    def finish(copy, how, metadata):
+        """Write the JSON and indexes of an imported file and journal it."""
+        nonlocal bytes_copied, files_done
+        src_file, dest_file, json_file = copy
+        case = os.path.basename(json_file)
+        if os.path.dirname(dest_file) == labelsTr_path:
+            if case in images_pending:
+                waiting_labels[case] = (copy, how, metadata)
+                return
+            image = image_metadata.get(case) or tiff_metadata.read_sidecar(
+                os.path.join(imagesTr_path, case).replace(".tif", ".json")
+            )
+            metadata = _spacing_from_image(metadata, image, dest_file)
+        create_json(json_file, metadata)
+        index.update(dest_file, metadata)
+        if "label_counts" in metadata:
+            label_cache.record(os.path.basename(dest_file), metadata["label_counts"])
+        journal.record(journal.relative(dest_file), [src_file, dest_file, json_file.replace(".tif", ".json")])
+        print(f"Processing file: {src_file} ({how})")
+        counts[how] = counts.get(how, 0) + 1
+        bytes_copied += os.path.getsize(src_file)
+        files_done += 1
+        if progress:
+            progress(files_done, len(copies), bytes_copied)
+        if os.path.dirname(json_file) == imagesTr_path:
+            image_metadata[case] = metadata
+            images_pending.discard(case)
+            if case in waiting_labels:
+                finish(*waiting_labels.pop(case))
+
+    # Transfers run on threads; each finished one is handed to a process for its metadata
+    compute_metadata = tracing.bind(tiff_metadata.compute_file_metadata)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            ProcessPoolExecutor(max_workers=metadata_workers) as metadata_pool:
+        transfers = {pool.submit(tracing.bind(transfer_file), copy[0], copy[1], mode): copy for copy in pending}
+        metadata_jobs = {}
+        try:
+            while transfers or metadata_jobs:
+                done, _ = wait(list(transfers) + list(metadata_jobs), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in transfers:
+                        copy = transfers.pop(future)
+                        how = future.result()
+                        metadata = index.get(copy[1]) if how == "skipped" else None
+                        if metadata is None:
+                            is_label = os.path.dirname(copy[1]) == labelsTr_path
+                            job = metadata_pool.submit(compute_metadata, copy[1], labels=is_label)
+                            metadata_jobs[job] = (copy, how)
+                        else:
+                            finish(copy, how, metadata)
+                    else:
+                        copy, how = metadata_jobs.pop(future)
+                        finish(copy, how, future.result())
+            images_pending.clear()
+            for waiting in list(waiting_labels.values()):
+                finish(*waiting)
+        except BaseException:
+            for future in list(transfers) + list(metadata_jobs):
+                future.cancel()
+            raise
+        finally:
+            # Keep what was computed before an interruption
+            index.save()
+            label_cache.save()
+
+    summary = ", ".join(f"{count} {how}" for how, count in sorted(counts.items()))
+    print(f"Imported {len(copies)} files into {base_path}" + (f" ({summary})" if summary else ""))
+    return base_path
+
+
+def analyze_labels(labels_folder):
+    """
+    Analyzes the label values used across all TIF files of a labels folder.
+
+    Args:
+        labels_folder (str): Folder containing the label TIF files.
+
+    Returns:
+        list: Sorted label values, or None if there is no labelled file.
+    """
+    if not os.path.exists(labels_folder):
+        return None
+    label_values = scan_label_values(labels_folder)
+    return list(map(int, label_values)) or None  # Convert to standard Python int
+
+
+def generate_dataset_json(dataset_dir, labels, num_training=None, channel_names=None, file_ending=".tif"):
+    """
+    Writes the dataset.json of an nnUNet dataset.
+
+    Args:
+        dataset_dir (str): Dataset folder in nnUNet_raw.
+        labels (dict): Label name -> label value; "background" is added as 0 if missing.
+        num_training (int, optional): Number of training cases. Defaults to the
+            number of images in the dataset's imagesTr folder.
+        channel_names (dict, optional): Channel index -> name. Defaults to {"0": "Tomo"}.
+        file_ending (str): File ending of the images and labels.
+
+    Returns:
+        str: Path of the written dataset.json.
+    """
+    label_dict = {"background": 0}
+    label_dict.update({name: int(value) for name, value in labels.items()})
+    if num_training is None:
+        images_dir = os.path.join(dataset_dir, "imagesTr")
+        num_training = len([f for f in os.listdir(images_dir) if f.endswith(file_ending)])
+
+    dataset_json_content = {
+        "channel_names": channel_names or {"0": "Tomo"},
+        "labels": label_dict,
+        "numTraining": num_training,
+        "file_ending": file_ending,
+    }
+
+    json_path = os.path.join(dataset_dir, "dataset.json")
+    with open(json_path, "w") as json_file:
+        json.dump(dataset_json_content, json_file, indent=4)
+    print(f"dataset.json created at {json_path}")
+    return json_path
+
+
+def plan_and_preprocess_command(dataset_ids, num_processes=None, num_processes_fingerprint=None):
+    """
+    Builds the nnUNetv2_plan_and_preprocess command line for some datasets.
+
+    Args:
+        dataset_ids (list): Dataset IDs, e.g. ["1", "2"].
+        num_processes (int or list, optional): Preprocessing processes (-np),
+            one number for all configurations or one per configuration.
+        num_processes_fingerprint (int, optional): Fingerprint extraction processes (-npfp).
+
+    Returns:
+        list: The command and its arguments.
+    """
+    dataset_ids = [str(dataset_id) for dataset_id in dataset_ids]
+    if not dataset_ids or not all(dataset_id.isdigit() for dataset_id in dataset_ids):
+        raise ValueError("All Dataset IDs must be numbers (e.g., 1 2 3).")
+    command = ["nnUNetv2_plan_and_preprocess", "-d", *dataset_ids, "--verify_dataset_integrity"]
+    if num_processes_fingerprint is not None:
+        if int(num_processes_fingerprint) <= 0:
+            raise ValueError("The number of fingerprint processes must be a positive integer.")
+        command += ["-npfp", str(int(num_processes_fingerprint))]
+    if num_processes is not None:
+        if isinstance(num_processes, (int, str)):
+            num_processes = [num_processes]
+        num_processes = [int(count) for count in num_processes]
+        if not num_processes or min(num_processes) <= 0:
+            raise ValueError("The numbers of preprocessing processes must be positive integers.")
+        command += ["-np", *map(str, num_processes)]
+    return command
+
+
+def plan_and_preprocess(dataset_ids):
+    """
+    Runs nnUNetv2_plan_and_preprocess with dataset integrity verification.
+
+    Args:
+        dataset_ids (list): Dataset IDs, e.g. ["1", "2"].
+
+    Returns:
+        int: Exit code of the command.
+    """
+    command = plan_and_preprocess_command(dataset_ids)
+    print(f"Executing command: {' '.join(command)}")
+    return subprocess.call(command)
+
+
+# How combine_labels resolves voxels that are foreground in several masks
+COMBINE_PRIORITIES = ("last", "first", "max", "min")
+
+
+@tracing.traced("combine", file="output_file")
+def combine_labels(label_files, output_file, threshold=255, priority="last", progress=None, output_options=None,
+                   out_dtype=None, threads=None):
+    """
+    Combines binary masks into a single label TIFF, a chunk of frames at a time.
+
+    All masks are read in lockstep, a chunk of frames at a time, and merged
+    into the output chunk with label_kernels.merge_masks on a thread pool, so
+    memory stays at a few chunks per input regardless of volume size. The
+    output is written incrementally under a ".partial" name and renamed once
+    complete, so a failed or cancelled run leaves no truncated file behind.
+    Masks may be TIFF files or Zarr stores; a `.zarr` output path writes a
+    Zarr store.
+
+    Args:
+        label_files (dict): Mask file path -> label value.
+        output_file (str): Path of the combined TIFF.
+        threshold (int): Mask voxels >= threshold are foreground.
+        priority (str): Which label wins where masks overlap: "last" or "first"
+            in the order given, or the "max" or "min" label value.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        output_options (TiffOutputOptions, optional): Encoding of the output; uncompressed by default.
+        out_dtype (numpy.dtype, optional): Data type of the output. Defaults to
+            the smallest integer type holding every label value.
+        threads (int, optional): Threads merging chunks; see label_kernels.run_chunked.
+
+    Returns:
+        str: Path of the combined TIFF.
+
+    Raises:
+        ValueError: If the masks differ in shape, a label value does not fit
+            in `out_dtype` or an option is invalid.
+    """
+    if priority not in COMBINE_PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}; expected one of {', '.join(COMBINE_PRIORITIES)}.")
+    output_options = TiffOutputOptions.from_dict(output_options)
+    items = [(file, int(label_value)) for file, label_value in label_files.items()]
+    if not items:
+        raise ValueError("Please select at least one TIFF file.")
+
+    # Later masks overwrite earlier ones, so the winner goes last
+    if priority == "first":
+        items.reverse()
+    elif priority == "max":
+        items.sort(key=lambda item: item[1])
+    elif priority == "min":
+        items.sort(key=lambda item: -item[1])
+    label_values = [label_value for _, label_value in items]
+    if out_dtype is None:
+        out_dtype = label_kernels.label_dtype(label_values)
+    out_dtype = np.dtype(out_dtype)
+    label_kernels.check_fits(label_values, out_dtype)
+
+    partial_file = output_file + ".partial"
+    with ExitStack() as stack:
+        finished = False
+
+        def remove_partial_file():
+            if not finished:
+                remove_stack(partial_file)
+
+        # Callbacks run in reverse order: this one last, after the readers and the writer are closed
+        stack.callback(remove_partial_file)
+        readers = [stack.enter_context(open_stack(file)) for file, _ in items]
+        shape = (readers[0].num_frames,) + readers[0].frame_shape
+        for reader in readers[1:]:
+            if (reader.num_frames,) + reader.frame_shape != shape:
+                raise ValueError(
+                    f"All masks must have the same shape: {os.path.basename(reader.path)} is "
+                    f"{(reader.num_frames,) + reader.frame_shape}, {os.path.basename(readers[0].path)} is {shape}."
+                )
+
+        writer = stack.enter_context(open_stack_writer(partial_file, shape, out_dtype, output_options,
+                                                       target=output_file))
+
+        def merge_chunk(chunks, out):
+            return label_kernels.merge_masks(chunks, label_values, threshold, out)
+
+        label_kernels.run_chunked(merge_chunk, readers, writer, out_dtype, threads=threads, progress=progress)
+        finished = True
+
+    replace_stack(partial_file, output_file)
+    print(f"Combined TIFF saved at {output_file}")
+    return output_file
+
+
+@tracing.traced("binarize", file="input_file")
+def binarize_stack(input_file, output_file, threshold, foreground=1, out_dtype=np.uint8, progress=None,
+                   output_options=None, threads=None):
+    """
+    Thresholds a stack, e.g. a probability map, into a binary label stack.
+
+    Voxels >= threshold become `foreground`, all others 0. Chunks of frames
+    are binarized in place on a thread pool (see label_kernels.run_chunked).
+    The output is written under a ".partial" name and renamed once complete.
+
+    Args:
+        input_file (str): TIFF file or Zarr store to threshold.
+        output_file (str): Path of the label stack; a `.zarr` path writes a Zarr store.
+        threshold (float): Smallest foreground value.
+        foreground (int): Label value of the foreground.
+        out_dtype (numpy.dtype): Data type of the output.
+        progress (callable, optional): Called as progress(frames_done, num_frames, bytes_read).
+        output_options (TiffOutputOptions, optional): Encoding of the output; uncompressed by default.
+        threads (int, optional): Threads binarizing chunks.
+
+    Returns:
+        str: Path of the label stack.
+
+    Raises:
+        ValueError: If `foreground` does not fit in `out_dtype`.
+    """
+    out_dtype = np.dtype(out_dtype)
+    label_kernels.check_fits([foreground], out_dtype)
+    output_options = TiffOutputOptions.from_dict(output_options)
+    partial_file = output_file + ".partial"
+    with ExitStack() as stack:
+        finished = False
+
+        def remove_partial_file():
+            if not finished:
+                remove_stack(partial_file)
+
+        # Callbacks run in reverse order: this one last, after the reader and the writer are closed
+        stack.callback(remove_partial_file)
+        reader = stack.enter_context(open_stack(input_file))
+        shape = (reader.num_frames,) + reader.frame_shape
+        writer = stack.enter_context(open_stack_writer(partial_file, shape, out_dtype, output_options,
+                                                       target=output_file))
+
+        def binarize_chunk(chunks, out):
+            return label_kernels.binarize(chunks[0], threshold, foreground, out=out)
+
+        label_kernels.run_chunked(binarize_chunk, [reader], writer, out_dtype, threads=threads, progress=progress)
+        finished = True
+
+    replace_stack(partial_file, output_file)
+    print(f"Binarized stack saved at {output_file}")
+    return output_file
+
+
+def substack_windows(start_frame, end_frame, substack_size, stride=None, include_partial=False):
+    """
+    Lists the (first, last) frames of the substacks in a frame range.
+
+    Args:
+        start_frame (int): First frame of the range.
+        end_frame (int): Last frame of the range (inclusive).
+        substack_size (int): Number of frames per substack.
+        stride (int, optional): Frames between substack starts; smaller than
+            `substack_size` gives overlapping windows. Defaults to `substack_size`.
+        include_partial (bool): Keep the shorter trailing substack instead of
+            ignoring the leftover frames.
+
+    Returns:
+        list: (first_frame, last_frame) tuples, both inclusive.
+    """
+    stride = stride or substack_size
+    if substack_size <= 0 or stride <= 0:
+        raise ValueError("Substack size and stride must be positive integers.")
+    windows = []
+    for first_frame in range(start_frame, end_frame + 1, stride):
+        last_frame = first_frame + substack_size - 1
+        if last_frame > end_frame:
+            if include_partial:
+                windows.append((first_frame, end_frame))
+            break
+        windows.append((first_frame, last_frame))
+        if last_frame == end_frame:
+            break
+    return windows
+
+
+@tracing.traced("substack", file="output_path")
+def _write_substack(input_file, output_path, first_frame, last_frame, output_options):
+    """
+    Copy frames first_frame..last_frame of a stack into a new TIFF or Zarr store; returns bytes written.
+
+    The substack is written under a ".partial" name and renamed once complete.
+    """
+    partial_path = output_path + ".partial"
+    bytes_written = 0
+    with ExitStack() as stack:
+        finished = False
+
+        def remove_partial_output():
+            if not finished:
+                remove_stack(partial_path)
+
+        # Callbacks run in reverse order: this one last, after the reader and the writer are closed
+        stack.callback(remove_partial_output)
+        reader = stack.enter_context(open_stack(input_file))
+        shape = (last_frame - first_frame + 1,) + reader.frame_shape
+        writer = stack.enter_context(open_stack_writer(partial_path, shape, reader.dtype, output_options,
+                                                       target=output_path))
+        for frame_data in reader.iter_frames(first_frame, last_frame + 1):
+            writer.write(frame_data)
+            bytes_written += frame_data.nbytes
+        finished = True
+
+    replace_stack(partial_path, output_path)
+    return bytes_written
+
+
+@tracing.traced("substacks", file="input_file")
+def create_substacks(input_file, output_dir, start_frame, end_frame, substack_size, stride=None,
+                     include_partial=False, max_workers=4, progress=None, output_options=None):
+    """
+    Splits a frame range of a TIFF stack into substacks.
+
+    Only the requested pages are read (memory-mapped when the stack is
+    uncompressed), so time and memory scale with the frames extracted rather
+    than with the file size. Substacks are written in parallel and named after
+    their original frame numbers, e.g. substack_10_19.tif. Substacks of a Zarr
+    store are Zarr stores and only decode the chunks of their frames.
+
+    Args:
+        input_file (str): Path to the TIFF file or Zarr store.
+        output_dir (str): Directory the substacks are written to.
+        start_frame (int): First frame of the range.
+        end_frame (int): Last frame of the range (inclusive).
+        substack_size (int): Number of frames per substack.
+        stride (int, optional): Frames between substack starts, for overlapping
+            windows. Defaults to `substack_size`.
+        include_partial (bool): Also write the shorter trailing substack.
+        max_workers (int): Number of substacks written concurrently.
+        progress (callable, optional): Called as progress(substacks_done, num_substacks, bytes_written).
+        output_options (TiffOutputOptions, optional): Encoding of the substacks; uncompressed by default.
+
+    Returns:
+        int: Number of substacks written.
+
+    Raises:
+        ValueError: If the frame range is out of bounds.
+    """
+    with open_stack(input_file) as reader:
+        num_frames = reader.num_frames
+    suffix = _output_suffix(input_file)
+
+    if start_frame < 0 or end_frame >= num_frames or start_frame > end_frame:
+        raise ValueError("Start or end frame is out of bounds.")
+
+    windows = substack_windows(start_frame, end_frame, substack_size, stride, include_partial)
+    output_options = TiffOutputOptions.from_dict(output_options)
+
+    substack_count = 0
+    bytes_written = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(
+                tracing.bind(_write_substack), input_file,
+                os.path.join(output_dir, f"substack_{first_frame}_{last_frame}{suffix}"), first_frame, last_frame,
+                output_options,
+            )
+            for first_frame, last_frame in windows
+        ]
+        try:
+            for future in as_completed(futures):
+                bytes_written += future.result()
+                substack_count += 1
+                if progress:
+                    progress(substack_count, len(windows), bytes_written)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    print(f"Successfully created {substack_count} substacks in '{output_dir}'.")
+    return substack_count
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_cli  # noqa: E402
+
+
+@pytest.fixture
+def label_folder(tmp_path):
+    """A folder with two 0/255 masks; the second covers the right half of the first."""
+    folder = tmp_path / "labels"
+    folder.mkdir()
+    first = np.zeros((3, 4, 6), np.uint8)
+    first[:, :, :3] = 255
+    second = np.zeros_like(first)
+    second[:, :, 2:] = 255
+    tiff.imwrite(str(folder / "first.tif"), first, photometric="minisblack")
+    tiff.imwrite(str(folder / "second.tif"), second, photometric="minisblack")
+    return folder
+
+
+def test_parse_pairs():
+    assert nnunet_cli._parse_pairs(["255=1", "128=2"]) == {"255": 1, "128": 2}
+    # Paths may contain "=", so only the last one separates the value
+    assert nnunet_cli._parse_pairs(["a=b.tif=3"]) == {"a=b.tif": 3}
+    assert nnunet_cli._parse_pairs(["mito=1"], value_type=str) == {"mito": "1"}
+    for bad in ("255", "=1"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            nnunet_cli._parse_pairs([bad])
+
+
+def test_load_jobs_json(tmp_path):
+    jobs = [{"operation": "cut", "input_files": ["a.tif"], "x_divisions": 2}]
+    job_file = str(tmp_path / "jobs.json")
+    for content in (jobs, {"jobs": jobs}):
+        with open(job_file, "w") as f:
+            json.dump(content, f)
+        assert nnunet_cli.load_jobs(job_file) == jobs
+
+    with open(job_file, "w") as f:
+        json.dump({"jobs": ["cut"]}, f)
+    with pytest.raises(ValueError):
+        nnunet_cli.load_jobs(job_file)
+
+
+def test_load_jobs_yaml(tmp_path):
+    pytest.importorskip("yaml")
+    job_file = str(tmp_path / "jobs.yaml")
+    with open(job_file, "w") as f:
+        f.write("jobs:\n"
+                "  - operation: recolor\n"
+                "    folder: /data/labelsTr\n"
+                "    mapping: {255: 1}\n"
+                "    output: {compression: zstd}\n")
+
+    assert nnunet_cli.load_jobs(job_file) == [
+        {"operation": "recolor", "folder": "/data/labelsTr", "mapping": {255: 1}, "output": {"compression": "zstd"}}
+    ]
+
+
+def test_recolor_command(label_folder):
+    assert nnunet_cli.main(["recolor", str(label_folder), "--map", "255=1"]) == 0
+
+    for name in ("first.tif", "second.tif"):
+        assert set(np.unique(tiff.imread(str(label_folder / name)))) == {0, 1}
+
+
+def test_combine_command(tmp_path, label_folder):
+    output = str(tmp_path / "combined.tif")
+    first, second = str(label_folder / "first.tif"), str(label_folder / "second.tif")
+
+    assert nnunet_cli.main(["combine", f"{first}=1", f"{second}=2", "--output", output, "--priority", "first"]) == 0
+
+    combined = tiff.imread(output)
+    np.testing.assert_array_equal(combined[0, 0], [1, 1, 1, 2, 2, 2])
+
+
+def test_run_job_file(tmp_path, label_folder):
+    job_file = str(tmp_path / "jobs.json")
+    with open(job_file, "w") as f:
+        json.dump([{"operation": "recolor", "folder": str(label_folder), "mapping": {"255": 7}}], f)
+
+    assert nnunet_cli.main(["run", job_file]) == 0
+    assert set(np.unique(tiff.imread(str(label_folder / "first.tif")))) == {0, 7}
+
+
+def test_run_job_file_reports_failure(tmp_path):
+    job_file = str(tmp_path / "jobs.json")
+    with open(job_file, "w") as f:
+        json.dump([{"operation": "no-such-operation"}], f)
+
+    assert nnunet_cli.main(["run", job_file]) == 1
+
+
+def test_bad_map_is_a_usage_error(label_folder):
+    with pytest.raises(SystemExit):
+        nnunet_cli.main(["recolor", str(label_folder), "--map", "255"])
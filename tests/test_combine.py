@@ -0,0 +1,69 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+
+
+@pytest.fixture
+def overlapping_masks(tmp_path):
+    """Three 0/255 masks; the middle columns are covered by the first two, column 0 by none."""
+    first = np.zeros((3, 8, 8), dtype=np.uint8)
+    second = np.zeros_like(first)
+    third = np.zeros_like(first)
+    first[:, :, 1:5] = 255
+    second[:, :, 3:7] = 255
+    third[:, :, 7] = 200  # Below the threshold
+    paths = []
+    for name, mask in (("first", first), ("second", second), ("third", third)):
+        path = str(tmp_path / f"{name}.tif")
+        tiff.imwrite(path, mask, photometric="minisblack")
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("priority, overlap_label", [("last", 2), ("first", 1), ("max", 2), ("min", 1)])
+def test_combine_priority(tmp_path, overlapping_masks, priority, overlap_label):
+    first, second, third = overlapping_masks
+    output = str(tmp_path / "combined.tif")
+
+    nnunet_tools.combine_labels({first: 1, second: 2, third: 3}, output, priority=priority)
+
+    combined = tiff.imread(output)
+    assert combined.dtype == np.uint8
+    np.testing.assert_array_equal(combined[:, :, 0], 0)
+    np.testing.assert_array_equal(combined[:, :, 1:3], 1)
+    np.testing.assert_array_equal(combined[:, :, 3:5], overlap_label)
+    np.testing.assert_array_equal(combined[:, :, 5:7], 2)
+    np.testing.assert_array_equal(combined[:, :, 7], 0)
+
+
+def test_combine_label_above_255_widens_the_output(tmp_path, overlapping_masks):
+    first, second, _ = overlapping_masks
+    output = str(tmp_path / "combined.tif")
+
+    nnunet_tools.combine_labels({first: 1, second: 300}, output, threshold=255)
+
+    combined = tiff.imread(output)
+    assert combined.dtype == np.uint16
+    np.testing.assert_array_equal(combined[:, :, 3:7], 300)
+
+
+def test_cancelled_combine_keeps_the_old_output(tmp_path, overlapping_masks):
+    first, second, _ = overlapping_masks
+    output = str(tmp_path / "combined.tif")
+    old = np.full((3, 8, 8), 9, dtype=np.uint8)
+    tiff.imwrite(output, old, photometric="minisblack")
+
+    def cancel(frames_done, num_frames, bytes_read):
+        raise nnunet_tools.OperationCancelled()
+
+    with pytest.raises(nnunet_tools.OperationCancelled):
+        nnunet_tools.combine_labels({first: 1, second: 2}, output, progress=cancel)
+
+    np.testing.assert_array_equal(tiff.imread(output), old)
+    assert not os.path.exists(output + ".partial")
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+
+
+def test_label_counts_uint8_mask_with_255(tmp_path):
+    stack = np.zeros((3, 8, 8), dtype=np.uint8)
+    stack[1, 2:4, 2:4] = 255
+    path = str(tmp_path / "mask.tif")
+    tiff.imwrite(path, stack, photometric="minisblack")
+
+    assert nnunet_tools.compute_label_counts(path) == {0: 188, 255: 4}
+
+
+def test_label_counts_uint16_with_top_value(tmp_path):
+    stack = np.zeros((2, 4, 4), dtype=np.uint16)
+    stack[0, 0, :] = 65535
+    stack[1, 1, :2] = 7
+    path = str(tmp_path / "labels.tif")
+    tiff.imwrite(path, stack, photometric="minisblack")
+
+    assert nnunet_tools.compute_label_counts(path) == {0: 26, 7: 2, 65535: 4}
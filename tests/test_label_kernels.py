@@ -0,0 +1,158 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import label_kernels  # noqa: E402
+import nnunet_tools  # noqa: E402
+
+DTYPES = [np.uint8, np.uint16, np.int16, np.int32, np.float32]
+
+
+class ArrayReader:
+    """Stack reader interface over an array in memory."""
+
+    chunk_frames = 1
+
+    def __init__(self, data):
+        self._data = data
+        self.num_frames = data.shape[0]
+        self.frame_shape = data.shape[1:]
+        self.dtype = data.dtype
+
+    def read_into(self, start, out):
+        np.copyto(out, self._data[start:start + len(out)])
+        return out
+
+
+class ListWriter:
+    """Stack writer collecting the written frames."""
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame.copy())
+
+
+def random_chunk(dtype, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 100, size=shape).astype(dtype)
+
+
+# One shape below and one above SLAB_VOXELS, so both a single slab and several slabs are covered
+@pytest.mark.parametrize("shape", [(3, 7, 11), (5, 300, 301)])
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_threshold_matches_numpy(dtype, shape):
+    chunk = random_chunk(dtype, shape)
+    np.testing.assert_array_equal(label_kernels.threshold(chunk, 50), np.where(chunk >= 50, True, False))
+
+
+@pytest.mark.parametrize("shape", [(3, 7, 11), (5, 300, 301)])
+@pytest.mark.parametrize("dtype", DTYPES)
+@pytest.mark.parametrize("foreground, out_dtype", [(1, np.uint8), (7, np.uint8), (300, np.uint16)])
+def test_binarize_matches_numpy(dtype, shape, foreground, out_dtype):
+    chunk = random_chunk(dtype, shape)
+    expected = np.where(chunk >= 50, foreground, 0).astype(out_dtype)
+
+    result = label_kernels.binarize(chunk, 50, foreground, out_dtype=out_dtype)
+
+    assert result.dtype == out_dtype
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_binarize_in_place_and_non_contiguous():
+    chunk = random_chunk(np.uint8, (4, 40, 60))
+    expected = np.where(chunk >= 50, 3, 0).astype(np.uint8)
+
+    view = chunk[:, ::2, 1::3]
+    np.testing.assert_array_equal(label_kernels.binarize(view, 50, 3), expected[:, ::2, 1::3])
+    np.testing.assert_array_equal(label_kernels.binarize(chunk, 50, 3, out=chunk), expected)
+
+
+def test_binarize_rejects_foreground_too_large():
+    with pytest.raises(ValueError):
+        label_kernels.binarize(np.zeros((2, 2), np.uint8), 1, 300)
+
+
+@pytest.mark.parametrize("shape", [(3, 7, 11), (5, 300, 301)])
+@pytest.mark.parametrize("dtype", DTYPES)
+@pytest.mark.parametrize("out_dtype", [np.uint8, np.uint16, np.int32])
+def test_merge_masks_matches_numpy(dtype, shape, out_dtype):
+    chunks = [random_chunk(dtype, shape, seed) for seed in range(3)]
+    label_values = [1, 5, 2]
+    expected = np.zeros(shape, out_dtype)
+    for chunk, label_value in zip(chunks, label_values):
+        expected = np.where(chunk >= 60, label_value, expected).astype(out_dtype)
+
+    out = np.full(shape, 99, out_dtype)
+    label_kernels.merge_masks(chunks, label_values, 60, out)
+
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+@pytest.mark.parametrize("chunk_frames", [1, 2, 5, 7, 64])
+def test_run_chunked_binarize(threads, chunk_frames):
+    data = random_chunk(np.uint16, (23, 16, 12))
+    writer = ListWriter()
+    calls = []
+
+    def binarize_chunk(chunks, out):
+        return label_kernels.binarize(chunks[0], 50, 4, out=out)
+
+    frames = label_kernels.run_chunked(binarize_chunk, [ArrayReader(data)], writer, np.uint8,
+                                       chunk_frames=chunk_frames, threads=threads,
+                                       progress=lambda done, total, nbytes: calls.append((done, nbytes)))
+
+    assert frames == 23
+    np.testing.assert_array_equal(np.stack(writer.frames), np.where(data >= 50, 4, 0).astype(np.uint8))
+    assert [done for done, _ in calls] == sorted(min(start + chunk_frames, 23) for start in range(0, 23, chunk_frames))
+    assert calls[-1][1] == data.nbytes
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_run_chunked_merge_masks(threads):
+    masks = [random_chunk(np.uint8, (17, 9, 10), seed) for seed in range(2)]
+    writer = ListWriter()
+    expected = np.where(masks[1] >= 60, 2, np.where(masks[0] >= 60, 1, 0)).astype(np.uint8)
+
+    def merge_chunk(chunks, out):
+        return label_kernels.merge_masks(chunks, [1, 2], 60, out)
+
+    label_kernels.run_chunked(merge_chunk, [ArrayReader(mask) for mask in masks], writer, np.uint8,
+                              chunk_frames=4, threads=threads)
+
+    np.testing.assert_array_equal(np.stack(writer.frames), expected)
+
+
+def test_binarize_stack(tmp_path):
+    data = random_chunk(np.float32, (6, 10, 12))
+    source = str(tmp_path / "probabilities.tif")
+    output = str(tmp_path / "labels.tif")
+    tiff.imwrite(source, data, photometric="minisblack")
+
+    nnunet_tools.binarize_stack(source, output, 50, foreground=2, threads=2)
+
+    np.testing.assert_array_equal(tiff.imread(output), np.where(data >= 50, 2, 0).astype(np.uint8))
+    assert not os.path.exists(output + ".partial")
+
+
+def test_cancelled_binarize_keeps_old_output(tmp_path):
+    source = str(tmp_path / "probabilities.tif")
+    output = str(tmp_path / "labels.tif")
+    tiff.imwrite(source, random_chunk(np.uint8, (6, 10, 12)), photometric="minisblack")
+    old = np.full((2, 4, 4), 9, dtype=np.uint8)
+    tiff.imwrite(output, old, photometric="minisblack")
+
+    def cancel(*args):
+        raise nnunet_tools.OperationCancelled()
+
+    with pytest.raises(nnunet_tools.OperationCancelled):
+        nnunet_tools.binarize_stack(source, output, 50, progress=cancel, threads=1)
+
+    np.testing.assert_array_equal(tiff.imread(output), old)
+    assert not os.path.exists(output + ".partial")
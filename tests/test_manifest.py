@@ -0,0 +1,122 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+from manifest import Manifest, file_stamp  # noqa: E402
+
+
+def _touch(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    # Some filesystems have coarse timestamps; make sure the stamp changes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_modified_file_is_redone(tmp_path):
+    source = str(tmp_path / "a.txt")
+    output = str(tmp_path / "a.out")
+    _touch(source, "one")
+    _touch(output, "result")
+    journal = Manifest(str(tmp_path), "op", {"value": 1})
+    journal.record("a", [source, output])
+
+    assert Manifest(str(tmp_path), "op", {"value": 1}).is_done("a", inputs=[source])
+    _touch(source, "two")
+    assert not Manifest(str(tmp_path), "op", {"value": 1}).is_done("a", inputs=[source])
+
+
+def test_modified_output_is_redone(tmp_path):
+    source = str(tmp_path / "a.txt")
+    output = str(tmp_path / "a.out")
+    _touch(source, "one")
+    _touch(output, "result")
+    Manifest(str(tmp_path), "op", {}).record("a", [source, output])
+
+    _touch(output, "edited by hand")
+    assert not Manifest(str(tmp_path), "op", {}).is_done("a", inputs=[source])
+
+
+def test_different_params_are_not_reused(tmp_path):
+    source = str(tmp_path / "a.txt")
+    _touch(source, "one")
+    Manifest(str(tmp_path), "op", {"mapping": {"255": 1}}).record("a", [source])
+
+    assert not Manifest(str(tmp_path), "op", {"mapping": {"255": 2}}).is_done("a", inputs=[source])
+    assert Manifest(str(tmp_path), "op", {"mapping": {"255": 1}}).is_done("a", inputs=[source])
+
+
+def test_entry_for_another_input_is_not_reused(tmp_path):
+    first, second = str(tmp_path / "a.txt"), str(tmp_path / "b.txt")
+    _touch(first, "one")
+    _touch(second, "two")
+    Manifest(str(tmp_path), "op", {}).record("out", [first])
+
+    assert not Manifest(str(tmp_path), "op", {}).is_done("out", inputs=[second])
+
+
+def test_resume_false_starts_a_new_journal(tmp_path):
+    source = str(tmp_path / "a.txt")
+    _touch(source, "one")
+    Manifest(str(tmp_path), "op", {}).record("a", [source])
+
+    journal = Manifest(str(tmp_path), "op", {}, resume=False)
+    assert not journal.is_done("a", inputs=[source])
+    assert not os.path.exists(journal.path)
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    source = str(tmp_path / "a.txt")
+    _touch(source, "one")
+    journal = Manifest(str(tmp_path), "op", {})
+    journal.record("a", [source])
+    with open(journal.path, "a") as f:
+        f.write('{"key": "b", "par')
+
+    assert Manifest(str(tmp_path), "op", {}).is_done("a", inputs=[source])
+
+
+def test_file_stamp_of_missing_file():
+    assert file_stamp(os.path.join("does", "not", "exist")) is None
+
+
+def _cut_source(tmp_path):
+    stack = np.random.default_rng(0).integers(0, 255, (4, 32, 32), dtype=np.uint8)
+    path = str(tmp_path / "stack.tif")
+    tiff.imwrite(path, stack, photometric="minisblack")
+    return path, stack
+
+
+def test_interrupted_cut_is_redone(tmp_path):
+    source, stack = _cut_source(tmp_path)
+
+    def cancel(frames_done, num_frames, bytes_read):
+        if frames_done == 2:
+            raise nnunet_tools.OperationCancelled()
+
+    with pytest.raises(nnunet_tools.OperationCancelled):
+        nnunet_tools.cut_tiff_into_parts(source, 1, 1, progress=cancel, max_workers=1)
+    parts_dir = str(tmp_path / "stack")
+    assert not [fname for fname in os.listdir(parts_dir) if fname.endswith((".tif", ".partial"))]
+
+    nnunet_tools.cut_tiff_into_parts(source, 1, 1)
+    np.testing.assert_array_equal(tiff.imread(os.path.join(parts_dir, "stack_x1_y0.tif")), stack[:, :16, 16:])
+
+
+def test_stale_partial_file_with_resume_false(tmp_path):
+    source, stack = _cut_source(tmp_path)
+    parts_dir = nnunet_tools.cut_tiff_into_parts(source, 1, 1)
+    part = os.path.join(parts_dir, "stack_x0_y0.tif")
+    # A killed run leaves a truncated temporary file and a part from other data
+    _touch(part + ".partial", "truncated")
+    tiff.imwrite(part, np.zeros((1, 16, 16), np.uint8), photometric="minisblack")
+
+    nnunet_tools.cut_tiff_into_parts(source, 1, 1, resume=False)
+
+    np.testing.assert_array_equal(tiff.imread(part), stack[:, :16, :16])
+    assert not os.path.exists(part + ".partial")
@@ -0,0 +1,100 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import label_kernels  # noqa: E402
+import nnunet_tools  # noqa: E402
+
+
+def _reference(chunk, mapping, out_dtype):
+    expected = chunk.astype(np.int64)
+    for old_value, new_value in mapping.items():
+        expected[chunk == old_value] = new_value
+    return expected.astype(out_dtype)
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "uint16", "int8", "int16", "uint32", "int32", "float32"])
+def test_lut_matches_reference(dtype):
+    rng = np.random.default_rng(0)
+    chunk = rng.integers(-3 if np.dtype(dtype).kind in "if" else 0, 6, (4, 16, 16)).astype(dtype)
+    mapping = {1: 4, 2: 0, 5: 1}
+    remap = label_kernels.LabelLUT(mapping, chunk.dtype)
+
+    np.testing.assert_array_equal(remap(chunk), _reference(chunk, mapping, chunk.dtype))
+    assert remap.changes(chunk)
+
+
+def test_lut_passes_unmapped_values_through():
+    chunk = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    remap = label_kernels.LabelLUT({255: 1}, np.uint8)
+
+    remapped = remap(chunk)
+    np.testing.assert_array_equal(remapped[chunk != 255], chunk[chunk != 255])
+    assert remapped[15, 15] == 1
+    assert not remap.changes(chunk[:15])
+
+
+def test_lut_int16_negative_values():
+    chunk = np.array([[-32768, -5, -1, 0, 7, 32767]], dtype=np.int16)
+    remap = label_kernels.LabelLUT({-5: 3, -32768: 0, 32767: -1}, np.int16)
+
+    np.testing.assert_array_equal(remap(chunk), [[0, 3, -1, 0, 7, -1]])
+
+
+def test_lut_uint32_takes_the_search_path():
+    chunk = np.array([[0, 70000, 5, 4_000_000_000]], dtype=np.uint32)
+    remap = label_kernels.LabelLUT({70000: 2, 4_000_000_000: 3}, np.uint32)
+
+    assert remap._lut is None
+    np.testing.assert_array_equal(remap(chunk), [[0, 2, 5, 3]])
+    assert not remap.changes(np.array([0, 5], dtype=np.uint32))
+
+
+def test_lut_out_dtype_too_narrow_raises():
+    with pytest.raises(ValueError):
+        label_kernels.LabelLUT({1: 300}, np.uint8)
+    with pytest.raises(ValueError):
+        label_kernels.LabelLUT({1: 70000}, np.uint8, np.uint16)
+    with pytest.raises(ValueError):
+        label_kernels.LabelLUT({1: -1}, np.int16, np.uint16)
+
+
+def test_lut_widens_to_out_dtype():
+    chunk = np.array([[0, 1, 255]], dtype=np.uint8)
+    remap = label_kernels.LabelLUT({1: 300}, np.uint8, np.uint16)
+
+    assert not remap.in_place
+    remapped = remap(chunk)
+    assert remapped.dtype == np.uint16
+    np.testing.assert_array_equal(remapped, [[0, 300, 255]])
+
+
+def test_relabel_tif_files(tmp_path):
+    stack = np.random.default_rng(1).integers(0, 3, (5, 32, 32), dtype=np.uint8) * 127
+    changed_path = str(tmp_path / "a.tif")
+    unchanged_path = str(tmp_path / "b.tif")
+    tiff.imwrite(changed_path, stack, photometric="minisblack")
+    tiff.imwrite(unchanged_path, np.zeros_like(stack), photometric="minisblack")
+    unchanged_mtime = os.stat(unchanged_path).st_mtime_ns
+
+    changed = nnunet_tools.relabel_tif_files([changed_path, unchanged_path], {254: 1, 127: 2}, max_workers=1)
+
+    assert changed == [changed_path]
+    np.testing.assert_array_equal(tiff.imread(changed_path), _reference(stack, {254: 1, 127: 2}, np.uint8))
+    assert os.stat(unchanged_path).st_mtime_ns == unchanged_mtime
+
+
+def test_relabel_tif_file_to_wider_dtype(tmp_path):
+    stack = np.array([[[0, 1], [2, 1]]], dtype=np.uint8)
+    path = str(tmp_path / "labels.tif")
+    tiff.imwrite(path, stack, photometric="minisblack")
+
+    assert nnunet_tools.relabel_tif_file(path, {1: 1000}, out_dtype=np.uint16)
+
+    relabeled = tiff.imread(path)
+    assert relabeled.dtype == np.uint16
+    np.testing.assert_array_equal(relabeled, [[0, 1000], [2, 1000]])
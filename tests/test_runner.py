@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_runner  # noqa: E402
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_concurrency_stays_within_limit(tmp_path):
+    lock = threading.Lock()
+    running = set()
+    peak = []
+
+    def on_state(job):
+        with lock:
+            if job.state == nnunet_runner.RUNNING:
+                running.add(job.job_id)
+            else:
+                running.discard(job.job_id)
+            peak.append(len(running))
+
+    runner = nnunet_runner.JobRunner(str(tmp_path), max_concurrent=2, on_state=on_state, poll_interval=0.05)
+    jobs = [runner.submit(f"sleep_{i}", python("import time; time.sleep(0.3)")) for i in range(5)]
+
+    assert runner.wait(timeout=30)
+    assert max(peak) == 2
+    assert [job.state for job in jobs] == [nnunet_runner.SUCCEEDED] * 5
+    assert all(job.attempts == 1 and job.exit_code == 0 for job in jobs)
+
+
+def test_failing_job_is_retried(tmp_path):
+    runner = nnunet_runner.JobRunner(str(tmp_path), poll_interval=0.05)
+    job = runner.submit("fail", python("print('trying'); raise SystemExit(3)"), max_retries=2)
+
+    assert runner.wait(timeout=30)
+    assert job.state == nnunet_runner.FAILED
+    assert job.attempts == 3
+    assert job.exit_code == 3
+    with open(job.log_path) as log:
+        assert log.read().splitlines().count("trying") == 3
+    with open(os.path.join(str(tmp_path), "jobs.jsonl")) as summary_file:
+        records = [json.loads(line) for line in summary_file]
+    assert [record["attempt"] for record in records] == [1, 2, 3]
+
+    # A manual retry runs the command once more, without further automatic retries
+    runner.retry(job)
+    assert runner.wait(timeout=30)
+    assert job.state == nnunet_runner.FAILED
+    assert job.attempts == 4
+
+
+def test_retry_after_success_is_rejected(tmp_path):
+    runner = nnunet_runner.JobRunner(str(tmp_path), poll_interval=0.05)
+    job = runner.submit("ok", python("pass"))
+    assert runner.wait(timeout=30)
+
+    with pytest.raises(ValueError):
+        runner.retry(job)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="SIGTERM cannot be ignored on Windows")
+def test_cancel_running_job_does_not_block(tmp_path, monkeypatch):
+    # The child ignores SIGTERM, so only the deferred SIGKILL stops it
+    monkeypatch.setattr(nnunet_runner, "_KILL_GRACE", 0.5)
+    ready = threading.Event()
+    runner = nnunet_runner.JobRunner(str(tmp_path), poll_interval=0.05,
+                                     on_output=lambda job, line: line == "ready" and ready.set())
+    code = ("import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+            "print('ready', flush=True); time.sleep(60)")
+    job = runner.submit("stubborn", python(code))
+    assert ready.wait(timeout=30)
+
+    start = time.monotonic()
+    runner.cancel(job)
+    assert time.monotonic() - start < 0.5
+
+    assert runner.wait(timeout=30)
+    assert job.state == nnunet_runner.CANCELLED
+    assert job.attempts == 1
+
+
+def test_cancel_queued_job(tmp_path):
+    runner = nnunet_runner.JobRunner(str(tmp_path), max_concurrent=1, poll_interval=0.05)
+    first = runner.submit("first", python("import time; time.sleep(0.3)"))
+    second = runner.submit("second", python("pass"))
+
+    runner.cancel(second)
+
+    assert second.state == nnunet_runner.CANCELLED
+    assert runner.wait(timeout=30)
+    assert first.state == nnunet_runner.SUCCEEDED
+    assert second.attempts == 0
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+
+
+@pytest.mark.parametrize("start, end, size, stride, include_partial, expected", [
+    # The end frame is inclusive, so 0..5 splits evenly into two windows of 3
+    (0, 5, 3, None, False, [(0, 2), (3, 5)]),
+    (0, 9, 3, None, False, [(0, 2), (3, 5), (6, 8)]),
+    (0, 9, 3, None, True, [(0, 2), (3, 5), (6, 8), (9, 9)]),
+    (2, 9, 4, None, False, [(2, 5), (6, 9)]),
+    (4, 4, 1, None, False, [(4, 4)]),
+    (0, 2, 5, None, False, []),
+    (0, 2, 5, None, True, [(0, 2)]),
+    # Overlapping windows stop at the first one that reaches the end frame
+    (0, 9, 4, 2, False, [(0, 3), (2, 5), (4, 7), (6, 9)]),
+    (0, 10, 4, 2, False, [(0, 3), (2, 5), (4, 7), (6, 9)]),
+    (0, 10, 4, 2, True, [(0, 3), (2, 5), (4, 7), (6, 9), (8, 10)]),
+    # A stride larger than the size skips frames
+    (0, 9, 2, 4, False, [(0, 1), (4, 5), (8, 9)]),
+])
+def test_substack_windows(start, end, size, stride, include_partial, expected):
+    assert nnunet_tools.substack_windows(start, end, size, stride, include_partial) == expected
+
+
+@pytest.mark.parametrize("size, stride", [(0, None), (-1, None), (3, -1)])
+def test_substack_windows_rejects_non_positive(size, stride):
+    with pytest.raises(ValueError):
+        nnunet_tools.substack_windows(0, 9, size, stride)
+
+
+def test_create_substacks(tmp_path):
+    stack = np.arange(10 * 4 * 5, dtype=np.uint16).reshape(10, 4, 5)
+    source = str(tmp_path / "stack.tif")
+    tiff.imwrite(source, stack, photometric="minisblack")
+    output_dir = tmp_path / "substacks"
+    output_dir.mkdir()
+
+    count = nnunet_tools.create_substacks(source, str(output_dir), 1, 8, 3, stride=2, include_partial=True)
+
+    windows = [(1, 3), (3, 5), (5, 7), (7, 8)]
+    assert count == len(windows)
+    assert sorted(os.listdir(output_dir)) == sorted(f"substack_{first}_{last}.tif" for first, last in windows)
+    for first, last in windows:
+        np.testing.assert_array_equal(tiff.imread(str(output_dir / f"substack_{first}_{last}.tif")),
+                                      stack[first:last + 1])
+
+
+def test_create_substacks_out_of_bounds(tmp_path):
+    source = str(tmp_path / "stack.tif")
+    tiff.imwrite(source, np.zeros((4, 2, 2), np.uint8), photometric="minisblack")
+
+    with pytest.raises(ValueError):
+        nnunet_tools.create_substacks(source, str(tmp_path), 0, 4, 2)
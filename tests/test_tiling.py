@@ -0,0 +1,76 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nnunet_tools  # noqa: E402
+
+
+def _write_stack(path, stack):
+    tiff.imwrite(path, stack, photometric="minisblack")
+    return path
+
+
+def test_tile_stitch_round_trip_center(tmp_path):
+    stack = np.random.default_rng(0).integers(0, 256, (10, 64, 80), dtype=np.uint8)
+    source = _write_stack(str(tmp_path / "labels.tif"), stack)
+
+    index_path = nnunet_tools.tile_tiff(source, tile_size=32, overlap=8)
+    output = nnunet_tools.stitch_tiles(index_path, str(tmp_path / "stitched.tif"), blend="center")
+
+    np.testing.assert_array_equal(tiff.imread(output), stack)
+
+
+def test_tile_stitch_round_trip_padded(tmp_path):
+    stack = np.random.default_rng(1).integers(0, 5, (4, 50, 70), dtype=np.uint16)
+    source = _write_stack(str(tmp_path / "labels.tif"), stack)
+
+    index_path = nnunet_tools.tile_tiff(source, tile_size=32, overlap=4, pad=True)
+    output = nnunet_tools.stitch_tiles(index_path, str(tmp_path / "stitched.tif"))
+
+    np.testing.assert_array_equal(tiff.imread(output), stack)
+
+
+@pytest.mark.parametrize("blend", ["gaussian", "average", "max"])
+def test_tile_stitch_round_trip_float(tmp_path, blend):
+    stack = np.random.default_rng(2).random((6, 64, 80), dtype=np.float32)
+    source = _write_stack(str(tmp_path / "probabilities.tif"), stack)
+
+    index_path = nnunet_tools.tile_tiff(source, tile_size=(32, 40), overlap=(8, 12))
+    output = nnunet_tools.stitch_tiles(index_path, str(tmp_path / "stitched.tif"), blend=blend)
+
+    stitched = tiff.imread(output)
+    assert stitched.dtype == np.float32
+    # Overlapping tiles hold the same values, so every blend gives the input back
+    np.testing.assert_allclose(stitched, stack, rtol=1e-5, atol=1e-6)
+
+
+def test_max_blend_takes_the_larger_prediction(tmp_path):
+    stack = np.zeros((2, 32, 48), dtype=np.float32)
+    source = _write_stack(str(tmp_path / "probabilities.tif"), stack)
+    index_path = nnunet_tools.tile_tiff(source, tile_size=32, overlap=16)
+    tiles_dir = os.path.dirname(index_path)
+    # Overwrite the two tiles with different predictions on their shared columns
+    _write_stack(os.path.join(tiles_dir, "probabilities_x0_y0.tif"), np.full((2, 32, 32), 0.25, np.float32))
+    _write_stack(os.path.join(tiles_dir, "probabilities_x1_y0.tif"), np.full((2, 32, 32), 0.75, np.float32))
+
+    stitched = tiff.imread(nnunet_tools.stitch_tiles(index_path, str(tmp_path / "stitched.tif"), blend="max"))
+
+    np.testing.assert_array_equal(stitched[:, :, :16], 0.25)
+    np.testing.assert_array_equal(stitched[:, :, 16:], 0.75)
+
+
+def test_stitch_folder_without_index(tmp_path):
+    stack = np.random.default_rng(3).integers(0, 4, (3, 64, 96), dtype=np.uint8)
+    source = _write_stack(str(tmp_path / "labels.tif"), stack)
+    parts_dir = nnunet_tools.cut_tiff_into_parts(source, 1, 1)
+    for fname in os.listdir(parts_dir):
+        if fname.endswith(nnunet_tools.TILE_INDEX_SUFFIX):
+            os.remove(os.path.join(parts_dir, fname))
+
+    output = nnunet_tools.stitch_tiles(parts_dir, str(tmp_path / "stitched.tif"))
+
+    np.testing.assert_array_equal(tiff.imread(output), stack)
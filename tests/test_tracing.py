@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tracing  # noqa: E402
+
+
+def _spans(path):
+    return {event["name"]: event for event in tracing.load(path) if event["event"] == "span"}
+
+
+def test_concurrent_operations_do_not_nest(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    both_open = threading.Barrier(2)
+
+    def operation(name, chunk_bytes):
+        with tracing.span(name):
+            both_open.wait()
+
+            def read_chunk(_):
+                with tracing.phase("io", bytes_read=chunk_bytes):
+                    pass
+
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(tracing.bind(read_chunk), range(4)))
+
+    with tracing.Trace(path):
+        threads = [threading.Thread(target=operation, args=args) for args in (("a", 100), ("b", 1000))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    spans = _spans(path)
+    assert spans["a"]["parent"] is None
+    assert spans["b"]["parent"] is None
+    assert spans["a"]["bytes_read"] == 400
+    assert spans["b"]["bytes_read"] == 4000
+
+
+def test_bound_pool_spans_are_children(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    with tracing.Trace(path):
+        with tracing.span("operation"):
+            def work(index):
+                with tracing.span("part", file=f"part_{index}"):
+                    tracing.count(bytes_written=10)
+
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(tracing.bind(work), range(3)))
+            # Unbound pool work has no span to count for
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(lambda _: tracing.count(bytes_written=1), range(3)))
+
+    events = [event for event in tracing.load(path) if event["event"] == "span"]
+    operation = next(event for event in events if event["name"] == "operation")
+    parts = [event for event in events if event["name"] == "part"]
+    assert len(parts) == 3
+    assert all(part["parent"] == operation["id"] for part in parts)
+    assert operation["bytes_written"] == 30
+
+
+def test_no_trace_is_a_no_op():
+    function = tracing.bind(len)
+    assert function is len
+    with tracing.span("ignored"), tracing.phase("io", bytes_read=1):
+        tracing.count(bytes_read=1)
+    assert not tracing.active()
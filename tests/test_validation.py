@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+import tifffile as tiff
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dataset_validation  # noqa: E402
+
+SHAPE = (3, 6, 8)
+
+
+def write_file(path, data, spacing=(1.0, 0.5, 0.5)):
+    """Write a stack and, unless `spacing` is None, its spacing JSON."""
+    tiff.imwrite(path, data, photometric="minisblack")
+    if spacing is not None:
+        with open(path[:-len(".tif")] + ".json", "w") as json_file:
+            json.dump({"spacing": list(spacing)}, json_file)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Two valid cases with labels 0, 1 and 2."""
+    dataset_dir = tmp_path / "Dataset001_Test"
+    (dataset_dir / "imagesTr").mkdir(parents=True)
+    (dataset_dir / "labelsTr").mkdir()
+    for case_index, case in enumerate(("case_a", "case_b")):
+        write_file(str(dataset_dir / "imagesTr" / f"{case}_0000.tif"), np.full(SHAPE, 100, np.uint16))
+        label = np.zeros(SHAPE, np.uint8)
+        label[:, :2] = 1
+        label[:, 2:4] = 2 - case_index
+        write_file(str(dataset_dir / "labelsTr" / f"{case}.tif"), label)
+    return dataset_dir
+
+
+def validate(dataset_dir):
+    return dataset_validation.validate_dataset(str(dataset_dir), max_workers=1, header_workers=2)
+
+
+def single_error(report):
+    assert len(report.errors) == 1, report.errors
+    return report.errors[0]
+
+
+def test_valid_dataset(dataset):
+    report = validate(dataset)
+
+    assert report.ok, report.errors
+    assert report.num_cases == 2
+    assert report.num_channels == 1
+    assert report.labels == [0, 1, 2]
+
+
+def test_missing_channel_suffix(dataset):
+    write_file(str(dataset / "imagesTr" / "case_c.tif"), np.zeros(SHAPE, np.uint16))
+
+    assert single_error(validate(dataset)) == "imagesTr/case_c.tif: missing the _0000 channel suffix."
+
+
+def test_image_without_label(dataset):
+    os.remove(str(dataset / "labelsTr" / "case_b.tif"))
+    os.remove(str(dataset / "labelsTr" / "case_b.json"))
+
+    assert single_error(validate(dataset)) == "imagesTr/case_b: no label case_b.tif in labelsTr."
+
+
+def test_label_without_image(dataset):
+    os.remove(str(dataset / "imagesTr" / "case_b_0000.tif"))
+    os.remove(str(dataset / "imagesTr" / "case_b_0000.json"))
+
+    assert single_error(validate(dataset)) == "labelsTr/case_b.tif: no image in imagesTr."
+
+
+def test_missing_spacing_json(dataset):
+    os.remove(str(dataset / "labelsTr" / "case_a.json"))
+
+    assert single_error(validate(dataset)) == "No spacing .json for 1 file(s): labelsTr/case_a.tif."
+
+
+def test_spacing_mismatch(dataset):
+    write_file(str(dataset / "labelsTr" / "case_a.tif"), tiff.imread(str(dataset / "labelsTr" / "case_a.tif")),
+               spacing=(2.0, 0.5, 0.5))
+
+    error = single_error(validate(dataset))
+    assert error.startswith("case_a: image case_a_0000.tif has spacing [1.0, 0.5, 0.5]")
+    assert error.endswith("label has [2.0, 0.5, 0.5].")
+
+
+def test_shape_mismatch(dataset):
+    write_file(str(dataset / "imagesTr" / "case_a_0000.tif"), np.zeros((3, 6, 9), np.uint16))
+
+    assert single_error(validate(dataset)) == "case_a: image case_a_0000.tif has shape (3, 6, 9), label has (3, 6, 8)."
+
+
+def test_non_consecutive_labels(dataset):
+    label = tiff.imread(str(dataset / "labelsTr" / "case_a.tif"))
+    label[label == 2] = 3
+    write_file(str(dataset / "labelsTr" / "case_a.tif"), label)
+
+    error = single_error(validate(dataset))
+    assert error.startswith("Label values must be consecutive from 0; missing 2 ")
+
+
+def test_undeclared_label(dataset):
+    with open(str(dataset / "dataset.json"), "w") as json_file:
+        json.dump({"file_ending": ".tif", "channel_names": {"0": "image"}, "numTraining": 2,
+                   "labels": {"background": 0, "cell": 1}}, json_file)
+
+    assert single_error(validate(dataset)) == "Label value 2 is not declared in dataset.json: case_a.tif."
+
+
+def test_missing_folders(tmp_path):
+    assert single_error(validate(tmp_path)) == f"{tmp_path} needs an imagesTr and a labelsTr folder."
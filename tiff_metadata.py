@@ -0,0 +1,290 @@
+"""
+Per-file metadata of the TIFF files in an nnUNet dataset.
+
+compute_file_metadata reads a file once, frame by frame, and collects
+everything later steps need to know about it:
+
+- voxel spacing, from ImageJ or OME-XML metadata
+- shape and dtype
+- for images: min, max, mean, standard deviation and intensity percentiles
+- for labels: the voxel count of every label value
+
+create_folder_structure writes the result into the spacing JSON next to every
+file (nnUNet only reads its "spacing" key) and into the dataset-level
+MetadataIndex, and seeds the label stats cache of labelsTr with the label
+counts. Validation and dataset.json generation then take everything from
+there instead of decoding the pixels again.
+"""
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+import nnunet_tools
+import tracing
+
+# Intensity percentiles recorded for images; 0.5 and 99.5 are the ones nnUNet clips CT data to
+PERCENTILES = (0.5, 1, 5, 25, 50, 75, 95, 99, 99.5)
+
+# Float and 32/64-bit images are too wide for an exact histogram; percentiles come from this many samples
+_PERCENTILE_SAMPLES = 2_000_000
+
+# Length units of ImageJ and OME metadata, in micrometers
+_UNITS = {
+    "nm": 1e-3, "nanometer": 1e-3, "um": 1.0, "µm": 1.0, "μm": 1.0, "micron": 1.0, "micrometer": 1.0,
+    "mm": 1e3, "millimeter": 1e3, "cm": 1e4, "centimeter": 1e4, "m": 1e6, "meter": 1e6, "Å": 1e-4, "angstrom": 1e-4,
+}
+
+
+def _unit_scale(unit):
+    """Return micrometers per `unit`, or None for unknown units such as "pixel"."""
+    if unit is None:
+        return None
+    unit = str(unit).strip()
+    return _UNITS.get(unit, _UNITS.get(unit.lower()))
+
+
+def _resolution_spacing(page, tag_name):
+    """Return the pixel size given by an X/YResolution tag (pixels per unit), or None."""
+    tag = page.tags.get(tag_name)
+    if tag is None:
+        return None
+    value = tag.value
+    pixels_per_unit = value[0] / value[1] if isinstance(value, tuple) else float(value)
+    return 1 / pixels_per_unit if pixels_per_unit > 0 else None
+
+
+def read_spacing(tif):
+    """
+    Reads the voxel spacing of a TIFF from its ImageJ or OME-XML metadata.
+
+    Plain TIFF resolution tags alone are not trusted: many programs write a
+    default of 72 dpi into them.
+
+    Args:
+        tif (tifffile.TiffFile): The open file.
+
+    Returns:
+        tuple: ([z, y, x] spacing in micrometers, source) or (None, None) if
+        the file does not state a physical spacing.
+    """
+    if tif.is_ome and tif.ome_metadata:
+        try:
+            root = ElementTree.fromstring(tif.ome_metadata)
+            pixels = next(element for element in root.iter() if element.tag.endswith("}Pixels"))
+            spacing = []
+            for axis in ("Z", "Y", "X"):
+                size = pixels.get(f"PhysicalSize{axis}")
+                scale = _unit_scale(pixels.get(f"PhysicalSize{axis}Unit", "µm"))
+                spacing.append(float(size) * scale if size is not None and scale is not None else None)
+            if spacing[1] is not None and spacing[2] is not None:
+                if spacing[0] is None:
+                    spacing[0] = 1.0
+                return spacing, "ome"
+        except (ElementTree.ParseError, StopIteration, ValueError):
+            pass
+
+    if tif.is_imagej and tif.imagej_metadata:
+        metadata = tif.imagej_metadata
+        scale = _unit_scale(metadata.get("unit"))
+        page = tif.pages[0]
+        y_size = _resolution_spacing(page, "YResolution")
+        x_size = _resolution_spacing(page, "XResolution")
+        if scale is not None and y_size is not None and x_size is not None:
+            z_size = float(metadata.get("spacing", 1.0))
+            return [z_size * scale, y_size * scale, x_size * scale], "imagej"
+    return None, None
+
+
+def _histogram_offset(dtype):
+    """Offset that maps a ≤16-bit integer dtype onto bincount's non-negative range, or None."""
+    if dtype.kind == "u" and dtype.itemsize <= 2:
+        return 0
+    if dtype.kind == "i" and dtype.itemsize <= 2:
+        return -int(np.iinfo(dtype).min)
+    return None
+
+
+def _percentiles_from_histogram(histogram, offset, percentiles):
+    """Return exact percentiles (lower value) of the voxels counted in a histogram."""
+    cumulative = np.cumsum(histogram)
+    total = cumulative[-1]
+    ranks = [min(total - 1, int(np.floor(percentile / 100 * (total - 1)))) for percentile in percentiles]
+    return [int(np.searchsorted(cumulative, rank, side="right")) - offset for rank in ranks]
+
+
+@tracing.traced("file_metadata", file="filepath")
+def compute_file_metadata(filepath, labels=False, percentiles=PERCENTILES):
+    """
+    Collects the metadata of a TIFF file in a single pass over its frames.
+
+    ≤16-bit integer images are counted into an exact histogram; wider and
+    float images get exact moments and percentiles from a strided sample.
+
+    Args:
+        filepath (str): Path to the TIFF file.
+        labels (bool): Count label values instead of intensity statistics.
+        percentiles (tuple): Intensity percentiles to record for images.
+
+    Returns:
+        dict: "spacing" ([z, y, x], [1, 1, 1] if the file does not state
+        one), "spacing_source", "shape", "dtype" and either "label_counts"
+        (value -> voxels) or "intensity" (min, max, mean, std, percentiles).
+    """
+    with nnunet_tools.TiffStackReader(filepath) as reader:
+        spacing, spacing_source = read_spacing(reader.tiff_file)
+        metadata = {
+            "spacing": spacing or [1, 1, 1],
+            "spacing_source": spacing_source or "default",
+            "shape": [int(size) for size in reader.tiff_file.series[0].shape],
+            "dtype": str(reader.dtype),
+        }
+        offset = _histogram_offset(reader.dtype)
+        if offset is not None:
+            histogram = np.zeros(2 ** (8 * reader.dtype.itemsize), dtype=np.int64)
+        else:
+            label_counts = {}
+            total, total_sq, count = 0.0, 0.0, 0
+            low, high = np.inf, -np.inf
+            voxels = reader.num_frames * int(np.prod(reader.frame_shape))
+            step = max(1, int(np.ceil(np.sqrt(voxels / _PERCENTILE_SAMPLES))))
+            samples = []
+
+        for frame_data in reader.iter_frames():
+            if offset is not None:
+                values = frame_data.ravel()
+                if offset:
+                    values = values.astype(np.int32) + offset
+                counts = np.bincount(values)
+                histogram[:len(counts)] += counts
+            elif labels:
+                values, value_counts = np.unique(frame_data, return_counts=True)
+                for value, value_count in zip(values.tolist(), value_counts.tolist()):
+                    label_counts[value] = label_counts.get(value, 0) + value_count
+            else:
+                frame64 = frame_data.astype(np.float64)
+                total += float(frame64.sum())
+                total_sq += float(np.square(frame64).sum())
+                count += frame64.size
+                low, high = min(low, float(frame64.min())), max(high, float(frame64.max()))
+                samples.append(frame_data[::step, ::step].ravel())
+
+    if labels:
+        if offset is not None:
+            label_counts = {int(value) - offset: int(histogram[value]) for value in np.flatnonzero(histogram)}
+        metadata["label_counts"] = {str(value): count for value, count in sorted(label_counts.items())}
+        return metadata
+
+    if offset is not None:
+        values = np.flatnonzero(histogram)
+        weights = histogram[values]
+        count = int(weights.sum())
+        values = values.astype(np.float64) - offset
+        mean = float(np.dot(values, weights) / count)
+        std = float(np.sqrt(max(0.0, np.dot(np.square(values - mean), weights) / count)))
+        low, high = float(values[0]), float(values[-1])
+        percentile_values = _percentiles_from_histogram(histogram, offset, percentiles)
+    else:
+        mean = total / count
+        std = float(np.sqrt(max(0.0, total_sq / count - mean ** 2)))
+        percentile_values = np.percentile(np.concatenate(samples), percentiles).tolist()
+    metadata["intensity"] = {
+        "min": low,
+        "max": high,
+        "mean": mean,
+        "std": std,
+        "percentiles": {str(percentile): float(value) for percentile, value in zip(percentiles, percentile_values)},
+        "percentiles_exact": offset is not None,
+    }
+    return metadata
+
+
+def write_sidecar(json_path, metadata):
+    """
+    Writes the spacing JSON of a file, extended with its metadata.
+
+    nnUNet's TIFF reader only reads the "spacing" key, so the other keys do
+    not get in its way.
+    """
+    temp_path = json_path + ".tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump(metadata, json_file, indent=4)
+    os.replace(temp_path, json_path)
+
+
+def read_sidecar(json_path):
+    """Return the content of a spacing JSON, or None if it is missing or unreadable."""
+    try:
+        with open(json_path, "r") as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+class MetadataIndex:
+    """
+    Dataset-level index of the metadata of every imported file.
+
+    Entries are keyed by the path relative to the dataset folder and stamped
+    with the file's size and modification time; get() only returns entries
+    of unchanged files.
+
+    Args:
+        dataset_dir (str): Dataset folder in nnUNet_raw.
+    """
+
+    FILE_NAME = "dataset_metadata.json"
+    VERSION = 1
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        self.path = os.path.join(dataset_dir, self.FILE_NAME)
+        self._entries = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r") as json_file:
+                content = json.load(json_file)
+            if content.get("version") == self.VERSION:
+                self._entries = content.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, filepath):
+        return os.path.relpath(filepath, self.dataset_dir).replace(os.sep, "/")
+
+    def get(self, filepath):
+        """Return the metadata of a file, or None if it is not indexed or has changed since."""
+        entry = self._entries.get(self._key(filepath))
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        if [stat.st_size, stat.st_mtime_ns] != entry["stamp"]:
+            return None
+        return entry["metadata"]
+
+    def update(self, filepath, metadata):
+        """Store the metadata of a file under its current stamp."""
+        stat = os.stat(filepath)
+        self._entries[self._key(filepath)] = {"stamp": [stat.st_size, stat.st_mtime_ns], "metadata": metadata}
+        self._dirty = True
+
+    def files(self):
+        """Return path (relative to the dataset) -> metadata of every indexed file."""
+        return {key: entry["metadata"] for key, entry in sorted(self._entries.items())}
+
+    def save(self):
+        """Write the index atomically; a read-only folder just goes unindexed."""
+        if not self._dirty:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as json_file:
+                json.dump({"version": self.VERSION, "files": self._entries}, json_file)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not write metadata index {self.path}: {e}")
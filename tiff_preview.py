@@ -0,0 +1,197 @@
+"""
+Lazy multiscale previews of TIFF stacks for the slice viewer of the GUI.
+
+A PreviewPyramid never loads a whole stack. A slice is read from a single
+page when it is first shown and downsampled by a power of two to the scale
+that fits the screen; uncompressed stacks are memory-mapped, so coarse
+scales only touch the rows they keep. Slices are kept in a small LRU cache,
+so scrolling back and forth through a large stack stays interactive.
+
+The drawing helpers turn slices into RGB arrays with a label overlay and the
+outlines of proposed cuts or tiles. They only use NumPy, so previews can also
+be rendered without a display.
+"""
+import collections
+import threading
+
+import numpy as np
+
+import nnunet_tools
+
+# Downsampled levels are added until the whole frame fits into this many pixels
+MIN_PREVIEW_SIZE = 256
+
+# Overlay colors of label values 1, 2, 3, ...; repeated for higher values
+LABEL_COLORS = np.array([
+    (230, 25, 75), (60, 180, 75), (255, 225, 25), (0, 130, 200), (245, 130, 48), (145, 30, 180),
+    (70, 240, 240), (240, 50, 230), (210, 245, 60), (250, 190, 212), (0, 128, 128), (170, 110, 40),
+], dtype=np.uint8)
+
+
+class PreviewPyramid:
+    """
+    Downsampled slices of a TIFF stack, read lazily and cached.
+
+    Level 0 is the full resolution and level k keeps every 2**k-th pixel, so
+    label values are never mixed. Levels are added until the frame fits into
+    MIN_PREVIEW_SIZE pixels.
+
+    Args:
+        path (str): Path to the TIFF stack.
+        cache_bytes (int): Memory the cached slices may use.
+    """
+
+    def __init__(self, path, cache_bytes=256 * 2**20):
+        self.path = path
+        self._reader = nnunet_tools.TiffStackReader(path)
+        self.num_frames = self._reader.num_frames
+        self.frame_shape = self._reader.frame_shape
+        self.dtype = self._reader.dtype
+        self.height, self.width = self.frame_shape[:2]
+        self.num_levels = 1
+        while max(self.height, self.width) > MIN_PREVIEW_SIZE * 2 ** (self.num_levels - 1):
+            self.num_levels += 1
+        self.cache_bytes = cache_bytes
+        self._cache = collections.OrderedDict()
+        self._cached_bytes = 0
+        self._display_range = None
+        self._lock = threading.Lock()
+
+    def level_shape(self, level):
+        """Return the (height, width) of slices at a level."""
+        step = 2 ** level
+        return (-(-self.height // step), -(-self.width // step))
+
+    def level_for(self, max_height, max_width):
+        """Return the finest level whose slices fit into max_height x max_width pixels."""
+        for level in range(self.num_levels):
+            height, width = self.level_shape(level)
+            if height <= max_height and width <= max_width:
+                return level
+        return self.num_levels - 1
+
+    def slice(self, index, level=0):
+        """
+        Returns frame `index` at a level.
+
+        The slice comes from the cache, from a cached finer level of the same
+        frame, or from reading the frame's page.
+        """
+        with self._lock:
+            for finer in range(level, -1, -1):
+                cached = self._cache.get((index, finer))
+                if cached is not None:
+                    self._cache.move_to_end((index, finer))
+                    break
+        if cached is not None and finer == level:
+            return cached
+        if cached is None:
+            source, step = self._reader.read_frame(index), 2 ** level
+        else:
+            source, step = cached, 2 ** (level - finer)
+        data = np.ascontiguousarray(source[::step, ::step])
+        self._store((index, level), data)
+        return data
+
+    def _store(self, key, data):
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = data
+            self._cached_bytes += data.nbytes
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted.nbytes
+
+    def display_range(self, percentiles=(0.5, 99.5), samples=8):
+        """
+        Returns the intensity range used to scale slices to 8 bits.
+
+        Computed once from `samples` frames spread over the stack at the
+        coarsest level, so it is cheap even for very large stacks.
+        """
+        if self._display_range is None:
+            indices = np.unique(np.linspace(0, self.num_frames - 1, min(samples, self.num_frames)).astype(int))
+            values = np.concatenate([self.slice(index, self.num_levels - 1).ravel() for index in indices])
+            low, high = np.percentile(values, percentiles)
+            self._display_range = (float(low), float(high) if high > low else float(low) + 1)
+        return self._display_range
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def cut_boxes(height, width, x_divisions, y_divisions):
+    """Return the (y, x, height, width) of the parts cut_tiff_into_parts would write."""
+    part_height, part_width = height // y_divisions, width // x_divisions
+    return [(j * part_height, i * part_width, part_height, part_width)
+            for i in range(x_divisions) for j in range(y_divisions)]
+
+
+def tile_boxes(height, width, tile_size, overlap=0, pad=False):
+    """Return the (y, x, height, width) of the tiles tile_tiff would write."""
+    tile_height, tile_width = (int(size) for size in np.broadcast_to(tile_size, (2,)))
+    return [(y, x, tile_height, tile_width)
+            for _, _, y, x in nnunet_tools.tile_grid(height, width, tile_size, overlap, pad)]
+
+
+def to_rgb(data, display_range):
+    """Scale a slice to an 8-bit RGB image; RGB slices keep their colors."""
+    low, high = display_range
+    scaled = (np.asarray(data, dtype=np.float32) - low) * (255 / (high - low))
+    gray = np.clip(scaled, 0, 255).astype(np.uint8)
+    if gray.ndim == 3 and gray.shape[2] >= 3:
+        return np.ascontiguousarray(gray[:, :, :3])
+    if gray.ndim == 3:
+        gray = gray[:, :, 0]
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def render_slice(image, display_range, labels=None, opacity=0.5, boxes=(), scale=1, box_color=(255, 255, 0)):
+    """
+    Renders a preview slice.
+
+    Args:
+        image (ndarray): Slice of the image stack.
+        display_range (tuple): Intensities shown as black and white.
+        labels (ndarray, optional): Slice of a label stack of the same shape;
+            values above 0 are drawn in LABEL_COLORS.
+        opacity (float): Opacity of the label colors.
+        boxes (iterable): (y, x, height, width) outlines in full-resolution
+            pixels, e.g. from cut_boxes or tile_boxes.
+        scale (int): Downsampling of the slice, 2**level.
+        box_color (tuple): RGB color of the outlines.
+
+    Returns:
+        ndarray: (height, width, 3) uint8 image.
+    """
+    rgb = to_rgb(image, display_range)
+    if labels is not None:
+        labels = labels if labels.ndim == 2 else labels[:, :, 0]
+        foreground = labels > 0
+        if foreground.any():
+            colors = LABEL_COLORS[(labels[foreground].astype(np.int64) - 1) % len(LABEL_COLORS)]
+            blended = (1 - opacity) * rgb[foreground] + opacity * colors
+            rgb[foreground] = blended.astype(np.uint8)
+
+    height, width = rgb.shape[:2]
+    for y, x, box_height, box_width in boxes:
+        top, left = y // scale, x // scale
+        bottom = min((y + box_height - 1) // scale, height - 1)
+        right = min((x + box_width - 1) // scale, width - 1)
+        if top >= height or left >= width:
+            continue
+        rgb[top, left:right + 1] = box_color
+        rgb[bottom, left:right + 1] = box_color
+        rgb[top:bottom + 1, left] = box_color
+        rgb[top:bottom + 1, right] = box_color
+    return rgb
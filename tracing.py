@@ -0,0 +1,545 @@
+"""
+Timing traces of the processing operations.
+
+While a Trace is active, the operations of nnunet_tools record spans: one per
+operation and one per file, part or tile they process. A span knows its wall
+and CPU time, the bytes read and written, the peak RSS of its process and how
+its wall time divides into
+
+    io       reading and writing files as they are: copies, memory-mapped frames
+    decode   reading and decompressing stack data (TIFF pages, Zarr chunks)
+    encode   compressing and writing stack data
+    compute  the rest, i.e. the NumPy and Python work on the data
+
+Every finished span is appended to a JSON-lines file. summarize() and
+format_summary() turn a trace into a table per operation that tells whether a
+slow run was bound by I/O, by decoding or by the Python loops. Memory-mapped
+frames are read lazily, so their page faults count as compute.
+
+A span opened on a thread without open spans starts a new operation, so jobs
+running at the same time are kept apart. Work handed to a thread or process
+pool is part of the submitting span only if the function is wrapped with
+bind(). Worker processes started while a trace is active append their spans
+to the same file, with their own spans: the bytes and phases of a worker do
+not add up into the operation that started it. Setting the NNUNET_TRACE environment
+variable to a file traces a process from the start. A Trace can also run cProfile or pyinstrument on the
+thread that starts it (see Profile).
+
+Without an active trace, span() and phase() return a shared no-op context, so
+the instrumented code costs a global lookup per call.
+"""
+import contextlib
+import cProfile
+import functools
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+TRACE_ENV = "NNUNET_TRACE"
+DEFAULT_TRACE_DIR = os.environ.get(
+    "NNUNET_GUI_TRACE_DIR", os.path.join(os.path.expanduser("~"), ".nnunet_gui", "traces")
+)
+PHASES = ("io", "decode", "encode")
+PROFILERS = ("cprofile", "pyinstrument")
+
+_COUNTERS = ("bytes_read", "bytes_written") + tuple(f"{phase}_seconds" for phase in PHASES)
+_NULL = contextlib.nullcontext()
+
+_active = None
+_active_lock = threading.Lock()
+_local = threading.local()
+# A trace file inherited from the parent process (or set by the user)
+_env_path = os.environ.get(TRACE_ENV) or None
+
+
+def peak_rss():
+    """Return the peak resident memory of this process in bytes, or None if it cannot be measured."""
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in KiB except on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+class Profile:
+    """
+    Runs cProfile or pyinstrument on the calling thread.
+
+    Both only see the thread they were started on, so work done by thread
+    or process pools shows up as waiting.
+
+    Args:
+        profiler (str): "cprofile" or "pyinstrument".
+        base_path (str): Output path without extension; cProfile writes
+            `.prof` (open it with snakeviz or pstats), pyinstrument `.html`.
+
+    Raises:
+        ValueError: If `profiler` is unknown.
+        ImportError: If pyinstrument is asked for but not installed.
+    """
+
+    def __init__(self, profiler, base_path):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}; expected one of {', '.join(PROFILERS)}.")
+        if profiler == "pyinstrument" and pyinstrument is None:
+            raise ImportError("Profiling with pyinstrument needs the pyinstrument package (pip install pyinstrument).")
+        self.profiler = profiler
+        self.path = base_path + (".prof" if profiler == "cprofile" else ".html")
+        self._profiler = None
+
+    def start(self):
+        if self.profiler == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+        return self
+
+    def stop(self):
+        """Stop profiling and save the profile; returns its path."""
+        if self.profiler == "cprofile":
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+        else:
+            self._profiler.stop()
+            with open(self.path, "w", encoding="utf-8") as html_file:
+                html_file.write(self._profiler.output_html())
+        self._profiler = None
+        return self.path
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Span:
+    """A timed unit of work of a Trace; see span()."""
+
+    def __init__(self, trace, parent, name, file, attrs):
+        self.trace = trace
+        self.span_id = f"{trace.pid}-{next(trace.ids)}"
+        self.parent = parent
+        self.name = name
+        self.file = file
+        self.attrs = attrs
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+        self.started = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def finish(self, error=None):
+        wall_seconds = time.perf_counter() - self._wall
+        counters = self.counters
+        phase_seconds = sum(counters[f"{phase}_seconds"] for phase in PHASES)
+        event = {
+            "event": "span",
+            "id": self.span_id,
+            "parent": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "file": self.file,
+            "pid": self.trace.pid,
+            "thread": threading.current_thread().name,
+            "start": self.started,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": time.process_time() - self._cpu,
+            **counters,
+            # Phases of other threads can add up to more than the span's own wall time
+            "compute_seconds": max(0.0, wall_seconds - phase_seconds),
+            "peak_rss_bytes": peak_rss(),
+        }
+        if self.attrs:
+            event["attrs"] = self.attrs
+        if error is not None:
+            event["error"] = error
+        self.trace.write(event)
+
+
+class Trace:
+    """
+    Records spans into a JSON-lines file while active.
+
+    The file gets a "trace" line when the trace starts, a "span" line per
+    finished span and an "end" line when it stops; lines are appended, so
+    several runs can share a file.
+
+    Args:
+        path (str): Trace file.
+        profile (str, optional): "cprofile" or "pyinstrument" to also profile
+            the thread that starts the trace; the profile is saved next to `path`.
+
+    Raises:
+        ValueError: If `profile` is unknown.
+        ImportError: If pyinstrument is asked for but not installed.
+    """
+
+    def __init__(self, path, profile=None, _attached=False):
+        self.path = os.path.abspath(path)
+        self.pid = os.getpid()
+        self.ids = itertools.count(1)
+        self.profile = Profile(profile, os.path.splitext(self.path)[0]) if profile else None
+        self._attached = _attached
+        self._lock = threading.Lock()
+        self._file = None
+        self._previous_env = None
+        self._started = None
+
+    def start(self):
+        """
+        Activates the trace.
+
+        Raises:
+            RuntimeError: If another trace is active in this process.
+        """
+        global _active
+        with _active_lock:
+            if _active is not None and _active.pid == os.getpid():
+                raise RuntimeError(f"Another trace is already active: {_active.path}")
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            _active = self
+        if self._attached:
+            return self
+        self._previous_env = os.environ.get(TRACE_ENV)
+        os.environ[TRACE_ENV] = self.path  # Worker processes attach to it
+        self._started = time.perf_counter()
+        self.write({
+            "event": "trace", "pid": self.pid, "start": time.time(), "argv": sys.argv,
+            "profile": self.profile.profiler if self.profile else None,
+        })
+        if self.profile:
+            self.profile.start()
+        return self
+
+    def stop(self):
+        """Deactivates the trace, saves the profile and writes the "end" line."""
+        global _active
+        profile_path = self.profile.stop() if self.profile else None
+        if not self._attached:
+            if self._previous_env is None:
+                os.environ.pop(TRACE_ENV, None)
+            else:
+                os.environ[TRACE_ENV] = self._previous_env
+            self.write({
+                "event": "end", "pid": self.pid, "wall_seconds": time.perf_counter() - self._started,
+                "peak_rss_bytes": peak_rss(), "profile_path": profile_path,
+            })
+        with _active_lock:
+            if _active is self:
+                _active = None
+            self._file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def write(self, event):
+        """Append one event; every line is flushed, so a crash loses nothing written so far."""
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return  # A span that outlived its trace
+            self._file.write(line)
+            self._file.flush()
+
+    def current_span(self):
+        """Innermost open span of the calling thread (or the span it was bound to), else None."""
+        stack = getattr(_local, "stack", None)
+        return stack[-1] if stack else None
+
+    def open_span(self, name, file, attrs):
+        stack = _stack()
+        span = Span(self, stack[-1] if stack else None, name, file, attrs)
+        stack.append(span)
+        return span
+
+    def close_span(self, span, error=None):
+        _local.stack.remove(span)
+        span.finish(error)
+
+    def add(self, span, counters):
+        """Add counters to a span and all spans it is part of."""
+        with self._lock:
+            while span is not None:
+                for key, value in counters.items():
+                    span.counters[key] += value
+                span = span.parent
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _current():
+    """Return the trace spans go to in this process, or None."""
+    trace = _active
+    if trace is None and _env_path is None:
+        return None
+    if trace is not None and trace.pid == os.getpid():
+        return trace
+    return _attach(trace.path if trace is not None else _env_path)
+
+
+def _attach(path):
+    """Continue a parent process's trace in a worker process."""
+    global _active
+    with _active_lock:
+        if _active is not None and _active.pid == os.getpid():
+            return _active
+        _active = None
+    # A forked worker inherits the spans of the thread that forked it; its parent comes from bind()
+    _local.stack = []
+    return Trace(path, _attached=True).start()
+
+
+def active():
+    """Return True if spans are being recorded."""
+    return _current() is not None
+
+
+class _SpanContext:
+    __slots__ = ("trace", "name", "file", "attrs", "span")
+
+    def __init__(self, trace, name, file, attrs):
+        self.trace = trace
+        self.name = name
+        self.file = file
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span = self.trace.open_span(self.name, self.file, self.attrs)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        error = None if exc_type is None else f"{exc_type.__name__}: {exc_value}"
+        self.trace.close_span(self.span, error)
+
+
+def span(name, file=None, **attrs):
+    """
+    Context manager that records a span.
+
+    Args:
+        name (str): What is done, e.g. "cut" or "cut_part".
+        file (str, optional): File the span works on.
+        **attrs: JSON-serializable details, e.g. the number of parts.
+    """
+    trace = _current()
+    if trace is None:
+        return _NULL
+    return _SpanContext(trace, name, file, attrs)
+
+
+def traced(name, file=None):
+    """
+    Decorator that records every call of a function as a span.
+
+    Args:
+        name (str): Span name.
+        file (str, optional): Name of the parameter holding the file the
+            call works on; recorded if it is a path.
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current()
+            if trace is None:
+                return function(*args, **kwargs)
+            path = signature.bind_partial(*args, **kwargs).arguments.get(file) if file else None
+            with _SpanContext(trace, name, path if isinstance(path, (str, os.PathLike)) else None, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class _ParentSpan:
+    """Stand-in for a span of another process; its counters stay in this process."""
+
+    def __init__(self, span_id):
+        self.span_id = span_id
+        self.parent = None
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+
+
+class _Bound:
+    __slots__ = ("span", "function")
+
+    def __init__(self, span, function):
+        self.span = span
+        self.function = function
+
+    def __getstate__(self):
+        return {"span": _ParentSpan(self.span.span_id), "function": self.function}
+
+    def __setstate__(self, state):
+        self.span = state["span"]
+        self.function = state["function"]
+
+    def __call__(self, *args, **kwargs):
+        if _current() is None:
+            return self.function(*args, **kwargs)
+        stack = _stack()
+        stack.append(self.span)
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            stack.remove(self.span)
+
+
+def bind(function):
+    """
+    Returns `function` bound to the calling thread's current span, to hand to a thread or process pool.
+
+    In a thread the bound function's phases and spans count for that span;
+    in a worker process its spans record it as their parent. Without an open
+    span `function` is returned as it is. Bound functions can be pickled if
+    `function` can.
+    """
+    trace = _current()
+    span = trace.current_span() if trace is not None else None
+    if span is None:
+        return function
+    return _Bound(span, function)
+
+
+class _Phase:
+    __slots__ = ("trace", "key", "counters", "start")
+
+    def __init__(self, trace, phase, counters):
+        self.trace = trace
+        self.key = f"{phase}_seconds"
+        self.counters = counters
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.counters[self.key] = time.perf_counter() - self.start
+        self.trace.add(self.trace.current_span(), self.counters)
+
+
+def phase(name, bytes_read=0, bytes_written=0):
+    """
+    Context manager that times an "io", "decode" or "encode" step of the current span.
+
+    Args:
+        name (str): One of PHASES.
+        bytes_read (int): Bytes the step reads.
+        bytes_written (int): Bytes the step writes.
+    """
+    trace = _current()
+    if trace is None:
+        return _NULL
+    return _Phase(trace, name, {"bytes_read": bytes_read, "bytes_written": bytes_written})
+
+
+def count(bytes_read=0, bytes_written=0):
+    """Add bytes to the current span, e.g. for memory-mapped frames read without a phase."""
+    trace = _current()
+    if trace is not None:
+        trace.add(trace.current_span(), {"bytes_read": bytes_read, "bytes_written": bytes_written})
+
+
+def load(path):
+    """Return the events of a trace file; torn lines from a crash are skipped."""
+    events = []
+    with open(path, "r", encoding="utf-8") as trace_file:
+        for line in trace_file:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def summarize(events):
+    """
+    Sums the spans of a trace per span name.
+
+    Returns:
+        list: One dict per name, slowest first, with "count", "errors",
+        "wall_seconds", "cpu_seconds", the byte counters, the seconds of
+        every phase and "compute_seconds", "mb_per_second" (bytes read per
+        wall second), "peak_rss_bytes", the slowest file and "bound", the
+        phase that took most of the time.
+    """
+    rows = {}
+    for event in events:
+        if event.get("event") != "span":
+            continue
+        row = rows.get(event["name"])
+        if row is None:
+            row = rows[event["name"]] = {
+                "name": event["name"], "count": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                **dict.fromkeys(_COUNTERS, 0), "compute_seconds": 0.0, "peak_rss_bytes": 0,
+                "slowest_file": None, "slowest_seconds": 0.0,
+            }
+        row["count"] += 1
+        row["errors"] += "error" in event
+        for key in ("wall_seconds", "cpu_seconds", "compute_seconds") + _COUNTERS:
+            row[key] += event.get(key) or 0
+        row["peak_rss_bytes"] = max(row["peak_rss_bytes"], event.get("peak_rss_bytes") or 0)
+        if event.get("file") and event["wall_seconds"] > row["slowest_seconds"]:
+            row["slowest_file"], row["slowest_seconds"] = event["file"], event["wall_seconds"]
+
+    for row in rows.values():
+        row["mb_per_second"] = row["bytes_read"] / 1e6 / row["wall_seconds"] if row["wall_seconds"] > 0 else None
+        phase_seconds = {phase: row[f"{phase}_seconds"] for phase in PHASES + ("compute",)}
+        row["bound"] = max(phase_seconds, key=phase_seconds.get) if any(phase_seconds.values()) else None
+    return sorted(rows.values(), key=lambda row: -row["wall_seconds"])
+
+
+def phase_shares(row):
+    """Return phase -> fraction of the summed phase times of a summary row."""
+    seconds = {phase: row[f"{phase}_seconds"] for phase in PHASES + ("compute",)}
+    total = sum(seconds.values())
+    return {phase: value / total if total else 0.0 for phase, value in seconds.items()}
+
+
+def format_summary(rows):
+    """Format summarize() rows as a text table."""
+    lines = [
+        f"{'span':<20} {'count':>6} {'wall':>9} {'read':>9} {'written':>9} {'MB/s':>7} "
+        f"{'io':>5} {'decode':>6} {'encode':>6} {'compute':>7} {'peak RSS':>9}  bound by"
+    ]
+    for row in rows:
+        shares = phase_shares(row)
+        rate = f"{row['mb_per_second']:.0f}" if row["mb_per_second"] is not None else "-"
+        peak = f"{row['peak_rss_bytes'] / 2**20:.0f} MiB" if row["peak_rss_bytes"] else "-"
+        lines.append(
+            f"{row['name']:<20} {row['count']:>6} {row['wall_seconds']:>8.2f}s "
+            f"{row['bytes_read'] / 1e6:>7.0f}MB {row['bytes_written'] / 1e6:>7.0f}MB {rate:>7} "
+            f"{shares['io']:>5.0%} {shares['decode']:>6.0%} {shares['encode']:>6.0%} {shares['compute']:>7.0%} "
+            f"{peak:>9}  {row['bound'] or '-'}"
+            + (f" ({row['errors']} failed)" if row["errors"] else "")
+        )
+    return "\n".join(lines)
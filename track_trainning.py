@@ -1,46 +1,376 @@
-from flask import Flask, render_template_string, request, send_file, make_response
+from flask import Flask, Response, g, jsonify, render_template_string, request, make_response, stream_with_context
+import argparse
+import io
+import json
+import logging
 import os
-from glob import glob
+import threading
+from functools import lru_cache
 import time
 
+from training_logs import TrainingLogTail
+
+try:
+    from PIL import Image
+except ImportError:  # Optional: without Pillow the sidebar shows full-size images
+    Image = None
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Optional: without watchdog the index relies on timed rescans only
+    FileSystemEventHandler = object
+    Observer = None
+
 app = Flask(__name__)
+logger = logging.getLogger("nnunet_tracker")
+access_logger = logging.getLogger("nnunet_tracker.access")
 
 # Base path for nnUNet results
 BASE_PATH = "/work/SitselU/zhonghui-wen/nnUNet_data/nnUNet_results"
 
-def find_folds_with_progress(base_path):
-    """Find fold_X folders with progress.png."""
-    search_pattern = os.path.join(base_path, "**", "fold_*", "progress.png")
-    progress_files = glob(search_pattern, recursive=True)
-    folds = {}
-    for file in progress_files:
-        fold_path = os.path.dirname(file)
-        # Shorten path to just fold name
-        short_name = fold_path.replace(base_path, "").lstrip("/")
-        folds[short_name] = file
-    return folds
-
-def get_most_recent_progress(folds):
-    """Get the most recently updated progress.png."""
-    if not folds:
-        return None, None
-    latest_folder, latest_file = max(folds.items(), key=lambda x: os.path.getmtime(x[1]))
-    return latest_folder, latest_file
+# Results roots to serve; NNUNET_RESULTS_ROOTS may list several, separated like PATH
+ROOTS = [root for root in os.environ.get("NNUNET_RESULTS_ROOTS", "").split(os.pathsep) if root] or [BASE_PATH]
+
+# Seconds between incremental rescans of the results tree
+RESCAN_INTERVAL = 30
+
+# Number of rendered progress.png variants kept in memory, and the sidebar thumbnail size
+IMAGE_CACHE_SIZE = 256
+THUMBNAIL_SIZE = (320, 240)
+
+# Seconds between log checks of a metrics stream, and between keep-alive comments
+STREAM_INTERVAL = 1.0
+STREAM_HEARTBEAT = 15.0
+
+# Seconds between background refreshes of the run comparison table
+SUMMARY_INTERVAL = 30
+
+
+class _ProgressEventHandler(FileSystemEventHandler):
+    """Forwards file system events under the results tree to a FoldIndex."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def on_any_event(self, event):
+        path = os.fsdecode(event.src_path)
+        if event.event_type == "modified" and os.path.basename(path) == "progress.png":
+            self.index.touch(path)
+        elif event.is_directory or os.path.basename(path) == "progress.png":
+            self.index.request_rescan()
+
+
+class FoldIndex:
+    """
+    Background index of the fold -> progress.png map and progress.png mtimes.
+
+    The tree is walked once up front and then rescanned incrementally every
+    RESCAN_INTERVAL seconds: directories whose mtime has not changed reuse
+    their cached listing, so a rescan costs one stat per directory instead of
+    a full recursive glob. With watchdog installed, file system events update
+    mtimes and trigger rescans immediately (events are not delivered for
+    changes made by other hosts on network file systems, hence the rescans).
+    Requests only read the latest snapshot.
+    """
+
+    def __init__(self, base_path, rescan_interval=RESCAN_INTERVAL):
+        self.base_path = base_path
+        self.rescan_interval = rescan_interval
+        self.last_scan_seconds = 0.0
+        self.version = 0  # Increases whenever the snapshot changes
+        self._dir_cache = {}  # directory -> (mtime_ns, subdirectories, has progress.png)
+        self._folds = {}
+        self._mtimes = {}
+        self._latest = (None, None)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def start(self):
+        """Build the index and keep it current in the background."""
+        self.rescan()
+        self._thread = threading.Thread(target=self._run, name="fold-index", daemon=True)
+        self._thread.start()
+        if Observer is not None and os.path.isdir(self.base_path):
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_ProgressEventHandler(self), self.base_path, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+            except OSError as e:
+                logger.warning("File system events unavailable for %s, using timed rescans only: %s", self.base_path, e)
+                self._observer = None
+        return self
+
+    def folds(self):
+        """Return the current fold -> progress.png map (do not modify it)."""
+        return self._folds
+
+    def most_recent(self):
+        """Return (fold, progress.png) of the most recently updated fold."""
+        return self._latest
+
+    def mtime(self, progress_file):
+        """Return the cached mtime of a progress.png, or None if it is not indexed."""
+        return self._mtimes.get(progress_file)
+
+    def request_rescan(self):
+        self._wakeup.set()
+
+    def touch(self, progress_file):
+        """Record a new mtime for a progress.png that is already indexed."""
+        with self._lock:
+            if progress_file not in self._mtimes:
+                self._wakeup.set()
+                return
+            try:
+                self._mtimes[progress_file] = os.stat(progress_file).st_mtime
+            except OSError:
+                self._wakeup.set()
+                return
+            self._latest = self._find_latest(self._folds, self._mtimes)
+            self.version += 1
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.rescan_interval)
+            self._wakeup.clear()
+            try:
+                self.rescan()
+            except Exception as e:
+                logger.exception("Rescan of %s failed: %s", self.base_path, e)
+
+    def _list_dir(self, path):
+        """Return (subdirectories, has progress.png), reusing the cached listing while the mtime is unchanged."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], False
+        cached = self._dir_cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1], cached[2]
+
+        subdirs = []
+        has_progress = False
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.name == "progress.png":
+                        has_progress = True
+        except OSError:
+            return [], False
+        self._dir_cache[path] = (mtime_ns, subdirs, has_progress)
+        return subdirs, has_progress
+
+    def rescan(self):
+        """Bring the index up to date with the results tree."""
+        start_time = time.perf_counter()
+        folds = {}
+        mtimes = {}
+        visited = set()
+        pending = [self.base_path]
+        while pending:
+            path = pending.pop()
+            visited.add(path)
+            subdirs, has_progress = self._list_dir(path)
+            if has_progress and os.path.basename(path).startswith("fold_"):
+                progress_file = os.path.join(path, "progress.png")
+                try:
+                    mtimes[progress_file] = os.stat(progress_file).st_mtime
+                except OSError:
+                    pass
+                else:
+                    # Shorten path to just fold name
+                    folds[os.path.relpath(path, self.base_path).replace(os.sep, "/")] = progress_file
+            pending.extend(os.path.join(path, name) for name in subdirs)
+
+        for path in set(self._dir_cache) - visited:
+            del self._dir_cache[path]
+        with self._lock:
+            self._folds = dict(sorted(folds.items()))
+            self._mtimes = mtimes
+            self._latest = self._find_latest(folds, mtimes)
+            self.version += 1
+        self.last_scan_seconds = time.perf_counter() - start_time
+        logger.debug("Scanned %s in %.3fs: %d folds", self.base_path, self.last_scan_seconds, len(folds))
+
+    @staticmethod
+    def _find_latest(folds, mtimes):
+        if not folds:
+            return None, None
+        return max(folds.items(), key=lambda x: mtimes[x[1]])
+
+
+class FoldIndexGroup:
+    """
+    Serves the FoldIndex of every results root as one index.
+
+    With several roots, fold names are prefixed with the root's folder name
+    (made unique if needed), e.g. "results_gpu2/Dataset001_x/.../fold_0".
+    The merged map is rebuilt only after one of the indexes changed.
+    """
+
+    def __init__(self, roots, rescan_interval=RESCAN_INTERVAL):
+        self.indexes = {}
+        for root in roots:
+            label = "" if len(roots) == 1 else os.path.basename(os.path.normpath(root))
+            while label in self.indexes and len(roots) > 1:
+                label += "_"
+            self.indexes[label] = FoldIndex(root, rescan_interval)
+        self._real_roots = [os.path.realpath(root) for root in roots]
+        self._merged = (None, {}, (None, None))
+
+    def start(self):
+        for index in self.indexes.values():
+            index.start()
+        return self
+
+    def _snapshot(self):
+        versions = tuple(index.version for index in self.indexes.values())
+        merged = self._merged
+        if merged[0] != versions:
+            folds = {}
+            latest, latest_mtime = (None, None), None
+            for label, index in self.indexes.items():
+                prefix = f"{label}/" if label else ""
+                for fold, progress_file in index.folds().items():
+                    folds[prefix + fold] = progress_file
+                fold, progress_file = index.most_recent()
+                mtime = index.mtime(progress_file) if progress_file else None
+                if mtime is not None and (latest_mtime is None or mtime > latest_mtime):
+                    latest, latest_mtime = (prefix + fold, progress_file), mtime
+            merged = (versions, folds, latest)
+            self._merged = merged
+        return merged
+
+    def folds(self):
+        """Return the merged fold -> progress.png map (do not modify it)."""
+        return self._snapshot()[1]
+
+    def most_recent(self):
+        """Return (fold, progress.png) of the most recently updated fold over all roots."""
+        return self._snapshot()[2]
+
+    def mtime(self, progress_file):
+        for index in self.indexes.values():
+            mtime = index.mtime(progress_file)
+            if mtime is not None:
+                return mtime
+        return None
+
+    def contains(self, path):
+        """Return True if path lies inside one of the results roots."""
+        real_path = os.path.realpath(path)
+        return any(os.path.commonpath([real_path, root]) == root for root in self._real_roots)
+
+
+class RequestStats:
+    """Request counts and latency histograms per endpoint, rendered in the Prometheus text format."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}  # (endpoint, status) -> requests
+        self._latency = {}  # endpoint -> [bucket counts..., sum, count]
+
+    def observe(self, endpoint, status, seconds):
+        with self._lock:
+            self._counts[(endpoint, status)] = self._counts.get((endpoint, status), 0) + 1
+            latency = self._latency.setdefault(endpoint, [0] * len(self.BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    latency[i] += 1
+            latency[-2] += seconds
+            latency[-1] += 1
+
+    def render(self, fold_index):
+        lines = [
+            "# HELP tracker_requests_total Requests served, by endpoint and status.",
+            "# TYPE tracker_requests_total counter",
+        ]
+        with self._lock:
+            for (endpoint, status), count in sorted(self._counts.items()):
+                lines.append(f'tracker_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            lines += [
+                "# HELP tracker_request_seconds Time to produce a response, by endpoint.",
+                "# TYPE tracker_request_seconds histogram",
+            ]
+            for endpoint, latency in sorted(self._latency.items()):
+                for bound, count in zip(self.BUCKETS, latency):
+                    lines.append(f'tracker_request_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'tracker_request_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {latency[-1]}')
+                lines.append(f'tracker_request_seconds_sum{{endpoint="{endpoint}"}} {latency[-2]:.6f}')
+                lines.append(f'tracker_request_seconds_count{{endpoint="{endpoint}"}} {latency[-1]}')
+        lines += [
+            "# HELP tracker_scan_seconds Duration of the last rescan of a results root.",
+            "# TYPE tracker_scan_seconds gauge",
+        ]
+        for index in fold_index.indexes.values():
+            lines.append(f'tracker_scan_seconds{{root="{index.base_path}"}} {index.last_scan_seconds:.6f}')
+        lines += ["# HELP tracker_folds Folds with a progress.png, by results root.", "# TYPE tracker_folds gauge"]
+        for index in fold_index.indexes.values():
+            lines.append(f'tracker_folds{{root="{index.base_path}"}} {len(index.folds())}')
+        return "\n".join(lines) + "\n"
+
+
+request_stats = RequestStats()
+
+_fold_index = None
+_fold_index_lock = threading.Lock()
+
+
+def get_fold_index():
+    """Return the shared FoldIndexGroup for ROOTS, starting it on first use."""
+    global _fold_index
+    with _fold_index_lock:
+        if _fold_index is None:
+            _fold_index = FoldIndexGroup(ROOTS, RESCAN_INTERVAL).start()
+    return _fold_index
+
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+@app.after_request
+def log_request(response):
+    """Write an access log line and record the request latency."""
+    seconds = time.perf_counter() - g.get("start_time", time.perf_counter())
+    request_stats.observe(request.endpoint or "unknown", response.status_code, seconds)
+    access_logger.info(
+        '%s "%s %s" %s %.1fms', request.remote_addr, request.method, request.full_path.rstrip("?"),
+        response.status_code, seconds * 1000,
+    )
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    """Report request latency, scan time and fold counts for monitoring."""
+    return Response(request_stats.render(get_fold_index()), mimetype="text/plain; version=0.0.4")
+
 
 @app.route("/")
 def index():
     """Render the list of folds and display the selected or newest progress.png."""
-    folds = find_folds_with_progress(BASE_PATH)
+    fold_index = get_fold_index()
+    folds = fold_index.folds()
     selected_fold = request.args.get("fold")  # Selected fold from user
-    print(f"DEBUG: Selected fold: {selected_fold}")  # Debug print for fold selection
+    logger.debug("Selected fold: %s", selected_fold)
 
     # Serve the selected progress file or the most recent one
     if selected_fold and selected_fold in folds:
         progress_file = folds[selected_fold]
-        print(f"DEBUG: Serving progress.png from: {progress_file}")
+        logger.debug("Serving progress.png from: %s", progress_file)
     else:
-        _, progress_file = get_most_recent_progress(folds)
-        print(f"DEBUG: Serving most recent progress.png: {progress_file}")
+        selected_fold, progress_file = fold_index.most_recent()
+        logger.debug("Serving most recent progress.png: %s", progress_file)
 
     return render_template_string("""
     <!DOCTYPE html>
@@ -50,53 +380,390 @@ def index():
         <style>
             body { display: flex; font-family: Arial, sans-serif; height: 100vh; margin: 0; }
             .sidebar { width: 30%; background-color: #f0f0f0; overflow-y: auto; padding: 10px; }
-            .content { flex-grow: 1; display: flex; justify-content: center; align-items: center; background-color: #eaeaea; }
-            .img-container img { max-width: 100%; max-height: 90vh; }
+            .content { flex-grow: 1; display: flex; flex-direction: column; justify-content: center; align-items: center; background-color: #eaeaea; }
+            .img-container img { max-width: 100%; max-height: 60vh; }
+            #metrics { font-size: 12px; }
             h1, h2 { margin: 0; }
             button { margin: 5px; padding: 10px; background-color: #007bff; color: white; border: none; cursor: pointer; }
             button:hover { background-color: #0056b3; }
             a { text-decoration: none; color: black; display: block; margin: 5px 0; }
             a:hover { font-weight: bold; }
+            a img { display: block; max-width: 100%; }
         </style>
     </head>
     <body>
         <div class="sidebar">
             <h2>Available Folds</h2>
             <button onclick="window.location.href='/?newest=true'">Newest Progress</button>
+            <button onclick="window.location.href='/runs'">Compare Runs</button>
             <hr>
             {% for fold, path in folds.items() %}
-                <a href="/?fold={{ fold }}">{{ fold }}</a>
+                <a href="/?fold={{ fold|urlencode }}">
+                    <img src="/view?path={{ path|urlencode }}&thumb=1" loading="lazy" alt="">
+                    {{ fold }}
+                </a>
             {% endfor %}
         </div>
         <div class="content">
             <div class="img-container">
                 {% if progress_file %}
-                    <img src="/view?path={{ progress_file }}&t={{ timestamp }}" alt="Progress.png">
+                    <img src="/view?path={{ progress_file|urlencode }}" alt="Progress.png">
                 {% else %}
                     <h1>No progress.png available</h1>
                 {% endif %}
             </div>
+            {% if selected_fold %}
+                <div id="metrics">
+                    <canvas id="metrics-chart" width="800" height="260"></canvas>
+                    <div id="metrics-summary"></div>
+                </div>
+            {% endif %}
         </div>
+        {% if selected_fold %}
+        <script>
+            // Live chart fed by the Server-Sent Events stream of parsed log metrics
+            const epochs = new Map();
+            const series = [
+                ["train_loss", "#007bff", false], ["val_loss", "#dc3545", false], ["mean_pseudo_dice", "#28a745", true],
+            ];
+            function draw() {
+                const canvas = document.getElementById("metrics-chart");
+                const ctx = canvas.getContext("2d");
+                const rows = [...epochs.values()].sort((a, b) => a.epoch - b.epoch);
+                ctx.clearRect(0, 0, canvas.width, canvas.height);
+                if (!rows.length) return;
+                const losses = rows.flatMap(r => [r.train_loss, r.val_loss]).filter(v => v != null);
+                const lossMin = Math.min(...losses), lossMax = Math.max(...losses);
+                const x = i => 40 + i * (canvas.width - 80) / Math.max(rows.length - 1, 1);
+                const y = (v, unit) => {
+                    const t = unit ? v : (v - lossMin) / ((lossMax - lossMin) || 1);
+                    return canvas.height - 20 - t * (canvas.height - 40);
+                };
+                for (const [key, color, unit] of series) {
+                    ctx.strokeStyle = color;
+                    ctx.beginPath();
+                    let started = false;
+                    rows.forEach((r, i) => {
+                        if (r[key] == null) return;
+                        started ? ctx.lineTo(x(i), y(r[key], unit)) : ctx.moveTo(x(i), y(r[key], unit));
+                        started = true;
+                    });
+                    ctx.stroke();
+                }
+                const last = rows[rows.length - 1];
+                const fmt = v => v == null ? "-" : v.toFixed(4);
+                document.getElementById("metrics-summary").textContent =
+                    `Epoch ${last.epoch} | train_loss ${fmt(last.train_loss)} (blue) | val_loss ${fmt(last.val_loss)} (red)` +
+                    ` | mean pseudo Dice ${fmt(last.mean_pseudo_dice)} (green) | epoch time ${fmt(last.epoch_time)} s`;
+            }
+            const source = new EventSource("/api/stream?fold=" + encodeURIComponent({{ selected_fold|tojson }}));
+            source.onmessage = event => {
+                for (const row of JSON.parse(event.data)) epochs.set(row.epoch, row);
+                draw();
+            };
+        </script>
+        {% endif %}
     </body>
     </html>
-    """, folds=folds, progress_file=progress_file, timestamp=int(time.time()))
+    """, folds=folds, progress_file=progress_file, selected_fold=selected_fold)
+
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def load_progress_png(progress_file, mtime_ns, thumbnail=False):
+    """Read a progress.png, optionally downscaled; cached per (path, mtime)."""
+    if thumbnail and Image is not None:
+        with Image.open(progress_file) as img:
+            img.thumbnail(THUMBNAIL_SIZE)
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG", optimize=True)
+            return buffer.getvalue()
+    with open(progress_file, "rb") as f:
+        return f.read()
+
 
 @app.route("/view")
 def view_progress():
-    """Serve the selected progress.png with no caching."""
+    """Serve the selected progress.png (or its thumbnail) with ETag revalidation."""
     progress_file = request.args.get("path")
-    if not progress_file or not os.path.isfile(progress_file):
-        print(f"DEBUG: Invalid or missing file path: {progress_file}")  # Debug invalid file
+    thumbnail = request.args.get("thumb") == "1"
+    try:
+        stat = os.stat(progress_file) if progress_file else None
+    except OSError:
+        stat = None
+    if stat is None or not os.path.isfile(progress_file) or not get_fold_index().contains(progress_file):
+        logger.debug("Invalid or missing file path: %s", progress_file)
         return "progress.png not found.", 404
-    
-    print(f"DEBUG: Serving file: {progress_file}")  # Debug: Serving file path
-
-    # Disable caching in the response
-    response = make_response(send_file(progress_file, mimetype="image/png"))
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
+
+    # Browsers revalidate on every load and get a 304 while the plot is unchanged
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}" + ("-thumb" if thumbnail else "")
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(load_progress_png(progress_file, stat.st_mtime_ns, thumbnail))
+        response.mimetype = "image/png"
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+_log_tails = {}
+_log_tails_lock = threading.Lock()
+
+
+def get_log_tail(fold):
+    """Return the shared TrainingLogTail of an indexed fold, or None for an unknown fold."""
+    progress_file = get_fold_index().folds().get(fold) if fold else None
+    if progress_file is None:
+        return None
+    fold_dir = os.path.dirname(progress_file)
+    with _log_tails_lock:
+        if fold_dir not in _log_tails:
+            _log_tails[fold_dir] = TrainingLogTail(fold_dir)
+        return _log_tails[fold_dir]
+
+
+@app.route("/api/metrics")
+def fold_metrics():
+    """Return the per-epoch metrics parsed from a fold's training logs as JSON."""
+    fold = request.args.get("fold")
+    tail = get_log_tail(fold)
+    if tail is None:
+        return jsonify(error=f"Unknown fold: {fold}"), 404
+    tail.update()
+    return jsonify(fold=fold, epochs=tail.epochs(since=request.args.get("since", type=int)))
+
+
+@app.route("/api/stream")
+def stream_metrics():
+    """Stream a fold's metrics as Server-Sent Events; each event carries the new or changed epochs."""
+    fold = request.args.get("fold")
+    tail = get_log_tail(fold)
+    if tail is None:
+        return jsonify(error=f"Unknown fold: {fold}"), 404
+
+    def events():
+        last_version = None
+        last_epoch = None
+        idle = 0.0
+        while True:
+            tail.update()
+            if tail.version != last_version:
+                last_version = tail.version
+                # Resend the newest known epoch, it may have gained metrics since
+                epochs = tail.epochs(since=None if last_epoch is None else last_epoch - 1)
+                if epochs:
+                    last_epoch = epochs[-1]["epoch"]
+                yield f"data: {json.dumps(epochs)}\n\n"
+                idle = 0.0
+            elif idle >= STREAM_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(STREAM_INTERVAL)
+            idle += STREAM_INTERVAL
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class RunSummaries:
+    """
+    Keeps the log summary of every indexed fold current in the background.
+
+    Each refresh only reads what was appended to the training logs and
+    checks for the final checkpoint, and summaries are recomputed only for
+    folds with new epochs or a new checkpoint, so serving the comparison
+    table does no file I/O at all.
+    """
+
+    def __init__(self, interval=SUMMARY_INTERVAL):
+        self.interval = interval
+        self._refreshed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="run-summaries", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception("Refreshing run summaries failed: %s", e)
+            self._refreshed.set()
+            time.sleep(self.interval)
+
+    def refresh(self):
+        start_time = time.perf_counter()
+        for fold in list(get_fold_index().folds()):
+            tail = get_log_tail(fold)
+            if tail is not None:
+                tail.update()
+        logger.debug("Refreshed run summaries in %.3fs", time.perf_counter() - start_time)
+
+    def rows(self, timeout=60):
+        """Return one summary dict per fold; waits for the first refresh if needed."""
+        self._refreshed.wait(timeout)
+        rows = []
+        for fold in get_fold_index().folds():
+            tail = get_log_tail(fold)
+            if tail is not None:
+                rows.append(dict(fold=fold, **tail.summary()))
+        return rows
+
+
+_run_summaries = None
+_run_summaries_lock = threading.Lock()
+
+
+def get_run_summaries():
+    """Return the shared RunSummaries, starting it on first use."""
+    global _run_summaries
+    with _run_summaries_lock:
+        if _run_summaries is None:
+            _run_summaries = RunSummaries(SUMMARY_INTERVAL).start()
+    return _run_summaries
+
+
+def sparkline_points(values, width=120, height=24):
+    """Return SVG polyline points for a series of values in [0, 1]."""
+    if not values:
+        return ""
+    step = width / max(len(values) - 1, 1)
+    return " ".join(f"{i * step:.1f},{height - min(max(v, 0.0), 1.0) * height:.1f}" for i, v in enumerate(values))
+
+
+@app.route("/api/runs")
+def runs_summary():
+    """Return the comparison summary of every run as JSON."""
+    return jsonify(runs=get_run_summaries().rows())
+
+
+@app.route("/runs")
+def compare_runs():
+    """Render a sortable table comparing progress, speed and ETA of all runs."""
+    rows = get_run_summaries().rows()
+    return render_template_string("""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <title>nnUNet Run Comparison</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 10px; }
+            table { border-collapse: collapse; width: 100%; font-size: 13px; }
+            th, td { padding: 4px 8px; border-bottom: 1px solid #ddd; text-align: left; white-space: nowrap; }
+            th { background-color: #f0f0f0; cursor: pointer; position: sticky; top: 0; }
+            th:hover { background-color: #e0e0e0; }
+            td.num { text-align: right; }
+            tr.finished { color: #888; }
+            tr.stalled td:first-child { border-left: 4px solid #dc3545; }
+            a { color: black; }
+            button { margin: 5px 0; padding: 10px; background-color: #007bff; color: white; border: none; cursor: pointer; }
+        </style>
+    </head>
+    <body>
+        <button onclick="window.location.href='/'">Back to Progress</button>
+        <table id="runs">
+            <thead>
+                <tr>
+                    <th data-type="text">Run</th>
+                    <th data-type="num">Epoch</th>
+                    <th data-type="num">s/epoch</th>
+                    <th data-type="text">Last update</th>
+                    <th data-type="num">Remaining (h)</th>
+                    <th data-type="text">Projected finish</th>
+                    <th data-type="num">Best pseudo Dice</th>
+                    <th data-type="none">Pseudo Dice</th>
+                </tr>
+            </thead>
+            <tbody>
+            {% for run in rows %}
+                <tr class="{{ 'finished' if run.finished }}">
+                    <td data-value="{{ run.fold }}"><a href="/?fold={{ run.fold|urlencode }}">{{ run.fold }}</a></td>
+                    <td class="num" data-value="{{ run.epoch if run.epoch is not none else -1 }}">
+                        {{ run.epoch if run.epoch is not none else "-" }} / {{ run.num_epochs }}</td>
+                    <td class="num" data-value="{{ run.seconds_per_epoch or 0 }}">
+                        {{ "%.1f"|format(run.seconds_per_epoch) if run.seconds_per_epoch else "-" }}</td>
+                    <td class="last-update" data-value="{{ run.last_update or '' }}"
+                        data-spe="{{ run.seconds_per_epoch or '' }}" data-finished="{{ run.finished|tojson }}">
+                        {{ run.last_update[:16] if run.last_update else "-" }}</td>
+                    <td class="num" data-value="{{ run.remaining_seconds if run.remaining_seconds is not none else 1e12 }}">
+                        {{ "%.1f"|format(run.remaining_seconds / 3600) if run.remaining_seconds is not none else "-" }}</td>
+                    <td data-value="{{ run.projected_finish or '' }}">
+                        {{ "finished" if run.finished else (run.projected_finish or "-") }}</td>
+                    <td class="num" data-value="{{ run.best_dice if run.best_dice is not none else -1 }}">
+                        {{ "%.4f (epoch %d)"|format(run.best_dice, run.best_epoch) if run.best_dice is not none else "-" }}</td>
+                    <td>
+                        <svg width="120" height="24">
+                            <polyline points="{{ sparkline(run.dice_series) }}" fill="none" stroke="#28a745" stroke-width="1.5"/>
+                        </svg>
+                    </td>
+                </tr>
+            {% endfor %}
+            </tbody>
+        </table>
+        <script>
+            // Flag runs whose last log line is older than three epochs
+            for (const cell of document.querySelectorAll("td.last-update")) {
+                const spe = parseFloat(cell.dataset.spe);
+                const updated = Date.parse(cell.dataset.value.replace(" ", "T"));
+                if (cell.dataset.finished !== "true" && spe && updated && Date.now() - updated > 3 * spe * 1000) {
+                    cell.parentElement.classList.add("stalled");
+                }
+            }
+            // Sort by a column on click; click again to reverse
+            document.querySelectorAll("#runs th").forEach((th, column) => {
+                if (th.dataset.type === "none") return;
+                th.addEventListener("click", () => {
+                    const tbody = document.querySelector("#runs tbody");
+                    const ascending = th.dataset.ascending !== "true";
+                    th.dataset.ascending = ascending;
+                    const key = row => row.children[column].dataset.value;
+                    const rows = [...tbody.rows].sort((a, b) => {
+                        const result = th.dataset.type === "num" ? key(a) - key(b) : key(a).localeCompare(key(b));
+                        return ascending ? result : -result;
+                    });
+                    rows.forEach(row => tbody.appendChild(row));
+                });
+            });
+        </script>
+    </body>
+    </html>
+    """, rows=rows, sparkline=sparkline_points)
+
+
+def main(argv=None):
+    global ROOTS, RESCAN_INTERVAL
+    parser = argparse.ArgumentParser(description="Serve nnUNet training progress to the lab.")
+    parser.add_argument("--root", dest="roots", action="append", metavar="PATH",
+                        help="nnUNet_results folder to serve; repeat for several (default: NNUNET_RESULTS_ROOTS or BASE_PATH).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32,
+                        help="Worker threads; every open live chart holds one (default: 32).")
+    parser.add_argument("--rescan-interval", type=float, default=RESCAN_INTERVAL,
+                        help="Seconds between incremental rescans of the results roots.")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING, ...")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ROOTS = args.roots or ROOTS
+    RESCAN_INTERVAL = args.rescan_interval
+    get_fold_index()
+    get_run_summaries()
+    logger.info("Serving %s on %s:%d", ", ".join(ROOTS), args.host, args.port)
+
+    try:
+        from waitress import serve
+    except ImportError:
+        logger.warning("waitress is not installed; falling back to Flask's threaded development server.")
+        app.run(host=args.host, port=args.port, threaded=True)
+    else:
+        serve(app, host=args.host, port=args.port, threads=args.threads)
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    main()
@@ -0,0 +1,250 @@
+"""
+Incremental parser for nnUNet training logs.
+
+nnUNetv2 writes one training_log_<date>.txt per training run into each fold
+folder, e.g.
+
+    2024-12-17 07:04:41.123456: Epoch 12
+    2024-12-17 07:04:41.125000: Current learning rate: 0.00989
+    2024-12-17 07:06:02.514000: train_loss -0.6421
+    2024-12-17 07:06:02.515000: val_loss -0.6012
+    2024-12-17 07:06:02.516000: Pseudo dice [np.float32(0.8123), np.float32(0.6543)]
+    2024-12-17 07:06:02.517000: Epoch time: 81.39 s
+    2024-12-17 07:06:03.101000: Yayy! New best EMA pseudo Dice: 0.7012
+
+TrainingLogTail remembers how far it has read every log, so each update only
+reads the bytes appended since the previous one.
+"""
+import math
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+# nnUNetTrainer trains for 1000 epochs; variants say otherwise in their name, e.g. nnUNetTrainer_250epochs
+DEFAULT_NUM_EPOCHS = 1000
+_TRAINER_EPOCHS = re.compile(r"_(\d+)epochs(?:_|$)")
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?): (.*)$")
+_NUMBER = r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf|-inf)"
+_EPOCH = re.compile(r"^Epoch (\d+)\s*$")
+_PATTERNS = {
+    "learning_rate": re.compile(rf"^Current learning rate: {_NUMBER}"),
+    "train_loss": re.compile(rf"^train_loss {_NUMBER}"),
+    "val_loss": re.compile(rf"^val_loss {_NUMBER}"),
+    "epoch_time": re.compile(rf"^Epoch time: {_NUMBER} s"),
+    "best_ema_dice": re.compile(rf"^Yayy! New best EMA pseudo Dice: {_NUMBER}"),
+}
+_PSEUDO_DICE = re.compile(r"^Pseudo dice \[(.*)\]")
+_NUMPY_SCALAR = re.compile(r"np\.\w+\(([^)]*)\)")
+
+
+def _to_float(text):
+    """Parse a number; NaN and infinities become None so the result is valid JSON."""
+    value = float(text)
+    return value if math.isfinite(value) else None
+
+
+def num_epochs_for(fold_dir):
+    """Return the number of epochs the trainer of a fold folder runs for."""
+    trainer = os.path.basename(os.path.dirname(os.path.normpath(fold_dir))).split("__")[0]
+    match = _TRAINER_EPOCHS.search(trainer)
+    return int(match.group(1)) if match else DEFAULT_NUM_EPOCHS
+
+
+def _parse_timestamp(timestamp):
+    try:
+        return datetime.strptime(timestamp, _TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_epochs(epochs, num_epochs=DEFAULT_NUM_EPOCHS, finished=False, recent=10, series_points=60):
+    """
+    Condenses a fold's epochs into the numbers used to compare runs.
+
+    Args:
+        epochs (list): Epoch dicts as returned by TrainingLogTail.epochs().
+        num_epochs (int): Number of epochs the run trains for.
+        finished (bool): Whether the run has written its final checkpoint.
+        recent (int): Number of most recent epochs the epoch time is averaged over.
+        series_points (int): Maximum length of the returned Dice series.
+
+    Returns:
+        dict: Current epoch, seconds per epoch, remaining time, projected
+        finish, best mean pseudo Dice and a downsampled Dice series.
+    """
+    summary = {
+        "epoch": None, "num_epochs": num_epochs, "finished": finished, "seconds_per_epoch": None,
+        "last_update": None, "remaining_seconds": None, "projected_finish": None,
+        "best_dice": None, "best_epoch": None, "dice_series": [],
+    }
+    if not epochs:
+        return summary
+
+    last = epochs[-1]
+    summary["epoch"] = last["epoch"]
+    summary["last_update"] = last.get("updated", last.get("started"))
+
+    epoch_times = [epoch["epoch_time"] for epoch in epochs[-recent:] if epoch.get("epoch_time")]
+    if epoch_times:
+        summary["seconds_per_epoch"] = sum(epoch_times) / len(epoch_times)
+
+    # The last epoch is still running unless it already logged its epoch time
+    epochs_done = last["epoch"] + (1 if "epoch_time" in last else 0)
+    if finished or epochs_done >= num_epochs:
+        summary["finished"] = True
+        summary["remaining_seconds"] = 0.0
+    elif summary["seconds_per_epoch"] is not None:
+        remaining = (num_epochs - epochs_done) * summary["seconds_per_epoch"]
+        summary["remaining_seconds"] = remaining
+        last_update = _parse_timestamp(summary["last_update"])
+        if last_update is not None:
+            summary["projected_finish"] = (last_update + timedelta(seconds=remaining)).strftime("%Y-%m-%d %H:%M")
+
+    dice = [(epoch["epoch"], epoch.get("mean_pseudo_dice")) for epoch in epochs]
+    dice = [(epoch, value) for epoch, value in dice if value is not None]
+    if dice:
+        summary["best_epoch"], summary["best_dice"] = max(dice, key=lambda item: item[1])
+        step = max(1, math.ceil(len(dice) / series_points))
+        summary["dice_series"] = [value for _, value in dice[::step]]
+    return summary
+
+
+def parse_log_line(line):
+    """
+    Parses one training log line.
+
+    Args:
+        line (str): A line without its line break.
+
+    Returns:
+        tuple: (timestamp, key, value), where key is "epoch", "pseudo_dice" or
+        one of the scalar metrics; None if the line carries no metric.
+    """
+    match = _LINE.match(line)
+    if not match:
+        return None
+    timestamp, message = match.groups()
+
+    epoch = _EPOCH.match(message)
+    if epoch:
+        return timestamp, "epoch", int(epoch.group(1))
+    dice = _PSEUDO_DICE.match(message)
+    if dice:
+        values = _NUMPY_SCALAR.sub(r"\1", dice.group(1))
+        return timestamp, "pseudo_dice", [_to_float(value) for value in values.split(",") if value.strip()]
+    for key, pattern in _PATTERNS.items():
+        metric = pattern.match(message)
+        if metric:
+            return timestamp, key, _to_float(metric.group(1))
+    return None
+
+
+class TrainingLogTail:
+    """
+    Time series of the per-epoch metrics of one fold, updated incrementally.
+
+    Args:
+        fold_dir (str): Fold folder containing training_log_*.txt files.
+    """
+
+    def __init__(self, fold_dir):
+        self.fold_dir = fold_dir
+        self.num_epochs = num_epochs_for(fold_dir)
+        self.version = 0  # Increases whenever new metrics are parsed
+        self.finished = False  # Whether checkpoint_final.pth existed at the last update
+        self._summary = (None, None)  # ((version, finished), summary)
+        self._offsets = {}  # log file -> bytes parsed so far
+        self._epochs = {}
+        self._current = None
+        self._lock = threading.Lock()
+
+    def log_files(self):
+        """Return the fold's training logs, oldest first."""
+        try:
+            names = [name for name in os.listdir(self.fold_dir)
+                     if name.startswith("training_log_") and name.endswith(".txt")]
+        except OSError:
+            return []
+        return [os.path.join(self.fold_dir, name) for name in sorted(names)]
+
+    def update(self):
+        """
+        Parses whatever was appended to the logs since the last call.
+
+        Also checks whether the final checkpoint has been written, so
+        summary() does no file I/O.
+
+        Returns:
+            bool: True if new metrics were found.
+        """
+        with self._lock:
+            changed = False
+            for log_file in self.log_files():
+                try:
+                    size = os.path.getsize(log_file)
+                except OSError:
+                    continue
+                offset = self._offsets.get(log_file, 0)
+                if size < offset:  # Log was rewritten; parse it again from the start
+                    offset = 0
+                if size == offset:
+                    continue
+                with open(log_file, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(size - offset)
+                # Leave an unfinished last line for the next update
+                complete = data[:data.rfind(b"\n") + 1]
+                self._offsets[log_file] = offset + len(complete)
+                for line in complete.decode("utf-8", errors="replace").splitlines():
+                    changed = self._parse_line(line) or changed
+            if changed:
+                self.version += 1
+            self.finished = os.path.exists(os.path.join(self.fold_dir, "checkpoint_final.pth"))
+            return changed
+
+    def _parse_line(self, line):
+        parsed = parse_log_line(line.strip())
+        if parsed is None:
+            return False
+        timestamp, key, value = parsed
+        if key == "epoch":
+            # A restarted run logs its epochs again; the newest entry wins
+            self._current = {"epoch": value, "started": timestamp}
+            self._epochs[value] = self._current
+            return True
+        if self._current is None:
+            return False
+        self._current[key] = value
+        if key == "pseudo_dice":
+            valid = [dice for dice in value if dice is not None]
+            self._current["mean_pseudo_dice"] = sum(valid) / len(valid) if valid else None
+        self._current["updated"] = timestamp
+        return True
+
+    def epochs(self, since=None):
+        """
+        Returns the parsed epochs in order.
+
+        Args:
+            since (int, optional): Only return epochs after this one.
+
+        Returns:
+            list: One dict per epoch with the metrics seen so far.
+        """
+        with self._lock:
+            return [dict(self._epochs[epoch]) for epoch in sorted(self._epochs)
+                    if since is None or epoch > since]
+
+    def summary(self):
+        """Return summarize_epochs() of this fold, recomputed after new metrics or the final checkpoint appeared."""
+        key, summary = self._summary
+        # The final checkpoint is written after the last log line, so it is part of the key
+        finished = self.finished
+        if key != (self.version, finished):
+            key = (self.version, finished)
+            summary = summarize_epochs(self.epochs(), self.num_epochs, finished)
+            self._summary = (key, summary)
+        return summary
@@ -0,0 +1,293 @@
+"""
+Zarr and OME-Zarr chunk stores as an alternative to multi-page TIFF.
+
+A Zarr store keeps a stack as a grid of separately compressed chunks of
+(frames, rows, columns), so reading a frame range or a region only decodes the
+chunks it overlaps. ZarrStackReader and ZarrStackWriter have the frame
+interface of TiffStackReader and TiffStackWriter in nnunet_tools, which picks
+them for paths ending in `.zarr` (see nnunet_tools.open_stack). Stores whose
+name ends in `.ome.zarr` are written as OME-Zarr (NGFF 0.4) images with a
+single resolution level, which napari, Fiji (MoBIE) and neuroglancer read.
+
+Stores are written in the Zarr v2 format, so zarr-python 2 and 3 can both read
+them. The zarr package is optional; without it only TIFF files can be used.
+"""
+import os
+import threading
+
+import numpy as np
+
+import tracing
+
+try:
+    import zarr
+    import numcodecs
+except ImportError:
+    zarr = None
+    numcodecs = None
+
+ZARR_SUFFIX = ".zarr"
+OME_ZARR_SUFFIX = ".ome.zarr"
+ZARR_COMPRESSIONS = ("zstd", "lz4", "zlib", "none")
+
+# (frames, rows, columns); 8 frames keep the writer's buffer small for very wide frames
+DEFAULT_CHUNKS = (8, 256, 256)
+
+
+def is_zarr_path(path):
+    """True if `path` names a Zarr store, by its `.zarr` suffix."""
+    return os.path.normpath(path).lower().endswith(ZARR_SUFFIX)
+
+
+def is_ome_zarr_path(path):
+    return os.path.normpath(path).lower().endswith(OME_ZARR_SUFFIX)
+
+
+def require_zarr():
+    """
+    Raises:
+        ImportError: If the zarr package is not installed.
+    """
+    if zarr is None:
+        raise ImportError("Reading and writing Zarr stores needs the zarr package (pip install zarr).")
+
+
+def _format_kwargs():
+    # zarr-python 3 writes Zarr v3 by default; v2 keeps the stores readable by OME-Zarr 0.4 tools and zarr 2
+    return {"zarr_format": 2} if int(zarr.__version__.split(".")[0]) >= 3 else {}
+
+
+class ZarrOutputOptions:
+    """
+    How Zarr outputs are chunked and compressed.
+
+    Args:
+        chunks (int or tuple, optional): Chunk size as (frames, rows, columns),
+            or one number for rows and columns with DEFAULT_CHUNKS frames.
+        compression (str, optional): "zstd" (default), "lz4", "zlib" or "none".
+        level (int, optional): Compression level for zstd and zlib.
+
+    Raises:
+        ValueError: If an option is invalid.
+    """
+
+    def __init__(self, chunks=None, compression=None, level=None):
+        if chunks is None:
+            chunks = DEFAULT_CHUNKS
+        elif np.ndim(chunks) == 0:
+            chunks = (DEFAULT_CHUNKS[0], int(chunks), int(chunks))
+        chunks = tuple(int(size) for size in chunks)
+        if len(chunks) != 3 or min(chunks) <= 0:
+            raise ValueError("Zarr chunks must be three positive sizes: frames, rows and columns.")
+        compression = (compression or "zstd").lower()
+        if compression not in ZARR_COMPRESSIONS:
+            raise ValueError(f"Unknown Zarr compression {compression!r}; expected one of {', '.join(ZARR_COMPRESSIONS)}.")
+        if compression in ("none", "lz4") and level is not None:
+            raise ValueError(f"A compression level cannot be used with {compression}.")
+        self.chunks = chunks
+        self.compression = compression
+        self.level = None if level is None else int(level)
+
+    @classmethod
+    def from_dict(cls, options):
+        """Build options from a dict such as the `zarr` entry of a job's output options; None gives the defaults."""
+        if isinstance(options, cls):
+            return options
+        return cls(**(options or {}))
+
+    def compressor(self):
+        """Return the numcodecs codec of the chunks, or None."""
+        require_zarr()
+        if self.compression == "zstd":
+            return numcodecs.Zstd(level=3 if self.level is None else self.level)
+        if self.compression == "zlib":
+            return numcodecs.Zlib(level=1 if self.level is None else self.level)
+        if self.compression == "lz4":
+            return numcodecs.LZ4()
+        return None
+
+    def open(self, path, shape, dtype, ome=None):
+        """
+        Creates a Zarr store for a stack and opens it for writing.
+
+        Args:
+            path (str): Output store; an existing one is replaced.
+            shape (tuple): (frames, rows, columns, ...) of the stack.
+            dtype (numpy.dtype): Data type of the stack.
+            ome (bool, optional): Write an OME-Zarr image. Defaults to
+                whether `path` ends in `.ome.zarr`.
+
+        Returns:
+            ZarrStackWriter: Writer to append frames or write blocks to.
+        """
+        return ZarrStackWriter(path, shape, dtype, self, ome)
+
+    def __repr__(self):
+        return f"ZarrOutputOptions(chunks={self.chunks!r}, compression={self.compression!r}, level={self.level!r})"
+
+
+def _ome_multiscales(ndim, name):
+    axes = [{"name": "z", "type": "space"}, {"name": "y", "type": "space"}, {"name": "x", "type": "space"}]
+    if ndim > 3:
+        axes.append({"name": "c", "type": "channel"})
+    return [{
+        "version": "0.4",
+        "name": name,
+        "axes": axes,
+        "datasets": [{"path": "0", "coordinateTransformations": [{"type": "scale", "scale": [1.0] * ndim}]}],
+    }]
+
+
+def _open_image_array(path):
+    """Open the full-resolution array of a plain Zarr array or an OME-Zarr image."""
+    node = zarr.open(path, mode="r")
+    if hasattr(node, "shape"):
+        return node
+    attrs = dict(node.attrs)
+    multiscales = attrs.get("multiscales") or attrs.get("ome", {}).get("multiscales")
+    if multiscales:
+        return node[multiscales[0]["datasets"][0]["path"]]
+    if "0" in node:
+        return node["0"]
+    raise ValueError(f"{path} is a Zarr group without an image.")
+
+
+class ZarrStackReader:
+    """
+    Reads a stack from a Zarr array or OME-Zarr image.
+
+    Frames are read a chunk of frames at a time, so going through the stack
+    decodes every chunk once; read_block reads any frame range and region,
+    touching only the chunks it overlaps. Leading axes of size 1 (the time
+    and channel axes of OME-Zarr images) are dropped.
+
+    Args:
+        path (str): Path to the store.
+
+    Raises:
+        ImportError: If zarr is not installed.
+        ValueError: If the store does not hold a stack.
+    """
+
+    def __init__(self, path):
+        require_zarr()
+        self.path = path
+        self._array = _open_image_array(path)
+        shape = tuple(self._array.shape)
+        self._lead = 0
+        while len(shape) - self._lead > 3 and shape[self._lead] == 1:
+            self._lead += 1
+        if len(shape) - self._lead < 3:
+            raise ValueError(f"{path} has shape {shape}, not a stack of frames.")
+        self.num_frames = shape[self._lead]
+        self.frame_shape = shape[self._lead + 1:]
+        self.dtype = np.dtype(self._array.dtype)
+        self.chunk_frames = int(self._array.chunks[self._lead])
+        self._block = None
+        self._lock = threading.Lock()
+
+    def read_block(self, start, stop, rows=slice(None), cols=slice(None)):
+        """Return frames `start` to `stop` (exclusive), cropped to the `rows` and `cols` slices."""
+        with tracing.phase("decode"):
+            block = np.asarray(self._array[(0,) * self._lead + (slice(start, stop), rows, cols)])
+        tracing.count(bytes_read=block.nbytes)
+        return block
+
+    def read_into(self, start, out):
+        """Read frames `start` to `start + len(out)` into the array `out`."""
+        out[...] = self.read_block(start, start + len(out))
+        return out
+
+    def read_frame(self, index):
+        """Return frame `index`; the chunk of frames around it is kept for the next call."""
+        block = self._block
+        if block is None or not block[0] <= index < block[0] + len(block[1]):
+            first = index - index % self.chunk_frames
+            block = (first, self.read_block(first, min(first + self.chunk_frames, self.num_frames)))
+            with self._lock:
+                self._block = block
+        return block[1][index - block[0]]
+
+    def iter_frames(self, start=0, stop=None):
+        """Yield frames `start` to `stop` (exclusive), decoding each chunk once."""
+        stop = self.num_frames if stop is None else min(stop, self.num_frames)
+        index = start
+        while index < stop:
+            block_stop = min(stop, (index // self.chunk_frames + 1) * self.chunk_frames)
+            yield from self.read_block(index, block_stop)
+            index = block_stop
+
+    def close(self):
+        self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ZarrStackWriter:
+    """
+    Writes a stack of known shape into a new Zarr store.
+
+    Frames appended with write() are buffered until a chunk of frames is
+    complete, so every chunk is compressed and written once. write_block()
+    writes any frame range and region directly; blocks that cover whole
+    chunks can be written from several threads at once.
+
+    Args:
+        path (str): Output store; an existing one is replaced.
+        shape (tuple): (frames, rows, columns, ...) of the stack.
+        dtype (numpy.dtype): Data type of the stack.
+        options (ZarrOutputOptions): Chunking and compression.
+        ome (bool, optional): Write an OME-Zarr image. Defaults to whether
+            `path` ends in `.ome.zarr`.
+    """
+
+    def __init__(self, path, shape, dtype, options, ome=None):
+        require_zarr()
+        self.path = path
+        shape = tuple(int(size) for size in shape)
+        chunks = tuple(min(chunk, size) for chunk, size in zip(options.chunks, shape)) + shape[3:]
+        array_kwargs = dict(mode="w", shape=shape, chunks=chunks, dtype=np.dtype(dtype), fill_value=0,
+                            compressor=options.compressor(), **_format_kwargs())
+        if ome is None:
+            ome = is_ome_zarr_path(path)
+        if ome:
+            group = zarr.open_group(path, mode="w", **_format_kwargs())
+            name = os.path.basename(os.path.normpath(path))
+            group.attrs["multiscales"] = _ome_multiscales(len(shape), name[:-len(OME_ZARR_SUFFIX)] or name)
+            self._array = zarr.open_array(os.path.join(path, "0"), **array_kwargs)
+        else:
+            self._array = zarr.open_array(path, **array_kwargs)
+        self.num_frames = shape[0]
+        self.chunk_frames = chunks[0]
+        self._buffer = []
+        self._next_frame = 0
+
+    def write(self, frame):
+        """Append one frame."""
+        self._buffer.append(frame)
+        if (self._next_frame + len(self._buffer)) % self.chunk_frames == 0:
+            self._flush()
+
+    def write_block(self, start, data, y=0, x=0):
+        """Write frames `start` to `start + len(data)` of the region at (y, x)."""
+        with tracing.phase("encode", bytes_written=data.nbytes):
+            self._array[start:start + len(data), y:y + data.shape[1], x:x + data.shape[2]] = data
+
+    def _flush(self):
+        if self._buffer:
+            self.write_block(self._next_frame, np.stack(self._buffer))
+            self._next_frame += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()